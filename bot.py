@@ -1,14 +1,70 @@
-import os
+import time
+from urllib.parse import urlparse
 
 from aiogram import Bot, Dispatcher
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from dotenv import load_dotenv
+from aiogram.dispatcher.storage import BaseStorage
 
-load_dotenv()
+from fsm_storage import MeteredStorage, SQLiteStorage
+from metrics import TELEGRAM_ERRORS, TELEGRAM_LATENCY
+from middlewares import (MetricsMiddleware, RequestLoggingMiddleware,
+                         ThrottlingMiddleware)
+from outbox import Outbox
+from settings import settings
 
-API_TOKEN = os.getenv('API_TOKEN')
-ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
 
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+def create_storage() -> BaseStorage:
+    """Функция создания хранилища состояний FSM по настройкам.
+
+    Хранилища sqlite и redis общие для нескольких процессов бота
+    и удаляют брошенные состояния через FSM_STATE_TTL секунд.
+    """
+    if settings.fsm_storage == 'sqlite':
+        return SQLiteStorage(settings.fsm_sqlite_path,
+                             state_ttl=settings.fsm_state_ttl)
+    if settings.fsm_storage == 'redis':
+        # Требует установленного пакета redis.
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+
+        redis_url = urlparse(settings.fsm_redis_url)
+        return RedisStorage2(host=redis_url.hostname or 'localhost',
+                             port=redis_url.port or 6379,
+                             db=int(redis_url.path.strip('/') or 0),
+                             password=redis_url.password,
+                             state_ttl=settings.fsm_state_ttl,
+                             data_ttl=settings.fsm_state_ttl)
+    return MemoryStorage()
+
+
+class MeteredBot(Bot):
+    """Бот, измеряющий длительность запросов к Bot API по методам."""
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, method)
+
+
+bot = MeteredBot(token=settings.api_token,
+                 server=(TelegramAPIServer.from_base(settings.telegram_api_url)
+                         if settings.telegram_api_url
+                         else TELEGRAM_PRODUCTION))
+storage = MeteredStorage(create_storage())
 dp = Dispatcher(bot, storage=storage)
+outbox = Outbox(bot, global_rate=settings.outbox_global_rate,
+                chat_rate=settings.outbox_chat_rate,
+                concurrency=settings.outbox_concurrency)
+if settings.throttle_rate > 0 or settings.throttle_duplicate_window > 0:
+    # Первым, чтобы отброшенные обновления не проходили остальные.
+    dp.middleware.setup(ThrottlingMiddleware(
+        rate=settings.throttle_rate, burst=settings.throttle_burst,
+        duplicate_window=settings.throttle_duplicate_window
+    ))
+dp.middleware.setup(RequestLoggingMiddleware())
+dp.middleware.setup(MetricsMiddleware())
@@ -0,0 +1,264 @@
+"""FSM storage"""
+import asyncio
+import json
+import sqlite3
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from metrics import FSM_STORAGE_LATENCY
+
+ChatOrUser = typing.Union[str, int, None]
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в файле SQLite.
+
+    Файл базы открывается в режиме WAL, поэтому одно хранилище могут
+    использовать несколько процессов бота. Состояние и данные пользователя
+    истекают через state_ttl секунд без обращений, чтобы брошенные
+    диалоги не накапливались. Бакеты хранятся отдельно и не истекают.
+    """
+
+    def __init__(self, path: str, state_ttl: typing.Optional[float] = None,
+                 purge_interval: float = 60.0) -> None:
+        self.path = path
+        self.state_ttl = state_ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        # Один поток гарантирует последовательный доступ к соединению.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS fsm_state ('
+            'chat TEXT NOT NULL, user TEXT NOT NULL, state TEXT, '
+            'data TEXT NOT NULL, expires_at REAL, '
+            'PRIMARY KEY (chat, user)) WITHOUT ROWID'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS fsm_bucket ('
+            'chat TEXT NOT NULL, user TEXT NOT NULL, bucket TEXT NOT NULL, '
+            'PRIMARY KEY (chat, user)) WITHOUT ROWID'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS fsm_state_expires_at '
+            'ON fsm_state (expires_at)'
+        )
+
+    async def _run(self, function, *args) -> typing.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _resolve(self, chat: ChatOrUser,
+                 user: ChatOrUser) -> typing.Tuple[str, str]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    def _expires_at(self) -> typing.Optional[float]:
+        if self.state_ttl is None:
+            return None
+        return time.time() + self.state_ttl
+
+    def _select_state(self, chat: str,
+                      user: str) -> typing.Tuple[typing.Optional[str], dict]:
+        row = self._connection.execute(
+            'SELECT state, data FROM fsm_state WHERE chat = ? AND user = ? '
+            'AND (expires_at IS NULL OR expires_at > ?)',
+            (chat, user, time.time())
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _write_state(self, chat: str, user: str,
+                     state: typing.Optional[str], data: dict) -> None:
+        if state is None and not data:
+            self._connection.execute(
+                'DELETE FROM fsm_state WHERE chat = ? AND user = ?',
+                (chat, user)
+            )
+        else:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO fsm_state '
+                '(chat, user, state, data, expires_at) VALUES (?, ?, ?, ?, ?)',
+                (chat, user, state, json.dumps(data, ensure_ascii=False),
+                 self._expires_at())
+            )
+        self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        if self.state_ttl is None or now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        self._connection.execute(
+            'DELETE FROM fsm_state WHERE expires_at <= ?', (now,)
+        )
+
+    def _modify_state(self, chat: str, user: str,
+                      modify: typing.Callable[
+                          [typing.Optional[str], dict],
+                          typing.Tuple[typing.Optional[str], dict]]) -> None:
+        """Метод атомарного чтения и изменения записи в одной транзакции."""
+        with self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            state, data = modify(*self._select_state(chat, user))
+            self._write_state(chat, user, state, data)
+
+    async def close(self) -> None:
+        await self._run(self._connection.close)
+
+    async def wait_closed(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def get_state(self, *, chat: ChatOrUser = None,
+                        user: ChatOrUser = None,
+                        default: typing.Optional[str] = None
+                        ) -> typing.Optional[str]:
+        chat, user = self._resolve(chat, user)
+        state, _ = await self._run(self._select_state, chat, user)
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat: ChatOrUser = None,
+                       user: ChatOrUser = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        chat, user = self._resolve(chat, user)
+        _, data = await self._run(self._select_state, chat, user)
+        return data or dict(default or {})
+
+    async def set_state(self, *, chat: ChatOrUser = None,
+                        user: ChatOrUser = None,
+                        state: typing.Optional[typing.AnyStr] = None) -> None:
+        chat, user = self._resolve(chat, user)
+        state = self.resolve_state(state)
+        await self._run(self._modify_state, chat, user,
+                        lambda _, data: (state, data))
+
+    async def set_data(self, *, chat: ChatOrUser = None,
+                       user: ChatOrUser = None,
+                       data: typing.Dict = None) -> None:
+        chat, user = self._resolve(chat, user)
+        data = dict(data or {})
+        await self._run(self._modify_state, chat, user,
+                        lambda state, _: (state, data))
+
+    async def update_data(self, *, chat: ChatOrUser = None,
+                          user: ChatOrUser = None,
+                          data: typing.Dict = None, **kwargs) -> None:
+        chat, user = self._resolve(chat, user)
+        new_data = dict(data or {}, **kwargs)
+        await self._run(self._modify_state, chat, user,
+                        lambda state, old_data: (state,
+                                                 {**old_data, **new_data}))
+
+    async def reset_state(self, *, chat: ChatOrUser = None,
+                          user: ChatOrUser = None,
+                          with_data: typing.Optional[bool] = True) -> None:
+        chat, user = self._resolve(chat, user)
+        await self._run(self._modify_state, chat, user,
+                        lambda _, data: (None, {} if with_data else data))
+
+    def has_bucket(self) -> bool:
+        return True
+
+    def _select_bucket(self, chat: str, user: str) -> dict:
+        row = self._connection.execute(
+            'SELECT bucket FROM fsm_bucket WHERE chat = ? AND user = ?',
+            (chat, user)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _write_bucket(self, chat: str, user: str, bucket: dict,
+                      merge: bool) -> None:
+        with self._connection:
+            self._connection.execute('BEGIN IMMEDIATE')
+            if merge:
+                bucket = {**self._select_bucket(chat, user), **bucket}
+            self._connection.execute(
+                'INSERT OR REPLACE INTO fsm_bucket (chat, user, bucket) '
+                'VALUES (?, ?, ?)',
+                (chat, user, json.dumps(bucket, ensure_ascii=False))
+            )
+
+    async def get_bucket(self, *, chat: ChatOrUser = None,
+                         user: ChatOrUser = None,
+                         default: typing.Optional[dict] = None
+                         ) -> typing.Dict:
+        chat, user = self._resolve(chat, user)
+        bucket = await self._run(self._select_bucket, chat, user)
+        return bucket or dict(default or {})
+
+    async def set_bucket(self, *, chat: ChatOrUser = None,
+                         user: ChatOrUser = None,
+                         bucket: typing.Dict = None) -> None:
+        chat, user = self._resolve(chat, user)
+        await self._run(self._write_bucket, chat, user,
+                        dict(bucket or {}), False)
+
+    async def update_bucket(self, *, chat: ChatOrUser = None,
+                            user: ChatOrUser = None,
+                            bucket: typing.Dict = None, **kwargs) -> None:
+        chat, user = self._resolve(chat, user)
+        await self._run(self._write_bucket, chat, user,
+                        dict(bucket or {}, **kwargs), True)
+
+
+class MeteredStorage(BaseStorage):
+    """Обёртка над хранилищем состояний, измеряющая длительность операций.
+
+    Методы reset_data, finish и reset_bucket базового класса выражены
+    через перечисленные ниже, поэтому тоже попадают в метрики.
+    """
+
+    def __init__(self, storage: BaseStorage) -> None:
+        self.storage = storage
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+    async def wait_closed(self) -> None:
+        await self.storage.wait_closed()
+
+    def has_bucket(self) -> bool:
+        return self.storage.has_bucket()
+
+    async def get_state(self, **kwargs) -> typing.Optional[str]:
+        with FSM_STORAGE_LATENCY.time('get_state'):
+            return await self.storage.get_state(**kwargs)
+
+    async def get_data(self, **kwargs) -> typing.Dict:
+        with FSM_STORAGE_LATENCY.time('get_data'):
+            return await self.storage.get_data(**kwargs)
+
+    async def set_state(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('set_state'):
+            await self.storage.set_state(**kwargs)
+
+    async def set_data(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('set_data'):
+            await self.storage.set_data(**kwargs)
+
+    async def update_data(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('update_data'):
+            await self.storage.update_data(**kwargs)
+
+    async def reset_state(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('reset_state'):
+            await self.storage.reset_state(**kwargs)
+
+    async def get_bucket(self, **kwargs) -> typing.Dict:
+        with FSM_STORAGE_LATENCY.time('get_bucket'):
+            return await self.storage.get_bucket(**kwargs)
+
+    async def set_bucket(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('set_bucket'):
+            await self.storage.set_bucket(**kwargs)
+
+    async def update_bucket(self, **kwargs) -> None:
+        with FSM_STORAGE_LATENCY.time('update_bucket'):
+            await self.storage.update_bucket(**kwargs)
@@ -1,16 +1,43 @@
+import asyncio
+import hashlib
+import re
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.types import (InlineKeyboardMarkup, CallbackQuery,
-                           InlineKeyboardButton, Message, ContentType)
+from aiogram.types import (CallbackQuery, InlineQuery,
+                           InlineQueryResultArticle, InputTextMessageContent,
+                           Location, Message, ContentType)
 from aiogram.utils.exceptions import BotBlocked
 
-from bot import bot, dp
+from bot import dp, outbox
+from keyboards import (BACK_TO_MENU_KEYBOARD, CALLBACK_CANCEL, CALLBACK_MENU,
+                       CALLBACK_WEATHER_FROM_LOCATION,
+                       CALLBACK_WEATHER_IN_CITY, CANCEL_KEYBOARD,
+                       MENU_BUTTON_KEYBOARD, MENU_KEYBOARD, callback_router)
 from logger import logger
-from weather.weather_hints import get_hint
-from weather.weather_messages import get_message
-from weather.weather_service import (get_weather_for_city,
+from settings import settings
+from subscriptions import Subscription, subscription_scheduler
+from weather.city_index import normalize_city_name
+from weather.exceptions import (GetWeatherFromJSONError, WeatherAPIError,
+                                WeatherCustomError)
+from weather.forecast import get_condition, summarize_forecast
+from weather.weather_hints import get_forecast_hint
+from weather.weather_messages import render_message, render_weather_reply
+from weather.weather_history import summarize_history
+from weather.weather_service import (WeatherInformation,
+                                     get_city_display_name,
+                                     get_city_suggestion,
+                                     get_city_suggestions,
+                                     get_forecast_for_city,
+                                     get_history_for_city,
+                                     get_weather_for_cities,
+                                     get_weather_for_city,
                                      get_weather_for_location,
-                                     WEATHER_FOR_LOC_FAILED_MESSAGE)
+                                     WEATHER_FOR_LOC_FAILED_MESSAGE,
+                                     WEATHER_UNAVAILABLE_MESSAGE)
 
 GREETINGS_TEXT = ('Привет! Я ваш личный метеорологический помощник.\nМогу '
                   'предоставить вам текущий прогноз погоды как по городу, '
@@ -30,6 +57,45 @@ START_GET_WEATHER_TEXT = (f'Введите название города '
 START_GET_WEATHER_IN_LOC_TEXT = (f'Отправьте вашу геолокацию для '
                                  f'получения текущей погоды:')
 CANCEL_TEXT = 'Вы вернулись в меню!\n\n' + MENU_TEXT
+SAVE_CITY_USAGE_TEXT = ('Чтобы сохранить город, отправьте команду вместе '
+                        'с его названием, например:\n/save Москва')
+CITY_SAVED_TEXT = ('Город {} сохранён! 🏙️\nПогоду во всех сохранённых '
+                   'городах можно узнать командой /mycities')
+SAVED_CITIES_LIMIT_TEXT = 'Можно сохранить не больше {} городов.'
+NO_SAVED_CITIES_TEXT = ('У вас пока нет сохранённых городов.\n'
+                        'Добавьте город командой /save Москва')
+SAVED_CITIES_LIMIT = 10
+FORECAST_USAGE_TEXT = ('Чтобы узнать прогноз на 5 дней, отправьте команду '
+                       'вместе с названием города, например:\n'
+                       '/forecast Москва')
+TREND_USAGE_TEXT = ('Чтобы узнать, как менялась погода, отправьте команду '
+                    'вместе с названием города, например:\n/trend Москва')
+NO_HISTORY_TEXT = 'По городу {} ещё не накоплено наблюдений.'
+HISTORY_DISABLED_TEXT = 'История погоды не ведётся, команда /trend недоступна.'
+# Сколько последних дней истории показывать по отдельности.
+TREND_DAYS_SHOWN = 7
+WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
+SUBSCRIBE_USAGE_TEXT = ('Чтобы каждый день получать погоду, отправьте '
+                        'команду со временем и городом, например:\n'
+                        '/subscribe 08:00 Москва\n\nБез города подписка '
+                        'оформится на последнюю отправленную геолокацию.\n\n'
+                        'Время считается по часовому поясу {}, другой '
+                        'можно указать в конце:\n'
+                        '/subscribe 08:00 Новосибирск Asia/Novosibirsk')
+UNKNOWN_TIMEZONE_TEXT = ('Не знаю часового пояса {}. Укажите его в виде '
+                         'Регион/Город, например Asia/Yekaterinburg.')
+SUBSCRIBED_TEXT = ('Готово! Погода ({}) будет приходить каждый день '
+                   'в {} ({}). ⏰\nОтменить подписку: /unsubscribe')
+SUBSCRIPTIONS_LIMIT_TEXT = 'Можно оформить не больше {} подписок.'
+UNSUBSCRIBED_TEXT = 'Отменено подписок: {}.'
+NO_SUBSCRIPTIONS_TEXT = 'У вас нет подписок на погоду.'
+SUBSCRIPTION_TIME_PATTERN = re.compile(r'^([01]?\d|2[0-3])[:.]([0-5]\d)$')
+# Inline-режим: сколько городов предлагать, сколько ждать API (секунды)
+# и сколько Telegram может кэшировать полный и неполный ответ.
+INLINE_RESULTS_LIMIT = 5
+INLINE_FETCH_TIMEOUT = 0.08
+INLINE_CACHE_TIME = 300
+INLINE_PARTIAL_CACHE_TIME = 5
 UNKNOWN_COMMAND_TEXT = (f'Я не знаю такой команды.\nНажав на кнопку ниже вы '
                         f'сможете воспользоваться всем моим функционалом. ⬇️')
 
@@ -50,16 +116,12 @@ async def start(message: Message) -> None:
     Параметры:
         message (Message): Объект сообщения.
     """
-    keyboard = InlineKeyboardMarkup()
-    button_menu = InlineKeyboardButton('Меню', callback_data='menu')
-    keyboard.row(button_menu)
-
-    await bot.send_message(chat_id=message.chat.id, text=GREETINGS_TEXT,
-                           reply_markup=keyboard)
+    await outbox.send_message(chat_id=message.chat.id, text=GREETINGS_TEXT,
+                              reply_markup=MENU_BUTTON_KEYBOARD)
 
 
 # Обработчик для кнопки "Меню"
-@dp.callback_query_handler(lambda c: c.data == 'menu')
+@callback_router.route(CALLBACK_MENU)
 @dp.message_handler(commands=['menu'])
 async def start_menu(message: Message or CallbackQuery) -> None:
     """
@@ -68,27 +130,17 @@ async def start_menu(message: Message or CallbackQuery) -> None:
     Параметры:
         message (Message or CallbackQuery): Объект сообщения или коллбэка.
     """
-    keyboard = InlineKeyboardMarkup()
-    btn_city_weather = InlineKeyboardButton('Погода по городу',
-                                            callback_data='weather_in_city')
-    btn_loc_weather = InlineKeyboardButton(
-        'Погода по геолокации',
-        callback_data='weather_from_location'
-    )
-    keyboard.row(btn_city_weather)
-    keyboard.row(btn_loc_weather)
-
     if type(message) == CallbackQuery:
-        await bot.edit_message_reply_markup(message.message.chat.id,
-                                            message.message.message_id,
-                                            reply_markup=None)
+        outbox.edit_message_reply_markup(message.message.chat.id,
+                                         message.message.message_id,
+                                         reply_markup=None)
 
-    await bot.send_message(message.from_user.id,
-                           text=MENU_TEXT,
-                           reply_markup=keyboard)
+    await outbox.send_message(message.from_user.id,
+                              text=MENU_TEXT,
+                              reply_markup=MENU_KEYBOARD)
 
 
-@dp.callback_query_handler(lambda c: c.data == 'weather_in_city')
+@callback_router.route(CALLBACK_WEATHER_IN_CITY)
 async def start_get_weather_in_city_callback(
         callback_query: CallbackQuery) -> None:
     """
@@ -98,14 +150,12 @@ async def start_get_weather_in_city_callback(
     Параметры:
         callback_query (CallbackQuery): Объект коллбэка.
     """
-    keyboard = InlineKeyboardMarkup()
-    button_cancel = InlineKeyboardButton('Отмена', callback_data='cancel')
-    keyboard.row(button_cancel)
-
     await callback_query.answer()
-    sent_message = await callback_query.message.edit_text(
+    sent_message = await outbox.edit_message_text(
         START_GET_WEATHER_TEXT,
-        reply_markup=keyboard)
+        chat_id=callback_query.message.chat.id,
+        message_id=callback_query.message.message_id,
+        reply_markup=CANCEL_KEYBOARD)
 
     # Сохраняем message_id чтобы потом удалить предыдущее сообщение бота.
     state = dp.current_state(chat=callback_query.from_user.id)
@@ -114,7 +164,7 @@ async def start_get_weather_in_city_callback(
     await WaitingForCityInput.city.set()
 
 
-@dp.callback_query_handler(lambda c: c.data == 'weather_from_location')
+@callback_router.route(CALLBACK_WEATHER_FROM_LOCATION)
 async def start_get_weather_from_location_callback(
         callback_query: CallbackQuery) -> None:
     """
@@ -124,14 +174,12 @@ async def start_get_weather_from_location_callback(
     Параметры:
         callback_query (CallbackQuery): Объект коллбэка.
     """
-    keyboard = InlineKeyboardMarkup()
-    button_cancel = InlineKeyboardButton('Отмена', callback_data='cancel')
-    keyboard.row(button_cancel)
-
     await callback_query.answer()
-    sent_message = await callback_query.message.edit_text(
+    sent_message = await outbox.edit_message_text(
         START_GET_WEATHER_IN_LOC_TEXT,
-        reply_markup=keyboard)
+        chat_id=callback_query.message.chat.id,
+        message_id=callback_query.message.message_id,
+        reply_markup=CANCEL_KEYBOARD)
 
     # Сохраняем message_id чтобы потом удалить предыдущее сообщение бота.
     state = dp.current_state(chat=callback_query.from_user.id)
@@ -140,7 +188,7 @@ async def start_get_weather_from_location_callback(
     await WaitingForLocationInput.location.set()
 
 
-@dp.callback_query_handler(lambda c: c.data == 'cancel', state='*')
+@callback_router.route(CALLBACK_CANCEL, any_state=True)
 async def cancel_handler(callback_query: CallbackQuery,
                          state: FSMContext) -> None:
     """
@@ -155,22 +203,29 @@ async def cancel_handler(callback_query: CallbackQuery,
     if current_state is None:
         return
 
-    keyboard = InlineKeyboardMarkup()
-    button_city_weather = InlineKeyboardButton(
-        'Погода по городу',
-        callback_data='weather_in_city'
-    )
-    button_loc_weather = InlineKeyboardButton(
-        'Погода по геолокации',
-        callback_data='weather_from_location'
-    )
-    keyboard.row(button_city_weather)
-    keyboard.row(button_loc_weather)
-
     await state.finish()
 
     await callback_query.answer('Действие отменено')
-    await callback_query.message.edit_text(CANCEL_TEXT, reply_markup=keyboard)
+    await outbox.edit_message_text(
+        CANCEL_TEXT,
+        chat_id=callback_query.message.chat.id,
+        message_id=callback_query.message.message_id,
+        reply_markup=MENU_KEYBOARD)
+
+
+# Все нажатия на кнопки проходят через таблицу callback_router.
+dp.register_callback_query_handler(callback_router, callback_router.filter,
+                                   state='*')
+
+
+def get_city_not_found_text(city: str) -> str:
+    """Функция ответа на город, которого не нашёл API погоды, с подсказкой
+    похожего города из справочника, если он есть.
+    """
+    suggestion = get_city_suggestion(city)
+    if suggestion is None:
+        return WEATHER_FOR_LOC_FAILED_MESSAGE
+    return render_message('city_not_found_suggestion', city, suggestion)
 
 
 @dp.message_handler(state=WaitingForCityInput.city)
@@ -185,14 +240,10 @@ async def get_weather_in_city(message: Message,
 
         state (FSMContext): Объект для управления состоянием бота.
     """
-    keyboard = InlineKeyboardMarkup()
-    btn_menu = InlineKeyboardButton('Назад в меню', callback_data='menu')
-    keyboard.row(btn_menu)
-
     user_input = message.text
     async with state.proxy() as data:
         # Записываем ответ пользователя в переменную city.
-        data['city'] = user_input.capitalize()
+        data['city'] = get_city_display_name(user_input)
 
     state_data = await state.get_data()
     last_message_id = state_data.get('last_message_id')
@@ -200,26 +251,36 @@ async def get_weather_in_city(message: Message,
     try:
         weather = await get_weather_for_city(data['city'])
 
-        response = (
-            await get_message('weather_in_city_message')
-        ).format(
-            data['city'], weather.status, weather.temperature
-        ) + '\n\n' + (
-            await get_hint(weather)
-        )
+        response = render_weather_reply('weather_in_city_message',
+                                        data['city'], weather)
 
-        await bot.send_message(message.chat.id, response,
-                               reply_markup=keyboard)
+        await outbox.send_message(message.chat.id, response,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
 
     except AttributeError:
-        await bot.send_message(message.chat.id,
-                               WEATHER_FOR_LOC_FAILED_MESSAGE,
-                               reply_markup=keyboard)
+        await outbox.send_message(message.chat.id,
+                                  get_city_not_found_text(data['city']),
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
 
-    # Удаляем предыдущее сообщение бота, созданное через Callback_Query.
-    await bot.delete_message(message.chat.id, last_message_id)
+    except WeatherAPIError:
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
 
-    await state.finish()  # Сброс состояния после обработки ввода.
+    except (Exception, GetWeatherFromJSONError,
+            WeatherCustomError) as error:
+        logger.error('Не удалось получить погоду в городе %s: %s',
+                     data['city'], error)
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
+
+    finally:
+        # Удаляем предыдущее сообщение бота, созданное через
+        # Callback_Query.
+        outbox.delete_message(message.chat.id, last_message_id)
+
+        await state.finish()  # Сброс состояния после обработки ввода.
 
 
 @dp.message_handler(content_types=ContentType.LOCATION,
@@ -234,45 +295,439 @@ async def get_weather_in_location(message: Message, state: FSMContext) -> None:
 
         state (FSMContext): Объект для управления состоянием бота.
     """
-    keyboard = InlineKeyboardMarkup()
-    button_menu = InlineKeyboardButton('Назад в меню',
-                                       callback_data='menu')
-    keyboard.row(button_menu)
-
     user_input = message.location
     async with state.proxy() as data:
-        # Записываем ответ пользователя в переменную city.
-        data['location'] = user_input
+        # Хранилища состояний сохраняют данные в JSON, поэтому вместо
+        # объекта Location записываются его координаты.
+        data['location'] = [user_input.latitude, user_input.longitude]
+
+    # Последняя геолокация нужна для подписки на погоду без города.
+    await dp.storage.update_bucket(
+        chat=message.chat.id, user=message.from_user.id,
+        last_location=[user_input.latitude, user_input.longitude]
+    )
 
     state_data = await state.get_data()
     last_message_id = state_data.get('last_message_id')
     try:
-        logger.debug(f'Получена геолокация от пользователя '
-                     f'{message.chat.id}. Запрашиваем погоду.')
-        weather = await get_weather_for_location(data['location'])
-        logger.debug(f'Погода пользователя {message.chat.id} '
-                     f'успешно получена. Формируем ответ.')
-
-        response = (
-            await get_message('weather_in_city_message')
-        ).format(
-            weather.name, weather.status, weather.temperature
-        ) + '\n\n' + (
-            await get_hint(weather)
+        logger.debug('Получена геолокация от пользователя %s. '
+                     'Запрашиваем погоду.', message.chat.id)
+        latitude, longitude = data['location']
+        weather = await get_weather_for_location(
+            Location(latitude=latitude, longitude=longitude)
         )
+        logger.debug('Погода пользователя %s успешно получена. '
+                     'Формируем ответ.', message.chat.id)
+
+        response = render_weather_reply('weather_in_city_message',
+                                        weather.name, weather)
 
-        await bot.send_message(message.chat.id, response,
-                               reply_markup=keyboard)
+        await outbox.send_message(message.chat.id, response,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
 
     except AttributeError:
-        await bot.send_message(message.chat.id,
-                               WEATHER_FOR_LOC_FAILED_MESSAGE,
-                               reply_markup=keyboard)
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_FOR_LOC_FAILED_MESSAGE,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
+
+    except WeatherAPIError:
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
+
+    except (Exception, GetWeatherFromJSONError,
+            WeatherCustomError) as error:
+        logger.error('Не удалось получить погоду по геолокации %s: %s',
+                     data['location'], error)
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=BACK_TO_MENU_KEYBOARD)
+
+    finally:
+        # Удаляем предыдущее сообщение бота, созданное через
+        # Callback_Query.
+        outbox.delete_message(message.chat.id, last_message_id)
+
+        await state.finish()  # Сброс состояния после обработки ввода.
+
+
+async def check_city(chat_id: int, city: str) -> bool:
+    """
+    Функция проверки, что город существует, запросом его погоды. Если
+    город не найден или API погоды недоступен, отвечает пользователю.
+
+    Параметры:
+        chat_id (int): Чат для ответа.
+
+        city (str): Название города.
+    """
+    try:
+        weather = await get_weather_for_city(city)
+    except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+            WeatherCustomError) as error:
+        logger.error('Не удалось проверить город %s: %s', city, error)
+        await outbox.send_message(chat_id, WEATHER_UNAVAILABLE_MESSAGE)
+        return False
+    if weather is None:
+        await outbox.send_message(chat_id, get_city_not_found_text(city))
+        return False
+    return True
+
+
+@dp.message_handler(commands=['save'])
+async def save_city(message: Message) -> None:
+    """
+    Обработчик команды /save. Проверяет город и сохраняет его в список
+    городов пользователя.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    city = message.get_args().strip()
+    if not city:
+        await outbox.send_message(message.chat.id, SAVE_CITY_USAGE_TEXT)
+        return
+
+    city = get_city_display_name(city)
+    bucket = await dp.storage.get_bucket(chat=message.chat.id,
+                                         user=message.from_user.id)
+    saved_cities = bucket.get('saved_cities', [])
+    if city in saved_cities:
+        await outbox.send_message(message.chat.id,
+                                  CITY_SAVED_TEXT.format(city))
+        return
+    if len(saved_cities) >= SAVED_CITIES_LIMIT:
+        await outbox.send_message(message.chat.id,
+                                  SAVED_CITIES_LIMIT_TEXT.format(
+                                      SAVED_CITIES_LIMIT))
+        return
+
+    if not await check_city(message.chat.id, city):
+        return
+
+    await dp.storage.update_bucket(chat=message.chat.id,
+                                   user=message.from_user.id,
+                                   saved_cities=saved_cities + [city])
+    await outbox.send_message(message.chat.id, CITY_SAVED_TEXT.format(city))
+
+
+@dp.message_handler(commands=['mycities'])
+async def my_cities(message: Message) -> None:
+    """
+    Обработчик команды /mycities. Отправляет погоду во всех сохранённых
+    городах пользователя одним сообщением.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    bucket = await dp.storage.get_bucket(chat=message.chat.id,
+                                         user=message.from_user.id)
+    saved_cities = bucket.get('saved_cities', [])
+    if not saved_cities:
+        await outbox.send_message(message.chat.id, NO_SAVED_CITIES_TEXT,
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+
+    weather_by_city = await get_weather_for_cities(saved_cities)
+    lines = []
+    for city, weather in weather_by_city.items():
+        if weather is None:
+            lines.append(render_message('saved_city_failed_line', city))
+        else:
+            lines.append(render_message('saved_city_line', city,
+                                        weather.status, weather.temperature))
+
+    await outbox.send_message(message.chat.id, '\n'.join(lines),
+                              reply_markup=MENU_BUTTON_KEYBOARD)
+
+
+@dp.message_handler(commands=['forecast'])
+async def forecast(message: Message) -> None:
+    """
+    Обработчик команды /forecast. Отправляет прогноз погоды в городе
+    на 5 дней со сводкой по каждому дню.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    city = message.get_args().strip()
+    if not city:
+        await outbox.send_message(message.chat.id, FORECAST_USAGE_TEXT)
+        return
+    city = get_city_display_name(city)
+
+    try:
+        city_forecast = await get_forecast_for_city(city)
+    except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+            WeatherCustomError) as error:
+        logger.error('Не удалось получить прогноз для %s: %s', city, error)
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+    if city_forecast is None:
+        await outbox.send_message(message.chat.id,
+                                  get_city_not_found_text(city),
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+
+    summary = summarize_forecast(city_forecast)
+    lines = [render_message('forecast_title', city)]
+    for day in summary.days:
+        lines.append(render_message(
+            'forecast_day_line',
+            f'{WEEKDAYS[day.day.weekday()]} {day.day:%d.%m}',
+            round(day.min_temperature), round(day.max_temperature),
+            get_condition(day.code), round(day.rain_probability * 100)
+        ))
+    lines.append('')
+    lines.append(get_forecast_hint(summary))
+
+    await outbox.send_message(message.chat.id, '\n'.join(lines),
+                              reply_markup=MENU_BUTTON_KEYBOARD)
+
+
+@dp.message_handler(commands=['trend'])
+async def trend(message: Message) -> None:
+    """
+    Обработчик команды /trend. Отправляет изменение погоды в городе
+    со вчерашнего дня и температуру по дням за период истории.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    if not settings.weather_history_path:
+        await outbox.send_message(message.chat.id, HISTORY_DISABLED_TEXT,
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+
+    city = message.get_args().strip()
+    if not city:
+        await outbox.send_message(message.chat.id, TREND_USAGE_TEXT)
+        return
+    city = get_city_display_name(city)
+
+    try:
+        observations = await get_history_for_city(city)
+    except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+            WeatherCustomError) as error:
+        logger.error('Не удалось получить историю для %s: %s', city, error)
+        await outbox.send_message(message.chat.id,
+                                  WEATHER_UNAVAILABLE_MESSAGE,
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+    if observations is None:
+        await outbox.send_message(message.chat.id,
+                                  get_city_not_found_text(city),
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+
+    summary = summarize_history(observations,
+                                ZoneInfo(settings.subscription_timezone))
+    if summary is None:
+        await outbox.send_message(message.chat.id,
+                                  NO_HISTORY_TEXT.format(city),
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
+        return
+
+    lines = [render_message('trend_title', city,
+                            settings.weather_history_days),
+             render_message('trend_current_line', summary.current.status,
+                            summary.current.temperature)]
+    if summary.yesterday is not None:
+        lines.append(render_message(
+            'trend_yesterday_line',
+            summary.current.temperature - summary.yesterday.temperature,
+            summary.yesterday.temperature
+        ))
+    else:
+        lines.append(render_message('trend_no_yesterday_line'))
+    lines.append('')
+    for day in summary.days[-TREND_DAYS_SHOWN:]:
+        lines.append(render_message(
+            'trend_day_line', f'{WEEKDAYS[day.day.weekday()]} {day.day:%d.%m}',
+            round(day.min_temperature), round(day.max_temperature),
+            round(day.mean_temperature)
+        ))
+    lines.append('')
+    lines.append(render_message(
+        'trend_summary_line', round(summary.min_temperature),
+        round(summary.max_temperature), round(summary.mean_temperature),
+        summary.trend_per_day
+    ))
+
+    await outbox.send_message(message.chat.id, '\n'.join(lines),
+                              reply_markup=MENU_BUTTON_KEYBOARD)
+
+
+def get_subscribe_usage_text() -> str:
+    """Функция подсказки к /subscribe с часовым поясом по умолчанию."""
+    return SUBSCRIBE_USAGE_TEXT.format(settings.subscription_timezone)
+
+
+def is_valid_timezone(name: str) -> bool:
+    """Функция проверки названия часового пояса по базе IANA."""
+    try:
+        ZoneInfo(name)
+    except (ValueError, ZoneInfoNotFoundError):
+        return False
+    return True
+
+
+@dp.message_handler(commands=['subscribe'])
+async def subscribe(message: Message) -> None:
+    """
+    Обработчик команды /subscribe. Оформляет ежедневную рассылку погоды
+    в городе или по последней геолокации в указанное время:
+    /subscribe 07:30 [город] [Регион/Город]. Без часового пояса время
+    считается по SUBSCRIPTION_TIMEZONE.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    time_text, _, city = message.get_args().strip().partition(' ')
+    time_match = SUBSCRIPTION_TIME_PATTERN.match(time_text)
+    if time_match is None:
+        await outbox.send_message(message.chat.id, get_subscribe_usage_text())
+        return
+    hour, minute = map(int, time_match.groups())
+
+    # Часовой пояс - необязательное последнее слово вида Регион/Город.
+    timezone = settings.subscription_timezone
+    rest, _, last_word = city.strip().rpartition(' ')
+    if '/' in last_word:
+        if not is_valid_timezone(last_word):
+            await outbox.send_message(
+                message.chat.id, UNKNOWN_TIMEZONE_TEXT.format(last_word)
+            )
+            return
+        timezone, city = last_word, rest
+
+    city = city.strip()
+    latitude = longitude = None
+    if city:
+        city = get_city_display_name(city)
+        if not await check_city(message.chat.id, city):
+            return
+        target_name = city
+    else:
+        bucket = await dp.storage.get_bucket(chat=message.chat.id,
+                                             user=message.from_user.id)
+        if 'last_location' not in bucket:
+            await outbox.send_message(message.chat.id,
+                                      get_subscribe_usage_text())
+            return
+        latitude, longitude = bucket['last_location']
+        city = None
+        target_name = 'по геолокации'
+
+    subscription = Subscription(message.chat.id, city, latitude, longitude,
+                                hour * 60 + minute, timezone)
+    subscriptions = subscription_scheduler.get_subscriptions(message.chat.id)
+    if (len(subscriptions) >= settings.subscriptions_limit
+            and subscription.target not in [item.target
+                                            for item in subscriptions]):
+        await outbox.send_message(
+            message.chat.id, SUBSCRIPTIONS_LIMIT_TEXT.format(
+                settings.subscriptions_limit)
+        )
+        return
+
+    await subscription_scheduler.subscribe(subscription)
+    await outbox.send_message(
+        message.chat.id,
+        SUBSCRIBED_TEXT.format(target_name, f'{hour:02}:{minute:02}',
+                               timezone)
+    )
+
 
-    # Удаляем предыдущее сообщение бота, созданное через Callback_Query.
-    await bot.delete_message(message.chat.id, last_message_id)
+@dp.message_handler(commands=['unsubscribe'])
+async def unsubscribe(message: Message) -> None:
+    """
+    Обработчик команды /unsubscribe. Отменяет подписку на город
+    или все подписки, если город не указан.
+
+    Параметры:
+        message (Message): Объект сообщения.
+    """
+    city = message.get_args().strip()
+    city = get_city_display_name(city) if city else None
+    removed = await subscription_scheduler.unsubscribe(message.chat.id, city)
+    if not removed:
+        await outbox.send_message(message.chat.id, NO_SUBSCRIPTIONS_TEXT)
+        return
+    await outbox.send_message(message.chat.id,
+                              UNSUBSCRIBED_TEXT.format(removed))
 
-    await state.finish()  # Сброс состояния после обработки ввода.
+
+async def get_inline_weather(city: str) -> Optional[WeatherInformation]:
+    """Функция получения погоды для inline-ответа без выброса ошибок."""
+    try:
+        return await get_weather_for_city(city)
+    except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+            WeatherCustomError):
+        return None
+
+
+def get_inline_result_id(city: str, weather: WeatherInformation) -> str:
+    """Функция идентификатора карточки inline-ответа.
+
+    Telegram ограничивает идентификатор 64 байтами, а название города
+    в UTF-8 может быть длиннее, поэтому без номера города используется
+    начало хэша нормализованного названия.
+    """
+    if weather.city_id is not None:
+        return str(weather.city_id)
+    return hashlib.sha1(
+        normalize_city_name(city).encode('UTF-8')
+    ).hexdigest()[:16]
+
+
+@lru_cache(maxsize=4096)
+def get_weather_article(city: str,
+                        weather: WeatherInformation
+                        ) -> InlineQueryResultArticle:
+    """Функция построения карточки inline-ответа с погодой в городе."""
+    return InlineQueryResultArticle(
+        id=get_inline_result_id(city, weather),
+        title=f'{city}: {weather.temperature}°C',
+        description=weather.status,
+        input_message_content=InputTextMessageContent(
+            render_weather_reply('weather_in_city_message', city, weather)
+        ),
+    )
+
+
+@dp.inline_handler()
+async def inline_weather(inline_query: InlineQuery) -> None:
+    """
+    Обработчик inline-запроса (@бот Москва). Предлагает города по началу
+    названия и отвечает карточками с текущей погодой.
+
+    Погода, которую API не вернул за INLINE_FETCH_TIMEOUT секунд,
+    догружается в кэш в фоне, а Telegram получает неполный ответ
+    с коротким временем кэширования и повторит запрос.
+
+    Параметры:
+        inline_query (InlineQuery): Объект inline-запроса.
+    """
+    cities = get_city_suggestions(inline_query.query, INLINE_RESULTS_LIMIT)
+    tasks = [asyncio.ensure_future(get_inline_weather(city))
+             for city in cities]
+    if tasks:
+        await asyncio.wait(tasks, timeout=INLINE_FETCH_TIMEOUT)
+
+    results = []
+    complete = True
+    for city, task in zip(cities, tasks):
+        if not task.done():
+            complete = False
+        elif task.result() is not None:
+            results.append(get_weather_article(city, task.result()))
+
+    cache_time = INLINE_CACHE_TIME if complete else INLINE_PARTIAL_CACHE_TIME
+    await inline_query.answer(results, cache_time=cache_time,
+                              is_personal=False)
 
 
 @dp.message_handler()
@@ -284,13 +739,9 @@ async def unknown_command_message(message: Message) -> None:
     Параметры:
         message (Message): Объект сообщения.
     """
-    keyboard = InlineKeyboardMarkup()
-    btn_menu = InlineKeyboardButton('Меню', callback_data='menu')
-    keyboard.row(btn_menu)
-
     try:
-        await bot.send_message(message.chat.id, UNKNOWN_COMMAND_TEXT,
-                               reply_markup=keyboard)
+        await outbox.send_message(message.chat.id, UNKNOWN_COMMAND_TEXT,
+                                  reply_markup=MENU_BUTTON_KEYBOARD)
 
     except BotBlocked as bot_blocked_error:
         msg_error = (f'Функция unknown_command_message не смогла отправить '
@@ -0,0 +1,82 @@
+"""Keyboards"""
+import typing
+
+from aiogram.dispatcher import FSMContext
+from aiogram.types import (CallbackQuery, InlineKeyboardButton,
+                           InlineKeyboardMarkup)
+
+CALLBACK_MENU = 'menu'
+CALLBACK_WEATHER_IN_CITY = 'weather_in_city'
+CALLBACK_WEATHER_FROM_LOCATION = 'weather_from_location'
+CALLBACK_CANCEL = 'cancel'
+
+
+def build_keyboard(*rows: typing.Sequence[typing.Tuple[str, str]]) -> str:
+    """Функция построения inline-клавиатуры, сразу сериализованной в JSON.
+
+    Каждая строка клавиатуры - последовательность пар (текст кнопки,
+    callback_data). Строку JSON aiogram передаёт в Bot API как есть,
+    поэтому клавиатура не собирается и не кодируется на каждый ответ.
+    """
+    keyboard = InlineKeyboardMarkup()
+    for row in rows:
+        keyboard.row(*(InlineKeyboardButton(text, callback_data=data)
+                       for text, data in row))
+    return keyboard.as_json()
+
+
+MENU_BUTTON_KEYBOARD = build_keyboard([('Меню', CALLBACK_MENU)])
+BACK_TO_MENU_KEYBOARD = build_keyboard([('Назад в меню', CALLBACK_MENU)])
+MENU_KEYBOARD = build_keyboard(
+    [('Погода по городу', CALLBACK_WEATHER_IN_CITY)],
+    [('Погода по геолокации', CALLBACK_WEATHER_FROM_LOCATION)],
+)
+CANCEL_KEYBOARD = build_keyboard([('Отмена', CALLBACK_CANCEL)])
+
+
+class CallbackRoute(typing.NamedTuple):
+    """Обработчик нажатия на кнопку."""
+    handler: typing.Callable
+    # Обработчик доступен в любом состоянии FSM и получает FSMContext,
+    # иначе - только вне сценариев ввода.
+    any_state: bool
+
+
+class CallbackRouter:
+    """Таблица обработчиков нажатий на кнопки по callback_data.
+
+    Регистрируется в диспетчере одним обработчиком: вместо проверки
+    фильтра каждого обработчика по очереди нужный находится поиском
+    в словаре.
+    """
+
+    def __init__(self) -> None:
+        self._routes: typing.Dict[str, CallbackRoute] = {}
+
+    def route(self, data: str, any_state: bool = False) -> typing.Callable:
+        """Декоратор регистрации обработчика кнопки с callback_data."""
+        def decorator(handler: typing.Callable) -> typing.Callable:
+            self._routes[data] = CallbackRoute(handler, any_state)
+            return handler
+        return decorator
+
+    def filter(self, callback_query: CallbackQuery) -> bool:
+        """Фильтр диспетчера: есть ли обработчик у нажатой кнопки."""
+        return callback_query.data in self._routes
+
+    def resolve(self, callback_query: CallbackQuery
+                ) -> typing.Optional[typing.Callable]:
+        """Метод, возвращающий обработчик нажатой кнопки."""
+        route = self._routes.get(callback_query.data)
+        return route.handler if route is not None else None
+
+    async def __call__(self, callback_query: CallbackQuery,
+                       state: FSMContext) -> None:
+        route = self._routes[callback_query.data]
+        if route.any_state:
+            await route.handler(callback_query, state)
+        elif await state.get_state() is None:
+            await route.handler(callback_query)
+
+
+callback_router = CallbackRouter()
@@ -0,0 +1,12 @@
+"""Нагрузочное тестирование бота без обращения к внешним сервисам.
+
+Запуск из корня проекта:
+
+    python -m loadtest --users 200 --duration 60 --output result.json
+    python -m loadtest --baseline result.json
+
+Настоящий диспетчер из bot.py обрабатывает обновления сценариев
+«меню → город», «меню → геолокация» и «меню → отмена», а Bot API
+и API погоды заменяются локальными заглушками с настраиваемыми
+задержкой и долей ошибок и ответов 429.
+"""
@@ -0,0 +1,106 @@
+"""Load test command line"""
+import argparse
+import asyncio
+import json
+import sys
+import typing
+
+from loadtest.runner import LoadTestConfig, compare, run_load
+
+
+def parse_mix(value: str) -> typing.Dict[str, float]:
+    """Функция разбора весов сценариев вида city=6,location=3,cancel=1."""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        try:
+            mix[name.strip()] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'Неверный вес сценария: {item}')
+    return mix
+
+
+def parse_args(argv: typing.Optional[typing.List[str]] = None
+               ) -> argparse.Namespace:
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser(
+        prog='python -m loadtest',
+        description='Нагрузочный прогон бота против локальных заглушек '
+                    'Bot API и API погоды.',
+    )
+    parser.add_argument('--users', type=int, default=defaults.users,
+                        help='количество одновременных пользователей')
+    parser.add_argument('--duration', type=float, default=defaults.duration,
+                        help='длительность прогона в секундах')
+    parser.add_argument('--mix', type=parse_mix,
+                        default=dict(defaults.mix),
+                        help='веса сценариев, например '
+                             'city=6,location=3,cancel=1')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--telegram-latency', type=float,
+                        default=defaults.telegram_latency,
+                        help='средняя задержка Bot API в секундах')
+    parser.add_argument('--telegram-error-rate', type=float,
+                        default=defaults.telegram_error_rate,
+                        help='доля ответов Bot API со статусом 500')
+    parser.add_argument('--telegram-retry-after-rate', type=float,
+                        default=defaults.telegram_retry_after_rate,
+                        help='доля ответов Bot API со статусом 429')
+    parser.add_argument('--weather-latency', type=float,
+                        default=defaults.weather_latency,
+                        help='средняя задержка API погоды в секундах')
+    parser.add_argument('--weather-error-rate', type=float,
+                        default=defaults.weather_error_rate,
+                        help='доля ответов API погоды со статусом 500')
+    parser.add_argument('--weather-retry-after-rate', type=float,
+                        default=defaults.weather_retry_after_rate,
+                        help='доля ответов API погоды со статусом 429')
+    parser.add_argument('--global-rate', type=float,
+                        default=defaults.global_rate,
+                        help='OUTBOX_GLOBAL_RATE бота; 30 - лимит Telegram')
+    parser.add_argument('--chat-rate', type=float,
+                        default=defaults.chat_rate,
+                        help='OUTBOX_CHAT_RATE бота; 1 - лимит Telegram')
+    parser.add_argument('--weather-rate', type=float,
+                        default=defaults.weather_rate,
+                        help='WEATHER_RATE_PER_SECOND бота')
+    parser.add_argument('--throttle-rate', type=float,
+                        default=defaults.throttle_rate,
+                        help='THROTTLE_RATE и THROTTLE_BURST бота')
+    parser.add_argument('--outbox-concurrency', type=int,
+                        default=defaults.outbox_concurrency,
+                        help='OUTBOX_CONCURRENCY бота')
+    parser.add_argument('--output', default='loadtest_result.json',
+                        help='файл для результатов в JSON')
+    parser.add_argument('--baseline',
+                        help='результаты предыдущего прогона для сравнения')
+    return parser.parse_args(argv)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    args = parse_args(argv)
+    config = LoadTestConfig(**{field: getattr(args, field)
+                               for field in LoadTestConfig._fields})
+    result = asyncio.run(run_load(config))
+
+    with open(args.output, 'w', encoding='UTF-8') as output:
+        json.dump(result, output, ensure_ascii=False, indent=2)
+
+    update, flow = result['latency']['update'], result['latency']['flow']
+    print(f'Обновлений: {update["count"]}, '
+          f'{result["throughput"]["updates_per_second"]}/с; '
+          f'p50 {update["p50_ms"]} мс, p95 {update["p95_ms"]} мс, '
+          f'p99 {update["p99_ms"]} мс')
+    print(f'Сценариев: {flow["count"]}, p95 {flow["p95_ms"]} мс; '
+          f'ошибок: {result["errors"]["total"]}; '
+          f'пик памяти {result["memory"]["peak_rss_mb"]} МБ')
+    print(f'Результаты записаны в {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='UTF-8') as baseline:
+            for line in compare(result, json.load(baseline)):
+                print(line)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Измерение накладных расходов диспетчера на обновление до и после
+таблицы кнопок и готовых клавиатур.
+
+Запуск из корня проекта:
+
+    python -m loadtest.dispatch --updates 5000
+
+Обновления проходят через диспетчер бота с его промежуточными слоями
+и хранилищем FSM. Прежний вариант - обработчики кнопок с собственными
+фильтрами-лямбдами, проверяемыми по очереди, и клавиатуры, которые
+собираются в каждом ответе, - подставляется в тот же диспетчер вместо
+текущих обработчиков. Очередь исходящих сообщений заменяется
+заглушкой, которая только кодирует клавиатуру, как Bot перед
+отправкой, а ответ на нажатие кнопки не отправляется: измеряется
+только работа бота. Каждое обновление приходит от нового
+пользователя, поэтому состояние FSM перед ним пустое; количество
+ответов обоих вариантов сверяется.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import types
+import typing
+
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import UpdateFactory
+
+
+class StubOutbox:
+    """Заглушка очереди исходящих сообщений."""
+
+    def __init__(self) -> None:
+        from aiogram.utils.payload import prepare_arg
+
+        self._prepare_arg = prepare_arg
+        self._message_ids = itertools.count(1)
+        self.sent = 0
+
+    def _sent(self, reply_markup) -> types.SimpleNamespace:
+        self._prepare_arg(reply_markup)
+        self.sent += 1
+        return types.SimpleNamespace(message_id=next(self._message_ids))
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        return self._sent(reply_markup)
+
+    async def edit_message_text(self, text, chat_id, message_id,
+                                reply_markup=None, **kwargs):
+        return self._sent(reply_markup)
+
+    def edit_message_reply_markup(self, chat_id, message_id,
+                                  reply_markup=None) -> None:
+        self._sent(reply_markup)
+
+    def delete_message(self, chat_id, message_id) -> None:
+        pass
+
+
+def register_legacy_handlers(dp, outbox: StubOutbox, handlers) -> None:
+    """Функция регистрации обработчиков кнопок в прежнем виде."""
+    from aiogram.types import (CallbackQuery, InlineKeyboardButton,
+                               InlineKeyboardMarkup)
+
+    async def start(message) -> None:
+        keyboard = InlineKeyboardMarkup()
+        button_menu = InlineKeyboardButton('Меню', callback_data='menu')
+        keyboard.row(button_menu)
+
+        await outbox.send_message(chat_id=message.chat.id,
+                                  text=handlers.GREETINGS_TEXT,
+                                  reply_markup=keyboard)
+
+    async def start_menu(message) -> None:
+        keyboard = InlineKeyboardMarkup()
+        btn_city_weather = InlineKeyboardButton(
+            'Погода по городу', callback_data='weather_in_city'
+        )
+        btn_loc_weather = InlineKeyboardButton(
+            'Погода по геолокации', callback_data='weather_from_location'
+        )
+        keyboard.row(btn_city_weather)
+        keyboard.row(btn_loc_weather)
+
+        if type(message) == CallbackQuery:
+            outbox.edit_message_reply_markup(message.message.chat.id,
+                                             message.message.message_id,
+                                             reply_markup=None)
+
+        await outbox.send_message(message.from_user.id,
+                                  text=handlers.MENU_TEXT,
+                                  reply_markup=keyboard)
+
+    async def start_get_weather_in_city_callback(callback_query) -> None:
+        keyboard = InlineKeyboardMarkup()
+        button_cancel = InlineKeyboardButton('Отмена', callback_data='cancel')
+        keyboard.row(button_cancel)
+
+        await callback_query.answer()
+        sent_message = await outbox.edit_message_text(
+            handlers.START_GET_WEATHER_TEXT,
+            chat_id=callback_query.message.chat.id,
+            message_id=callback_query.message.message_id,
+            reply_markup=keyboard)
+
+        state = dp.current_state(chat=callback_query.from_user.id)
+        await state.update_data(last_message_id=sent_message.message_id)
+
+        await handlers.WaitingForCityInput.city.set()
+
+    async def start_get_weather_from_location_callback(
+            callback_query) -> None:
+        keyboard = InlineKeyboardMarkup()
+        button_cancel = InlineKeyboardButton('Отмена', callback_data='cancel')
+        keyboard.row(button_cancel)
+
+        await callback_query.answer()
+        sent_message = await outbox.edit_message_text(
+            handlers.START_GET_WEATHER_IN_LOC_TEXT,
+            chat_id=callback_query.message.chat.id,
+            message_id=callback_query.message.message_id,
+            reply_markup=keyboard)
+
+        state = dp.current_state(chat=callback_query.from_user.id)
+        await state.update_data(last_message_id=sent_message.message_id)
+
+        await handlers.WaitingForLocationInput.location.set()
+
+    async def cancel_handler(callback_query, state) -> None:
+        current_state = await state.get_state()
+        if current_state is None:
+            return
+
+        keyboard = InlineKeyboardMarkup()
+        button_city_weather = InlineKeyboardButton(
+            'Погода по городу', callback_data='weather_in_city'
+        )
+        button_loc_weather = InlineKeyboardButton(
+            'Погода по геолокации', callback_data='weather_from_location'
+        )
+        keyboard.row(button_city_weather)
+        keyboard.row(button_loc_weather)
+
+        await state.finish()
+
+        await callback_query.answer('Действие отменено')
+        await outbox.edit_message_text(
+            handlers.CANCEL_TEXT,
+            chat_id=callback_query.message.chat.id,
+            message_id=callback_query.message.message_id,
+            reply_markup=keyboard)
+
+    dp.register_message_handler(start, commands=['start'])
+    dp.register_message_handler(start_menu, commands=['menu'])
+    dp.register_callback_query_handler(start_menu,
+                                       lambda c: c.data == 'menu')
+    dp.register_callback_query_handler(start_get_weather_in_city_callback,
+                                       lambda c: c.data == 'weather_in_city')
+    dp.register_callback_query_handler(
+        start_get_weather_from_location_callback,
+        lambda c: c.data == 'weather_from_location'
+    )
+    dp.register_callback_query_handler(cancel_handler,
+                                       lambda c: c.data == 'cancel',
+                                       state='*')
+
+
+async def measure_dispatch(dp, updates: typing.List) -> float:
+    """Функция, возвращающая время обработки одного обновления
+    в микросекундах.
+    """
+    started = time.perf_counter()
+    for update in updates:
+        await dp.process_update(update)
+    return (time.perf_counter() - started) / len(updates) * 10 ** 6
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    import handlers
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import CallbackQuery
+    from bot import bot, dp
+
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+
+    async def answer(self, *args, **kwargs) -> bool:
+        return True
+
+    CallbackQuery.answer = answer
+    outbox = StubOutbox()
+    handlers.outbox = outbox
+
+    # Текущие обработчики; прежние регистрируются в пустые списки,
+    # после чего к ним добавляются остальные обработчики сообщений бота.
+    replaced = (handlers.start, handlers.start_menu)
+    current = (dp.message_handlers.handlers,
+               dp.callback_query_handlers.handlers)
+    dp.message_handlers.handlers = []
+    dp.callback_query_handlers.handlers = []
+    register_legacy_handlers(dp, outbox, handlers)
+    dp.message_handlers.handlers.extend(
+        handler for handler in current[0] if handler.handler not in replaced
+    )
+    legacy = (dp.message_handlers.handlers,
+              dp.callback_query_handlers.handlers)
+    modes = {'legacy': legacy, 'current': current}
+
+    factory = UpdateFactory()
+    users = itertools.count(1)
+    scenarios = {
+        'start': lambda user_id: factory.command(user_id, '/start'),
+        'menu': lambda user_id: factory.callback(
+            user_id, 'menu', factory.bot_message_id()
+        ),
+        'weather_from_location': lambda user_id: factory.callback(
+            user_id, 'weather_from_location', factory.bot_message_id()
+        ),
+        'cancel': lambda user_id: factory.callback(
+            user_id, 'cancel', factory.bot_message_id()
+        ),
+    }
+
+    # Варианты чередуются в каждом повторе, чтобы фоновая нагрузка
+    # на машину сказывалась на них одинаково; берётся лучший повтор.
+    result = {scenario: {mode: float('inf') for mode in modes}
+              for scenario in scenarios}
+    for _ in range(args.repeat):
+        for scenario, build in scenarios.items():
+            sent = {}
+            for mode, (message_handlers, callback_handlers) in modes.items():
+                dp.message_handlers.handlers = message_handlers
+                dp.callback_query_handlers.handlers = callback_handlers
+                updates = [build(next(users)) for _ in range(args.updates)]
+                outbox.sent = 0
+                result[scenario][mode] = min(
+                    result[scenario][mode],
+                    await measure_dispatch(dp, updates)
+                )
+                sent[mode] = outbox.sent
+            # Оба варианта должны отвечать на обновления одинаково.
+            assert sent['legacy'] == sent['current'], (scenario, sent)
+    for scenario, values in result.items():
+        for mode in values:
+            values[mode] = round(values[mode], 1)
+        print(f'{scenario:>22}: прежний вариант {values["legacy"]} мкс, '
+              f'текущий {values["current"]} мкс на обновление', flush=True)
+
+    await (await bot.get_session()).close()
+    return {'config': vars(args), 'dispatch_us': result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.dispatch')
+    parser.add_argument('--updates', type=int, default=5000,
+                        help='обновлений в одном замере')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""Fake servers"""
+import asyncio
+import fnmatch
+import itertools
+import random
+import time
+import typing
+import zlib
+from collections import Counter, defaultdict, deque
+
+from aiohttp import web
+
+
+class FakeServer:
+    """Локальный HTTP-сервер, подменяющий внешний API при нагрузочном
+    тестировании.
+
+    Каждый ответ задерживается на latency секунд (±50%). Доля ответов
+    retry_after_rate завершается статусом 429, доля error_rate - 500.
+    Количество вызовов считается по эндпоинтам и статусам ответа.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 retry_after_rate: float = 0.0,
+                 seed: typing.Optional[int] = None) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.url: typing.Optional[str] = None
+        self.app = web.Application()
+        self._random = random.Random(seed)
+        self._calls: typing.Dict[str, Counter] = defaultdict(Counter)
+        self._runner: typing.Optional[web.AppRunner] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Метод запуска сервера; возвращает его адрес."""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{port}'
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> typing.Dict[str, typing.Dict]:
+        """Метод, возвращающий количество вызовов по эндпоинтам."""
+        return {
+            endpoint: {'calls': sum(statuses.values()),
+                       'status': {str(status): count
+                                  for status, count in statuses.items()}}
+            for endpoint, statuses in sorted(self._calls.items())
+        }
+
+    async def _delay(self) -> None:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+    def _fault(self) -> typing.Optional[int]:
+        """Метод выбора ошибочного статуса для очередного ответа."""
+        roll = self._random.random()
+        if roll < self.retry_after_rate:
+            return 429
+        if roll < self.retry_after_rate + self.error_rate:
+            return 500
+        return None
+
+    def _record(self, endpoint: str, status: int) -> None:
+        self._calls[endpoint][status] += 1
+
+
+class FakeTelegramServer(FakeServer):
+    """Заглушка Bot API: принимает вызовы методов и возвращает
+    правдоподобные результаты, не отправляя сообщений.
+
+    Обновления, добавленные через add_updates, отдаются getUpdates
+    с учётом смещения и длинного опроса, как в настоящем Bot API.
+    Если заданы global_limit и chat_limit, вызовы сверх этого числа
+    за последнюю секунду на весь бот или в один чат получают 429, как
+    при превышении ограничений Telegram.
+    """
+
+    def __init__(self, *args, retry_after: int = 1, global_limit: int = 0,
+                 chat_limit: int = 0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        # Время принятых вызовов за последнюю секунду.
+        self._accepted: deque = deque()
+        self._accepted_by_chat: typing.Dict[str, deque] = defaultdict(deque)
+        # Номер последнего обновления, подтверждённого смещением.
+        self.confirmed_update_id = 0
+        # Время первого отправленного сообщения в каждый чат.
+        self.first_message_at: typing.Dict[int, float] = {}
+        self._message_ids = iter(range(1, 2 ** 31))
+        self._updates: deque = deque()
+        self._new_updates = asyncio.Event()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    def add_updates(self, updates: typing.Iterable[typing.Dict]) -> None:
+        """Метод постановки обновлений в очередь для getUpdates."""
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def _get_updates(self, data) -> typing.List[typing.Dict]:
+        offset = int(data.get('offset') or 0)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self.confirmed_update_id = self._updates.popleft()['update_id']
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(),
+                                       int(data.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                return []
+        limit = int(data.get('limit') or 100)
+        return list(itertools.islice(self._updates, limit))
+
+    def _flooded(self, chat_id: str) -> bool:
+        """Метод учёта вызова в ограничениях частоты; True, если вызов
+        превышает ограничение.
+        """
+        if not self.global_limit and not self.chat_limit:
+            return False
+        now = time.monotonic()
+        chat = self._accepted_by_chat[chat_id]
+        for accepted in (self._accepted, chat):
+            while accepted and accepted[0] <= now - 1:
+                accepted.popleft()
+        if (self.global_limit and len(self._accepted) >= self.global_limit
+                or self.chat_limit and len(chat) >= self.chat_limit):
+            return True
+        self._accepted.append(now)
+        chat.append(now)
+        return False
+
+    def _retry_after_response(self, method: str) -> web.Response:
+        self._record(method, 429)
+        return web.json_response({
+            'ok': False, 'error_code': 429,
+            'description': f'Too Many Requests: retry after '
+                           f'{self.retry_after}',
+            'parameters': {'retry_after': self.retry_after},
+        }, status=429)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        await self._delay()
+        fault = self._fault()
+        if fault == 429:
+            return self._retry_after_response(method)
+        if fault is not None:
+            self._record(method, fault)
+            return web.json_response({
+                'ok': False, 'error_code': fault,
+                'description': 'Internal Server Error',
+            }, status=fault)
+
+        try:
+            data = await request.post()
+        except ConnectionResetError:
+            # Бот прервал длинный опрос при остановке.
+            return web.Response()
+        if method != 'getUpdates' and self._flooded(data.get('chat_id', '')):
+            return self._retry_after_response(method)
+        if method == 'getUpdates':
+            result = await self._get_updates(data)
+        else:
+            result = self._result(method, data)
+        self._record(method, 200)
+        return web.json_response({'ok': True, 'result': result})
+
+    def _result(self, method: str, data) -> typing.Any:
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Load test',
+                    'username': 'loadtest_bot'}
+        if method in ('sendMessage', 'editMessageText'):
+            message_id = data.get('message_id')
+            self.first_message_at.setdefault(int(data.get('chat_id', 0)),
+                                             time.perf_counter())
+            return {
+                'message_id': (int(message_id) if message_id
+                               else next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': int(data.get('chat_id', 0)),
+                         'type': 'private'},
+                'text': data.get('text', ''),
+            }
+        return True
+
+
+class FakeWeatherServer(FakeServer):
+    """Заглушка API OpenWeatherMap для текущей погоды, групповых
+    запросов и прогноза на 5 дней.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.app.router.add_get('/data/2.5/weather', self.handle_weather)
+        self.app.router.add_get('/data/2.5/group', self.handle_group)
+        self.app.router.add_get('/data/2.5/forecast', self.handle_forecast)
+
+    async def _respond(self, endpoint: str,
+                       build: typing.Callable[[], typing.Dict]
+                       ) -> web.Response:
+        await self._delay()
+        status = self._fault() or 200
+        self._record(endpoint, status)
+        if status != 200:
+            return web.json_response({'cod': status, 'message': 'error'},
+                                     status=status)
+        return web.json_response(build())
+
+    def _weather(self, city_id: int, name: str) -> typing.Dict:
+        return {
+            'id': city_id,
+            'name': name,
+            'dt': int(time.time()),
+            'main': {'temp': round(self._random.uniform(-20, 30), 2),
+                     'humidity': self._random.randint(20, 100),
+                     'pressure': self._random.randint(980, 1040)},
+            'weather': [{'id': 800, 'description': 'ясно'}],
+            'wind': {'speed': round(self._random.uniform(0, 15), 1)},
+        }
+
+    async def handle_weather(self, request: web.Request) -> web.Response:
+        query = request.query
+        if 'id' in query:
+            city_id = int(query['id'])
+            name = f'Город {city_id}'
+        elif 'q' in query:
+            name = query['q']
+            city_id = zlib.crc32(name.encode())
+        else:
+            name = 'Локация'
+            city_id = zlib.crc32(
+                f"{query.get('lat')},{query.get('lon')}".encode()
+            )
+        return await self._respond('weather',
+                                   lambda: self._weather(city_id, name))
+
+    async def handle_group(self, request: web.Request) -> web.Response:
+        city_ids = [int(city_id)
+                    for city_id in request.query.get('id', '').split(',')
+                    if city_id]
+
+        def build() -> typing.Dict:
+            return {'cnt': len(city_ids),
+                    'list': [self._weather(city_id, f'Город {city_id}')
+                             for city_id in city_ids]}
+
+        return await self._respond('group', build)
+
+    async def handle_forecast(self, request: web.Request) -> web.Response:
+        query = request.query
+        city_id = int(query['id']) if 'id' in query else 0
+        name = query.get('q', f'Город {city_id}')
+
+        def build() -> typing.Dict:
+            now = int(time.time()) // 10800 * 10800
+            return {
+                'city': {'id': city_id, 'name': name, 'timezone': 10800},
+                'list': [{
+                    'dt': now + step * 10800,
+                    'main': {'temp': round(self._random.uniform(-20, 30),
+                                           2)},
+                    'pop': round(self._random.random(), 2),
+                    'weather': [{'id': self._random.choice(
+                        (800, 801, 500, 600))}],
+                } for step in range(40)],
+            }
+
+        return await self._respond('forecast', build)
+
+
+class FakeRedisServer:
+    """Локальная заглушка сервера Redis с командами, которые использует
+    хранилище кэша погоды: GET, SET PX, PTTL, MGET, SCAN, AUTH и SELECT.
+
+    Каждый ответ задерживается на latency секунд, что позволяет проверить
+    поведение клиента при зависшем сервере.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.url: typing.Optional[str] = None
+        self.commands: Counter = Counter()
+        # Значение и время истечения срока жизни (monotonic) по ключу.
+        self._data: typing.Dict[bytes, typing.Tuple[bytes, float]] = {}
+        self._server: typing.Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Метод запуска сервера; возвращает его адрес."""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f'redis://{host}:{port}/0'
+        return self.url
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                if self.latency > 0:
+                    await asyncio.sleep(self.latency)
+                writer.write(self._encode(self._execute(command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader
+                            ) -> typing.Optional[typing.List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    @classmethod
+    def _encode(cls, reply: typing.Any) -> bytes:
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, str):
+            return f'+{reply}\r\n'.encode()
+        if isinstance(reply, Exception):
+            return f'-ERR {reply}\r\n'.encode()
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(
+                cls._encode(item) for item in reply
+            )
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+    def _get(self, key: bytes) -> typing.Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[0]
+
+    def _execute(self, command: typing.List[bytes]) -> typing.Any:
+        name = command[0].decode().upper()
+        self.commands[name] += 1
+        if name in ('AUTH', 'SELECT'):
+            return 'OK'
+        if name == 'GET':
+            return self._get(command[1])
+        if name == 'MGET':
+            return [self._get(key) for key in command[1:]]
+        if name == 'SET':
+            expires_at = float('inf')
+            if len(command) == 5 and command[3].upper() == b'PX':
+                expires_at = time.monotonic() + int(command[4]) / 1000
+            self._data[command[1]] = (command[2], expires_at)
+            return 'OK'
+        if name == 'PTTL':
+            if self._get(command[1]) is None:
+                return -2
+            expires_at = self._data[command[1]][1]
+            if expires_at == float('inf'):
+                return -1
+            return int((expires_at - time.monotonic()) * 1000)
+        if name == 'SCAN':
+            pattern = command[command.index(b'MATCH') + 1].decode()
+            keys = [key for key in list(self._data)
+                    if self._get(key) is not None
+                    and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return [b'0', keys]
+        return ValueError(f'unknown command {name.lower()}')
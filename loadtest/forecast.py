@@ -0,0 +1,145 @@
+"""Измерение разбора и сводки прогноза на 5 дней и памяти на прогноз
+в кэше.
+
+Запуск из корня проекта:
+
+    python -m loadtest.forecast --forecasts 2000
+
+Ответы API прогноза строятся со всеми полями настоящего ответа
+OpenWeatherMap (40 точек с шагом 3 часа). Для каждого ответа отдельно
+измеряются декодирование JSON, распаковка в колоночный Forecast
+и подсчёт сводки по дням вместе с советом. Память на прогноз
+сравнивается с хранением декодированного ответа целиком.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+import typing
+
+from loadtest.runner import LoadTestConfig, configure_environment
+
+CODES = (800, 801, 802, 803, 804, 500, 501, 600, 211)
+
+
+def build_forecast_body(rng: random.Random, city_id: int) -> bytes:
+    """Функция ответа API прогноза со всеми полями, как у OpenWeatherMap."""
+    now = int(time.time()) // 10800 * 10800
+    points = []
+    for step in range(40):
+        temperature = round(rng.uniform(-20, 30), 2)
+        code = rng.choice(CODES)
+        point = {
+            'dt': now + step * 10800,
+            'main': {'temp': temperature,
+                     'feels_like': round(temperature - rng.uniform(0, 5), 2),
+                     'temp_min': temperature, 'temp_max': temperature,
+                     'pressure': rng.randint(980, 1040),
+                     'sea_level': rng.randint(980, 1040),
+                     'grnd_level': rng.randint(950, 1030),
+                     'humidity': rng.randint(20, 100), 'temp_kf': 0},
+            'weather': [{'id': code, 'main': 'Clouds',
+                         'description': 'облачно с прояснениями',
+                         'icon': '04d'}],
+            'clouds': {'all': rng.randint(0, 100)},
+            'wind': {'speed': round(rng.uniform(0, 15), 2),
+                     'deg': rng.randint(0, 359),
+                     'gust': round(rng.uniform(0, 20), 2)},
+            'visibility': 10000,
+            'pop': round(rng.random(), 2),
+            'sys': {'pod': 'd' if step % 8 < 4 else 'n'},
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S',
+                                    time.gmtime(now + step * 10800)),
+        }
+        if code // 100 in (2, 5):
+            point['rain'] = {'3h': round(rng.uniform(0, 5), 2)}
+        elif code // 100 == 6:
+            point['snow'] = {'3h': round(rng.uniform(0, 3), 2)}
+        points.append(point)
+    return json.dumps({
+        'cod': '200', 'message': 0, 'cnt': len(points), 'list': points,
+        'city': {'id': city_id, 'name': f'Город {city_id}',
+                 'coord': {'lat': 55.75, 'lon': 37.62}, 'country': 'RU',
+                 'population': 1000000, 'timezone': 10800,
+                 'sunrise': now, 'sunset': now + 50000},
+    }, ensure_ascii=False).encode()
+
+
+def measure_memory(build: typing.Callable[[], typing.Any],
+                   count: int) -> float:
+    """Функция, возвращающая память на один объект в байтах."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build() for _ in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return used / count
+
+
+def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from weather.forecast import parse_forecast, summarize_forecast
+    from weather.weather_hints import get_forecast_hint
+    from weather.weather_service import json_loads
+
+    rng = random.Random(args.seed)
+    bodies = [build_forecast_body(rng, city_id)
+              for city_id in range(args.forecasts)]
+
+    # Каждый ответ разбирается и сводится отдельно, как в боте: список
+    # декодированных ответов вызывал бы сборку мусора и искажал замер.
+    decode_seconds = parse_seconds = summarize_seconds = 0.0
+    for body in bodies:
+        started = time.perf_counter()
+        data = json_loads(body)
+        decoded_at = time.perf_counter()
+        forecast = parse_forecast(data)
+        parsed_at = time.perf_counter()
+        get_forecast_hint(summarize_forecast(forecast))
+        summarize_seconds += time.perf_counter() - parsed_at
+        parse_seconds += parsed_at - decoded_at
+        decode_seconds += decoded_at - started
+    decode_us = decode_seconds / len(bodies) * 10 ** 6
+    parse_us = parse_seconds / len(bodies) * 10 ** 6
+    summarize_us = summarize_seconds / len(bodies) * 10 ** 6
+    print(f'На прогноз: JSON {decode_us:.0f} мкс, распаковка '
+          f'{parse_us:.0f} мкс, сводка и совет {summarize_us:.0f} мкс '
+          f'(тело ответа {len(bodies[0]) / 1024:.1f} КБ)', flush=True)
+
+    body = bodies[0]
+    json_bytes = measure_memory(lambda: json_loads(body), args.forecasts)
+    data = json_loads(body)
+    forecast_bytes = measure_memory(lambda: parse_forecast(data),
+                                    args.forecasts)
+    print(f'Память на прогноз: Forecast {forecast_bytes:.0f} байт, '
+          f'декодированный ответ {json_bytes:.0f} байт', flush=True)
+    return {
+        'config': vars(args),
+        'body_bytes': len(body),
+        'json_loads': json_loads.__module__,
+        'decode_us': round(decode_us, 1),
+        'parse_us': round(parse_us, 1),
+        'summarize_us': round(summarize_us, 1),
+        'forecast_bytes': round(forecast_bytes),
+        'decoded_json_bytes': round(json_bytes),
+    }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.forecast')
+    parser.add_argument('--forecasts', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
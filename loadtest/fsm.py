@@ -0,0 +1,128 @@
+"""Измерение пропускной способности и памяти хранилищ состояний FSM.
+
+Запуск из корня проекта:
+
+    python -m loadtest.fsm --users 100000 --storages memory,sqlite
+
+Для каждого хранилища users пользователей переводятся в состояние
+ожидания ввода с данными, как после нажатия на кнопку меню, затем
+их состояния и данные читаются. Операции идут пачками по concurrency
+одновременных вызовов. Память считается через tracemalloc и
+дополнительно как размер файла базы для SQLite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+PENDING_STATE = 'WaitingForCityInput:city'
+
+
+async def run_batches(operation: typing.Callable[[int], typing.Awaitable],
+                      users: int, concurrency: int) -> float:
+    """Функция выполнения операции для всех пользователей; возвращает
+    количество операций в секунду.
+    """
+    started = time.perf_counter()
+    for first in range(0, users, concurrency):
+        await asyncio.gather(*(operation(user_id) for user_id in
+                               range(first, min(first + concurrency, users))))
+    return users / (time.perf_counter() - started)
+
+
+async def fill(storage, users: int, concurrency: int) -> float:
+    """Функция перевода всех пользователей в состояние ожидания ввода;
+    возвращает количество операций записи в секунду.
+    """
+    async def set_pending(user_id: int) -> None:
+        await storage.set_state(chat=user_id, user=user_id,
+                                state=PENDING_STATE)
+        await storage.set_data(chat=user_id, user=user_id,
+                               data={'last_message_id': user_id})
+
+    # Каждый вызов - запись состояния и запись данных.
+    return await run_batches(set_pending, users, concurrency) * 2
+
+
+async def measure(create: typing.Callable[[str], typing.Any], workdir: str,
+                  users: int,
+                  concurrency: int) -> typing.Dict[str, typing.Any]:
+    async def get_pending(user_id: int) -> None:
+        state = await storage.get_state(chat=user_id, user=user_id)
+        data = await storage.get_data(chat=user_id, user=user_id)
+        assert state == PENDING_STATE and data['last_message_id'] == user_id
+
+    path = os.path.join(workdir, 'timing.sqlite3')
+    storage = create(path)
+    set_rate = await fill(storage, users, concurrency)
+    get_rate = await run_batches(get_pending, users, concurrency) * 2
+    await storage.close()
+    await storage.wait_closed()
+    result = {'set_ops_per_second': round(set_rate),
+              'get_ops_per_second': round(get_rate)}
+    if os.path.exists(path):
+        result['file_bytes_per_user'] = round(os.path.getsize(path) / users,
+                                              1)
+
+    # Память считается отдельным заполнением: tracemalloc замедляет
+    # операции и исказил бы замер скорости.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    storage = create(os.path.join(workdir, 'memory.sqlite3'))
+    await fill(storage, users, concurrency)
+    result['python_bytes_per_user'] = round(
+        (tracemalloc.get_traced_memory()[0] - before) / users, 1
+    )
+    tracemalloc.stop()
+    await storage.close()
+    await storage.wait_closed()
+    return result
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    storages = {
+        'memory': lambda path: MemoryStorage(),
+        'sqlite': lambda path: SQLiteStorage(path, state_ttl=3600),
+    }
+    result = {}
+    for name in args.storages:
+        if name not in storages:
+            raise ValueError(f'Неизвестное хранилище: {name}')
+        with tempfile.TemporaryDirectory(prefix='loadtest-fsm-') as workdir:
+            result[name] = await measure(storages[name], workdir, args.users,
+                                         args.concurrency)
+        stats = result[name]
+        print(f'{name:>7}: запись {stats["set_ops_per_second"]} оп/с, '
+              f'чтение {stats["get_ops_per_second"]} оп/с, '
+              f'{stats["python_bytes_per_user"]} байт памяти и '
+              f'{stats.get("file_bytes_per_user", 0)} байт файла '
+              f'на пользователя', flush=True)
+    return {'config': vars(args), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.fsm')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--storages', default='memory,sqlite',
+                        type=lambda value: value.split(','))
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
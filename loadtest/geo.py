@@ -0,0 +1,117 @@
+"""Измерение сокращения запросов к API погоды за счёт привязки
+геолокаций к соседним наблюдениям.
+
+Запуск из корня проекта:
+
+    python -m loadtest.geo --points 5000 --clusters 5 --spread-km 2
+
+Координаты пользователей генерируются вокруг clusters центров
+с нормальным разбросом spread_km и по очереди запрашиваются через
+get_weather_for_location у заглушки API погоды. Число вызовов API
+сравнивается с числом разных ячеек кэша геолокаций: столько запросов
+было бы без индекса. Отдельно измеряется время поиска в GeoIndex.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import typing
+
+from loadtest.fake_servers import FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment, summarize
+
+KM_PER_DEGREE = 111.2
+
+
+def generate_points(points: int, clusters: int, spread_km: float,
+                    rng: random.Random) -> typing.List[typing.Tuple[float,
+                                                                    float]]:
+    """Функция генерации координат, сгруппированных вокруг центров."""
+    centers = [(rng.uniform(40, 65), rng.uniform(20, 130))
+               for _ in range(clusters)]
+    result = []
+    for _ in range(points):
+        latitude, longitude = rng.choice(centers)
+        result.append((
+            latitude + rng.gauss(0, spread_km) / KM_PER_DEGREE,
+            longitude + rng.gauss(0, spread_km)
+            / (KM_PER_DEGREE * math.cos(math.radians(latitude))),
+        ))
+    return result
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    weather = FakeWeatherServer(latency=args.latency)
+    configure_environment(LoadTestConfig(), '', await weather.start())
+    os.environ['GEO_SNAP_RADIUS_KM'] = str(args.radius_km)
+    from aiogram.types import Location
+    from weather.geo_index import GeoIndex
+    from weather.weather_service import (close_session, geo_index,
+                                         get_location_cache_key,
+                                         get_weather_for_location)
+
+    rng = random.Random(args.seed)
+    points = [Location(latitude=latitude, longitude=longitude)
+              for latitude, longitude in generate_points(
+                  args.points, args.clusters, args.spread_km, rng)]
+    cells = len({get_location_cache_key(point) for point in points})
+
+    durations = []
+    for point in points:
+        started = time.perf_counter()
+        await get_weather_for_location(point)
+        durations.append(time.perf_counter() - started)
+    upstream = weather.stats()['weather']['calls']
+
+    # Поиск в индексе отдельно от запроса погоды; как и в боте, ключом
+    # точки служит ключ кэша, поэтому в ячейке кэша остаётся одна точка.
+    index = GeoIndex(radius_km=args.radius_km, max_age=600)
+    for point in points:
+        index.add(point.latitude, point.longitude,
+                  get_location_cache_key(point))
+    started = time.perf_counter()
+    for point in points:
+        index.nearest(point.latitude, point.longitude)
+    nearest_us = (time.perf_counter() - started) / len(points) * 10 ** 6
+
+    result = {
+        'upstream_calls': upstream,
+        'upstream_calls_without_index': cells,
+        'snapped': geo_index.snapped,
+        'lookup': summarize(durations),
+        'nearest_us': round(nearest_us, 2),
+    }
+    print(f'Вызовов API: {upstream} вместо {cells} без индекса '
+          f'({args.points} запросов, привязано {geo_index.snapped})')
+    print(f'get_weather_for_location: p50 {result["lookup"]["p50_ms"]} мс, '
+          f'p95 {result["lookup"]["p95_ms"]} мс; GeoIndex.nearest: '
+          f'{nearest_us:.1f} мкс при {len(index)} точках')
+    await close_session()
+    await weather.stop()
+    return {'config': vars(args), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.geo')
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--clusters', type=int, default=5)
+    parser.add_argument('--spread-km', type=float, default=2)
+    parser.add_argument('--radius-km', type=float, default=3)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='задержка ответа заглушки в секундах')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
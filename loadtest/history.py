@@ -0,0 +1,136 @@
+"""Измерение скорости записи и чтения истории наблюдений погоды.
+
+Запуск из корня проекта:
+
+    python -m loadtest.history --cities 1000 --days 30 --per-day 48
+
+История заполняется через WeatherHistory.record, как при работе бота:
+наблюдения всех городов идут по времени, пачки пишутся в отдельном
+потоке. Выводится скорость записи (наблюдений в секунду до окончания
+последней записи), время record в цикле событий, размер файла
+на наблюдение и задержка чтения истории случайного города
+за последние 30 дней вместе со сводкой для /trend.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import typing
+
+from weather.weather_history import (DAY_SECONDS, Observation,
+                                     WeatherHistory, summarize_history)
+
+STATUSES = ('ясно', 'облачно', 'пасмурно', 'небольшой дождь', 'снег')
+
+
+def percentile(values: typing.List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def ingest(history: WeatherHistory, args: argparse.Namespace,
+                 now: int, rng: random.Random) -> typing.Tuple[int, float]:
+    """Функция заполнения истории; возвращает количество наблюдений
+    и время record в цикле событий в секундах.
+    """
+    step = DAY_SECONDS // args.per_day
+    started = now - args.days * DAY_SECONDS
+    temperatures = [rng.uniform(-20, 30) for _ in range(args.cities)]
+    recorded = 0
+    record_seconds = 0.0
+    for timestamp in range(started, now, step):
+        batch = []
+        for city_id in range(args.cities):
+            temperatures[city_id] += rng.uniform(-0.5, 0.5)
+            batch.append((city_id, Observation(
+                timestamp + city_id % step, round(temperatures[city_id], 1),
+                STATUSES[city_id % len(STATUSES)], rng.randint(30, 100),
+                round(rng.uniform(0, 15), 1), rng.randint(980, 1040)
+            )))
+        record_started = time.perf_counter()
+        for city_id, observation in batch:
+            history.record(city_id, observation)
+        record_seconds += time.perf_counter() - record_started
+        recorded += len(batch)
+        # Запись идёт в своём потоке, цикл событий только отдаёт пачки.
+        await asyncio.sleep(0)
+    # Чтение выполняется в потоке записи после всех переданных ему пачек.
+    await history.get_observations(0, now, now)
+    return recorded, record_seconds
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    rng = random.Random(1)
+    workdir = tempfile.mkdtemp(prefix='history-')
+    path = os.path.join(workdir, 'weather_history.sqlite3')
+    history = WeatherHistory(path, batch_size=args.batch_size)
+    now = int(time.time())
+
+    started = time.perf_counter()
+    rows, record_seconds = await ingest(history, args, now, rng)
+    ingest_seconds = time.perf_counter() - started
+    size = sum(os.path.getsize(os.path.join(workdir, name))
+               for name in os.listdir(workdir))
+    print(f'Запись: {rows} наблюдений за {ingest_seconds:.1f} с, '
+          f'{rows / ingest_seconds:.0f} в секунду; record '
+          f'{record_seconds / rows * 10 ** 6:.2f} мкс в цикле событий; '
+          f'{size / rows:.1f} байт на наблюдение', flush=True)
+
+    query_ms = []
+    summary_ms = []
+    since = now - 30 * DAY_SECONDS
+    for _ in range(args.queries):
+        city_id = rng.randrange(args.cities)
+        query_started = time.perf_counter()
+        observations = await history.get_observations(city_id, since, now)
+        summary_started = time.perf_counter()
+        summarize_history(observations)
+        finished = time.perf_counter()
+        query_ms.append((summary_started - query_started) * 1000)
+        summary_ms.append((finished - summary_started) * 1000)
+    await history.close()
+    print(f'Чтение 30 дней города ({len(observations)} наблюдений): '
+          f'p50 {statistics.median(query_ms):.2f} мс, '
+          f'p95 {percentile(query_ms, 0.95):.2f} мс; сводка '
+          f'p50 {statistics.median(summary_ms):.2f} мс')
+
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+    return {
+        'config': vars(args),
+        'rows': rows,
+        'ingest_rows_per_second': round(rows / ingest_seconds),
+        'record_us': round(record_seconds / rows * 10 ** 6, 2),
+        'bytes_per_row': round(size / rows, 1),
+        'rows_per_query': len(observations),
+        'query_ms_p50': round(statistics.median(query_ms), 3),
+        'query_ms_p95': round(percentile(query_ms, 0.95), 3),
+        'summary_ms_p50': round(statistics.median(summary_ms), 3),
+    }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.history')
+    parser.add_argument('--cities', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--per-day', type=int, default=48,
+                        help='наблюдений города в сутки')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Измерение времени ответа на inline-запросы (@бот Москва).
+
+Запуск из корня проекта:
+
+    python -m loadtest.inline --queries 2000 --rate 200
+
+Запросы - начала названий городов из loadtest.scenarios длиной от двух
+букв до полного названия - поступают с частотой rate в секунду от
+разных пользователей и проходят через диспетчер бота. Время ответа
+считается от получения обновления до ответа заглушки Bot API
+на answerInlineQuery; задержка сети до Telegram задаётся отдельно
+и по умолчанию не учитывается. Первый проход идёт с пустым кэшем
+погоды, второй - теми же запросами с заполненным кэшем.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import typing
+from collections import Counter
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment, summarize
+from loadtest.scenarios import CITIES, UpdateFactory
+
+
+class InlineTelegramServer(FakeTelegramServer):
+    """Заглушка Bot API, запоминающая время кэширования и количество
+    карточек в ответах на inline-запросы.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.cache_times: Counter = Counter()
+        self.results: typing.List[int] = []
+
+    def _result(self, method: str, data) -> typing.Any:
+        if method == 'answerInlineQuery':
+            self.cache_times[int(data.get('cache_time', 0))] += 1
+            self.results.append(len(json.loads(data.get('results', '[]'))))
+        return super()._result(method, data)
+
+
+def build_queries(rng: random.Random, count: int) -> typing.List[str]:
+    """Функция, возвращающая начала названий городов случайной длины."""
+    queries = []
+    for _ in range(count):
+        city = rng.choice(CITIES)
+        queries.append(city[:rng.randint(2, len(city))])
+    return queries
+
+
+async def run_pass(dispatcher, factory: UpdateFactory,
+                   queries: typing.List[str], rate: float,
+                   rng: random.Random) -> typing.List[float]:
+    """Функция прохода по запросам с заданной частотой; возвращает
+    время ответа на каждый запрос.
+    """
+    durations = []
+
+    async def answer(update) -> None:
+        started = time.perf_counter()
+        await dispatcher.process_update(update)
+        durations.append(time.perf_counter() - started)
+
+    tasks = []
+    started = time.perf_counter()
+    for number, query in enumerate(queries):
+        delay = started + number / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = factory.inline_query(rng.randint(1, 10 ** 6), query)
+        tasks.append(asyncio.ensure_future(answer(update)))
+    await asyncio.gather(*tasks)
+    return durations
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    config = LoadTestConfig(telegram_latency=args.telegram_latency,
+                            weather_latency=args.weather_latency)
+    telegram = InlineTelegramServer(latency=config.telegram_latency,
+                                    seed=config.seed)
+    weather = FakeWeatherServer(latency=config.weather_latency,
+                                seed=config.seed)
+    configure_environment(config, await telegram.start(),
+                          await weather.start())
+
+    import handlers  # noqa: F401 - регистрирует обработчики
+    from aiogram import Bot, Dispatcher
+    from bot import bot, dp
+    from weather.weather_service import close_session
+
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+
+    factory = UpdateFactory()
+    rng = random.Random(config.seed)
+    queries = build_queries(rng, args.queries)
+    result: typing.Dict[str, typing.Any] = {'config': vars(args)}
+    for name in ('cold', 'warm'):
+        telegram.cache_times.clear()
+        telegram.results.clear()
+        durations = await run_pass(dp, factory, queries, args.rate, rng)
+        # Погода, не успевшая к ответу, догружается в кэш в фоне.
+        await asyncio.sleep(config.weather_latency * 2)
+        latency = summarize(durations)
+        partial = sum(count for cache_time, count
+                      in telegram.cache_times.items()
+                      if cache_time != handlers.INLINE_CACHE_TIME)
+        result[name] = {
+            'latency': latency,
+            'partial_answers': partial,
+            'mean_results': round(sum(telegram.results)
+                                  / max(1, len(telegram.results)), 2),
+        }
+        print(f'{name:>4}: p50 {latency["p50_ms"]} мс, '
+              f'p95 {latency["p95_ms"]} мс, p99 {latency["p99_ms"]} мс, '
+              f'неполных ответов {partial} из {latency["count"]}, '
+              f'карточек в ответе {result[name]["mean_results"]}',
+              flush=True)
+    result['upstream_calls'] = weather.stats()['weather']['calls']
+
+    await (await bot.get_session()).close()
+    await close_session()
+    await telegram.stop()
+    await weather.stop()
+    return result
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.inline')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200,
+                        help='inline-запросов в секунду')
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--weather-latency', type=float, default=0.1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Измерение задержек событийного цикла при интенсивной записи лога.
+
+Запуск из корня проекта:
+
+    python -m loadtest.logs --rate 20000 --flush-latency 0.2
+
+Задачи-обработчики пишут записи уровня DEBUG с аргументами пачками,
+в сумме около rate записей в секунду, а отдельная задача засыпает на interval
+миллисекунд и считает, насколько позже она просыпается: это и есть
+простой цикла. Сравниваются синхронный RotatingFileHandler в потоке
+цикла, как было раньше, и очередь с фоновым потоком из logger.py.
+Параметр flush_latency имитирует медленный диск: каждый сброс буфера
+файла занимает столько миллисекунд.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import typing
+from logging.handlers import RotatingFileHandler
+
+from loadtest.runner import LoadTestConfig, configure_environment, summarize
+
+
+class SlowStream:
+    """Обёртка над файлом, задерживающая сброс буфера на диск."""
+
+    def __init__(self, stream: typing.IO, latency: float) -> None:
+        self.stream = stream
+        self.latency = latency
+
+    def flush(self) -> None:
+        self.stream.flush()
+        time.sleep(self.latency)
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self.stream, name)
+
+
+async def monitor(interval: float, lags: typing.List[float],
+                  done: asyncio.Event) -> None:
+    """Функция, измеряющая опоздание пробуждения событийного цикла."""
+    while not done.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def write_records(log: logging.Logger, records: int, workers: int,
+                        batch: int, rate: float) -> None:
+    pause = workers * batch / rate
+
+    async def worker(number: int) -> None:
+        for first in range(number * batch, records, workers * batch):
+            for index in range(first, min(first + batch, records)):
+                log.debug('Погода в городе %s: %s °C, обновление %s',
+                          'Москва', index % 40 - 10, index)
+            await asyncio.sleep(pause)
+
+    await asyncio.gather(*(worker(number) for number in range(workers)))
+
+
+async def measure(log: logging.Logger,
+                  args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    lags = []
+    done = asyncio.Event()
+    watcher = asyncio.create_task(monitor(args.interval / 1000, lags, done))
+    await asyncio.sleep(args.interval / 1000)
+    started = time.perf_counter()
+    await write_records(log, args.records, args.workers, args.batch,
+                        args.rate)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await watcher
+    return {'records_per_second': round(args.records / elapsed),
+            'elapsed_s': round(elapsed, 3),
+            'loop_lag': summarize(lags)}
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    os.environ['LOG_LEVEL'] = 'DEBUG'
+    configure_environment(LoadTestConfig(), '', '')
+    from logger import handler, listener, logger
+    from settings import settings
+
+    sync_handler = RotatingFileHandler(
+        os.path.join(os.path.dirname(settings.log_file), 'sync.log'),
+        encoding='UTF-8', maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+    )
+    sync_handler.setFormatter(handler.formatter)
+    sync_logger = logging.getLogger('loadtest.sync')
+    sync_logger.setLevel(logging.DEBUG)
+    sync_logger.propagate = False
+    sync_logger.addHandler(sync_handler)
+    if args.flush_latency:
+        for file_handler in (sync_handler, handler):
+            file_handler.stream = SlowStream(file_handler.stream,
+                                             args.flush_latency / 1000)
+
+    result = {}
+    for mode, log in (('sync_file_handler', sync_logger),
+                      ('queue_handler', logger)):
+        result[mode] = await measure(log, args)
+        lag = result[mode]['loop_lag']
+        print(f'{mode:>17}: {result[mode]["records_per_second"]:>7} '
+              f'записей/с, опоздание цикла p50 {lag["p50_ms"]} мс, '
+              f'p99 {lag["p99_ms"]} мс, max {lag["max_ms"]} мс',
+              flush=True)
+
+    # Записи очереди дописываются на диск уже после замера.
+    started = time.perf_counter()
+    listener.stop()
+    result['queue_handler']['drain_s'] = round(time.perf_counter() - started,
+                                               3)
+    print(f'Фоновый поток дописал очередь за '
+          f'{result["queue_handler"]["drain_s"]} с', flush=True)
+    sync_handler.close()
+    return {'config': vars(args), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.logs')
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=20000,
+                        help='записей лога в секунду')
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=10,
+                        help='записей между уступками циклу')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='период проверки цикла в миллисекундах')
+    parser.add_argument('--flush-latency', type=float, default=0.0,
+                        help='задержка сброса файла в миллисекундах')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
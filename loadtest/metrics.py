@@ -0,0 +1,149 @@
+"""Измерение накладных расходов метрик на горячем пути.
+
+Запуск из корня проекта:
+
+    python -m loadtest.metrics --updates 20000
+
+Отдельно измеряется время одного вызова Counter.inc, Histogram.observe
+и Histogram.time, затем обработка обновлений диспетчером с простым
+обработчиком, читающим состояние FSM: без метрик, только
+с MeteredStorage и с MetricsMiddleware и MeteredStorage, как в боте.
+Разница на обновление и есть стоимость метрик для каждого сообщения. В конце измеряется выгрузка /metrics.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import timeit
+import typing
+
+from aiogram import Dispatcher
+
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import UpdateFactory
+
+
+def measure_call(statement: typing.Callable[[], typing.Any],
+                 number: int) -> float:
+    """Функция, возвращающая лучшее из пяти время вызова в наносекундах."""
+    return min(timeit.repeat(statement, number=number, repeat=5)) \
+        / number * 10 ** 9
+
+
+async def measure_dispatch(dispatcher, updates: typing.List) -> float:
+    """Функция, возвращающая время обработки одного обновления
+    в микросекундах.
+    """
+    Dispatcher.set_current(dispatcher)
+    started = time.perf_counter()
+    for update in updates:
+        await dispatcher.process_update(update)
+    return (time.perf_counter() - started) / len(updates) * 10 ** 6
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from aiogram import Bot, types
+    from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+    from fsm_storage import MeteredStorage
+    from metrics import Counter, Histogram, registry
+    from middlewares import MetricsMiddleware
+
+    counter = Counter('loadtest_total', 'Счётчик', ('handler',))
+    histogram = Histogram('loadtest_seconds', 'Гистограмма', ('handler',))
+
+    def timed_block() -> None:
+        with histogram.time('start'):
+            pass
+
+    calls_ns = {
+        'counter_inc': measure_call(lambda: counter.inc('start'),
+                                    args.calls),
+        'histogram_observe': measure_call(
+            lambda: histogram.observe(0.03, 'start'), args.calls
+        ),
+        'histogram_time': measure_call(timed_block, args.calls),
+    }
+    for name, value in calls_ns.items():
+        print(f'{name:>18}: {value:.0f} нс', flush=True)
+
+    bot = Bot(token='123456:loadtest')
+    Bot.set_current(bot)
+
+    async def handle_text(message: types.Message) -> None:
+        pass
+
+    def create_dispatcher(metered_storage: bool,
+                          middleware: bool) -> Dispatcher:
+        storage = MemoryStorage()
+        dispatcher = Dispatcher(
+            bot, storage=MeteredStorage(storage) if metered_storage
+            else storage
+        )
+        if middleware:
+            dispatcher.middleware.setup(MetricsMiddleware())
+        # Фильтр состояния по умолчанию читает состояние из хранилища,
+        # как у обработчиков бота.
+        dispatcher.register_message_handler(handle_text)
+        return dispatcher
+
+    factory = UpdateFactory()
+    updates = [factory.text(user_id % args.users + 1, 'Москва')
+               for user_id in range(args.updates)]
+    dispatchers = {
+        'without_metrics': create_dispatcher(False, False),
+        'metered_storage': create_dispatcher(True, False),
+        'with_metrics': create_dispatcher(True, True),
+    }
+    # Режимы чередуются в каждом повторе, чтобы фоновая нагрузка
+    # на машину сказывалась на них одинаково; берётся лучший повтор.
+    dispatch_us = {mode: float('inf') for mode in dispatchers}
+    for _ in range(args.repeat):
+        for mode, dispatcher in dispatchers.items():
+            dispatch_us[mode] = min(
+                dispatch_us[mode],
+                await measure_dispatch(dispatcher, updates)
+            )
+    for mode, value in dispatch_us.items():
+        dispatch_us[mode] = round(value, 2)
+        print(f'{mode:>18}: {dispatch_us[mode]} мкс на обновление',
+              flush=True)
+    overhead = dispatch_us['with_metrics'] - dispatch_us['without_metrics']
+    print(f'Метрики добавляют {overhead:.2f} мкс на обновление '
+          f'({overhead / dispatch_us["without_metrics"]:.1%})', flush=True)
+
+    started = time.perf_counter()
+    text = registry.render()
+    render_ms = (time.perf_counter() - started) * 1000
+    print(f'Выгрузка /metrics: {render_ms:.2f} мс, '
+          f'{len(text.splitlines())} строк', flush=True)
+
+    return {
+        'config': vars(args),
+        'calls_ns': {name: round(value) for name, value in calls_ns.items()},
+        'dispatch_us': dispatch_us,
+        'overhead_us': round(overhead, 2),
+        'render_ms': round(render_ms, 2),
+    }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.metrics')
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--calls', type=int, default=200000,
+                        help='вызовов в одном замере метода метрики')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
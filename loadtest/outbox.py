@@ -0,0 +1,143 @@
+"""Измерение пропускной способности очереди исходящих вызовов Bot API
+на пределе ограничений Telegram.
+
+Запуск из корня проекта:
+
+    python -m loadtest.outbox --chats 1000 --replies 3 --global-limit 300
+
+Заглушка Bot API отвечает 429 на вызовы сверх global_limit в секунду
+на весь бот и chat_limit в секунду в один чат. В каждый из chats чатов
+сразу ставится replies ответов и удаление старого сообщения. Сначала
+вызовы отправляются напрямую, как до очереди, затем через Outbox
+с теми же ограничениями. Ответ считается потерянным, если его вызов
+завершился ошибкой. В обоих случаях одновременно идёт не больше
+concurrency вызовов.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import typing
+
+from loadtest.fake_servers import FakeTelegramServer
+from loadtest.runner import LoadTestConfig, configure_environment
+
+
+async def send_direct(bot, chats: typing.Sequence[int], replies: int,
+                      concurrency: int) -> typing.List:
+    """Функция отправки вызовов без очереди, как из обработчиков,
+    не больше concurrency одновременно.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def call(method: str, **params) -> typing.Any:
+        async with slots:
+            return await getattr(bot, method)(**params)
+
+    calls = []
+    for chat_id in chats:
+        calls.extend(call('send_message', chat_id=chat_id,
+                          text=f'Ответ {number}')
+                     for number in range(replies))
+        calls.append(call('delete_message', chat_id=chat_id, message_id=1))
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    # Удаления не ждут ответа, поэтому потерянными считаются только
+    # ответы пользователю.
+    return [result for index, result in enumerate(results)
+            if index % (replies + 1) != replies]
+
+
+async def send_outbox(outbox, chats: typing.Sequence[int],
+                      replies: int) -> typing.List:
+    """Функция отправки тех же вызовов через очередь."""
+    futures = []
+    for chat_id in chats:
+        futures.extend(outbox.submit(chat_id, 'send_message',
+                                     dict(chat_id=chat_id,
+                                          text=f'Ответ {number}'),
+                                     wait=True)
+                       for number in range(replies))
+        outbox.delete_message(chat_id, 1)
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    await outbox.stop()
+    return results
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer
+
+    from outbox import Outbox
+
+    runs = []
+    for run_number, mode in enumerate(('direct', 'outbox')):
+        telegram = FakeTelegramServer(latency=args.latency, seed=1,
+                                      global_limit=args.global_limit,
+                                      chat_limit=args.chat_limit)
+        url = await telegram.start()
+        bot = Bot(token='123456:loadtest',
+                  server=TelegramAPIServer.from_base(url))
+        chats = range(run_number * 10 ** 6 + 1,
+                      run_number * 10 ** 6 + args.chats + 1)
+        started = time.perf_counter()
+        if mode == 'direct':
+            results = await send_direct(bot, chats, args.replies,
+                                        args.concurrency)
+        else:
+            outbox = Outbox(bot, global_rate=args.global_limit,
+                            chat_rate=args.chat_limit,
+                            concurrency=args.concurrency)
+            outbox.start()
+            results = await send_outbox(outbox, chats, args.replies)
+        elapsed = time.perf_counter() - started
+        await (await bot.get_session()).close()
+        await telegram.stop()
+
+        stats = telegram.stats()
+        accepted = sum(endpoint['status'].get('200', 0)
+                       for endpoint in stats.values())
+        rejected = sum(endpoint['status'].get('429', 0)
+                       for endpoint in stats.values())
+        dropped = sum(isinstance(result, BaseException)
+                      for result in results)
+        runs.append({
+            'mode': mode,
+            'elapsed_s': round(elapsed, 2),
+            'calls_per_second': round(accepted / elapsed, 1),
+            'limit_usage': round(accepted / elapsed / args.global_limit, 3),
+            'replies': len(results),
+            'dropped_replies': dropped,
+            'retry_after_responses': rejected,
+        })
+        print(f'{mode:>6}: {runs[-1]["calls_per_second"]:>6} вызовов/с '
+              f'({runs[-1]["limit_usage"]:.0%} лимита) за '
+              f'{runs[-1]["elapsed_s"]} с, потеряно ответов {dropped} '
+              f'из {len(results)}, ответов 429: {rejected}', flush=True)
+    return {'config': vars(args), 'runs': runs}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.outbox')
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--replies', type=int, default=3,
+                        help='ответов в каждый чат')
+    parser.add_argument('--global-limit', type=int, default=300,
+                        help='вызовов в секунду на весь бот')
+    parser.add_argument('--chat-limit', type=int, default=1,
+                        help='вызовов в секунду в один чат')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.03,
+                        help='задержка ответа заглушки в секундах')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Измерение разбора ответа API текущей погоды и памяти на запись кэша.
+
+Запуск из корня проекта:
+
+    python -m loadtest.parsing --entries 20000
+
+Ответы строятся со всеми полями настоящего ответа OpenWeatherMap.
+Сравнивается прежний путь - декодирование текста через json,
+WeatherInformation с __dict__ и перевод из кельвинов через две
+сопрограммы - с текущим: декодирование байтов через json или orjson
+и сборка неизменяемого WeatherInformation за один вызов. Память
+считается для entries записей, которые остаются в кэше после разбора.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+import typing
+
+from loadtest.runner import LoadTestConfig, configure_environment
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ZERO_KELVIN = 273.15
+
+
+class LegacyWeatherInformation:
+    """WeatherInformation до перехода на кортеж."""
+
+    def __init__(self, name: str, temperature: float, status: str,
+                 city_id: typing.Optional[int] = None) -> None:
+        self.name = name
+        self.temperature = temperature
+        self.status = status
+        self.city_id = city_id
+
+
+async def convert_kelvin_to_celsius(temperature: float) -> float:
+    return round(temperature - ZERO_KELVIN, 1)
+
+
+async def convert_temperature(weather: LegacyWeatherInformation) -> None:
+    weather.temperature = await convert_kelvin_to_celsius(weather.temperature)
+
+
+async def get_legacy_weather(body: bytes) -> LegacyWeatherInformation:
+    """Функция прежнего разбора: response.json() и перевод температуры."""
+    data = json.loads(body.decode('UTF-8'))
+    weather = LegacyWeatherInformation(data['name'], data['main']['temp'],
+                                       data['weather'][0]['description'],
+                                       data.get('id'))
+    await convert_temperature(weather)
+    return weather
+
+
+def build_weather_body(rng: random.Random, city_id: int,
+                       kelvin: bool) -> bytes:
+    """Функция ответа API текущей погоды со всеми полями."""
+    temperature = round(rng.uniform(-20, 30) + (ZERO_KELVIN if kelvin else 0),
+                        2)
+    now = int(time.time())
+    return json.dumps({
+        'coord': {'lon': 37.62, 'lat': 55.75},
+        'weather': [{'id': 803, 'main': 'Clouds',
+                     'description': 'облачно с прояснениями',
+                     'icon': '04d'}],
+        'base': 'stations',
+        'main': {'temp': temperature, 'feels_like': temperature - 2,
+                 'temp_min': temperature - 1, 'temp_max': temperature + 1,
+                 'pressure': rng.randint(980, 1040),
+                 'humidity': rng.randint(20, 100),
+                 'sea_level': 1012, 'grnd_level': 993},
+        'visibility': 10000,
+        'wind': {'speed': round(rng.uniform(0, 15), 2),
+                 'deg': rng.randint(0, 359),
+                 'gust': round(rng.uniform(0, 20), 2)},
+        'clouds': {'all': rng.randint(0, 100)},
+        'dt': now,
+        'sys': {'type': 2, 'id': 2000314, 'country': 'RU',
+                'sunrise': now - 20000, 'sunset': now + 20000},
+        'timezone': 10800, 'id': city_id, 'name': f'Город {city_id}',
+        'cod': 200,
+    }, ensure_ascii=False).encode()
+
+
+def measure_memory(build: typing.Callable[[bytes], typing.Any],
+                   bodies: typing.List[bytes]) -> float:
+    """Функция, возвращающая память на одну запись в байтах."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entries = [build(body) for body in bodies]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del entries
+    return used / len(bodies)
+
+
+def measure_parse(parse: typing.Callable[[bytes], typing.Any],
+                  bodies: typing.List[bytes]) -> float:
+    """Функция, возвращающая время разбора одного ответа в микросекундах."""
+    started = time.perf_counter()
+    for body in bodies:
+        parse(body)
+    return (time.perf_counter() - started) / len(bodies) * 10 ** 6
+
+
+def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from weather.weather_service import get_weather_from_response
+
+    rng = random.Random(args.seed)
+    legacy_bodies = [build_weather_body(rng, city_id, kelvin=True)
+                     for city_id in range(args.entries)]
+    bodies = [build_weather_body(rng, city_id, kelvin=False)
+              for city_id in range(args.entries)]
+    loop = asyncio.new_event_loop()
+
+    def parse_legacy(body: bytes) -> LegacyWeatherInformation:
+        return loop.run_until_complete(get_legacy_weather(body))
+
+    async def parse_legacy_all(sample: typing.List[bytes]) -> float:
+        # Прежний разбор выполнялся в сопрограмме обработчика, поэтому
+        # и замеряется внутри одной сопрограммы.
+        started = time.perf_counter()
+        for body in sample:
+            await get_legacy_weather(body)
+        return (time.perf_counter() - started) / len(sample) * 10 ** 6
+
+    parsers = {
+        'legacy': (parse_legacy, legacy_bodies),
+        'json': (lambda body: get_weather_from_response(json.loads(body)),
+                 bodies),
+    }
+    if orjson is not None:
+        parsers['orjson'] = (
+            lambda body: get_weather_from_response(orjson.loads(body)),
+            bodies
+        )
+
+    result = {}
+    for name, (parse, sample) in parsers.items():
+        # Лучший из пяти повторов: машина может быть занята другим.
+        if name == 'legacy':
+            parse_us = min(loop.run_until_complete(parse_legacy_all(sample))
+                           for _ in range(5))
+        else:
+            parse_us = min(measure_parse(parse, sample) for _ in range(5))
+        result[name] = {
+            'parse_us': round(parse_us, 2),
+            'bytes_per_entry': round(measure_memory(parse, sample)),
+        }
+        print(f'{name:>6}: разбор {result[name]["parse_us"]} мкс, '
+              f'{result[name]["bytes_per_entry"]} байт на запись',
+              flush=True)
+    loop.close()
+    return {'config': vars(args), 'body_bytes': len(bodies[0]), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.parsing')
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Измерение пропускной способности приёма обновлений через getUpdates
+в зависимости от количества обработчиков.
+
+Запуск из корня проекта:
+
+    python -m loadtest.polling --updates 3000 --workers 1,4,16,64
+
+Заглушка Bot API отдаёт заранее подготовленные обновления сценариев
+из loadtest.scenarios, перемешанные между чатами. Для каждого
+количества обработчиков измеряется время обработки всех обновлений,
+проверяется порядок обработки внутри чатов и подтверждение смещения.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import typing
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import FLOWS, UpdateFactory
+
+
+def build_updates(factory: UpdateFactory, chats: typing.Sequence[int],
+                  count: int, rng: random.Random) -> typing.List[typing.Dict]:
+    """Функция подготовки обновлений сценариев, чередующихся по чатам.
+
+    Номера обновлений выдаются заново в порядке поступления.
+    """
+    by_chat = {chat_id: [] for chat_id in chats}
+    flows = list(FLOWS)
+    while sum(len(updates) for updates in by_chat.values()) < count:
+        for chat_id in chats:
+            flow = FLOWS[rng.choice(flows)]
+            by_chat[chat_id].extend(update
+                                    for _, update in flow(factory, chat_id,
+                                                          rng))
+    updates = []
+    for step in range(max(len(items) for items in by_chat.values())):
+        for chat_id in chats:
+            if step < len(by_chat[chat_id]) and len(updates) < count:
+                update = by_chat[chat_id][step].to_python()
+                updates.append(update)
+    for update_id, update in enumerate(updates, 1):
+        update['update_id'] = update_id
+    return updates
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    config = LoadTestConfig(telegram_latency=args.telegram_latency,
+                            weather_latency=args.weather_latency,
+                            outbox_concurrency=args.outbox_concurrency)
+    telegram = FakeTelegramServer(latency=config.telegram_latency,
+                                  seed=config.seed)
+    weather = FakeWeatherServer(latency=config.weather_latency,
+                                seed=config.seed)
+    configure_environment(config, await telegram.start(),
+                          await weather.start())
+
+    import handlers  # noqa: F401 - регистрирует обработчики
+    from aiogram import Bot, Dispatcher
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+    from bot import bot, dp, outbox
+    from polling import Poller
+    from update_pool import UpdatePool, get_update_chat_id
+
+    class OrderCheckMiddleware(BaseMiddleware):
+        """Проверка, что обновления чата обрабатываются по порядку."""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.last: typing.Dict[int, int] = {}
+            self.violations = 0
+
+        async def on_pre_process_update(self, update, data: dict) -> None:
+            chat_id = get_update_chat_id(update)
+            if self.last.get(chat_id, -1) > update.update_id:
+                self.violations += 1
+            self.last[chat_id] = update.update_id
+
+    order_check = OrderCheckMiddleware()
+    dp.middleware.setup(order_check)
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+    outbox.start()
+
+    factory = UpdateFactory()
+    rng = random.Random(config.seed)
+    runs = []
+    for run_number, workers in enumerate(args.workers, 1):
+        chats = range(run_number * 10 ** 6,
+                      run_number * 10 ** 6 + args.chats)
+        updates = build_updates(factory, chats, args.updates, rng)
+        order_check.violations = 0
+        pool = UpdatePool(dp, workers=workers, queue_size=args.queue_size)
+        poller = Poller(bot, pool, limit=args.limit, timeout=1)
+
+        started = time.perf_counter()
+        telegram.add_updates(updates)
+        task = asyncio.ensure_future(poller.run())
+        while pool.processed < len(updates) and not task.done():
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        poller.stop_polling()
+        await task
+
+        runs.append({
+            'workers': workers,
+            'updates': pool.processed,
+            'seconds': round(elapsed, 3),
+            'updates_per_second': round(pool.processed / elapsed, 1),
+            'duplicates': poller.duplicates,
+            'order_violations': order_check.violations,
+            'committed': telegram.confirmed_update_id
+            == updates[-1]['update_id'],
+        })
+        print(f'workers={workers:>4}: {runs[-1]["updates_per_second"]:>8} '
+              f'обновлений/с, повторов {poller.duplicates}, '
+              f'нарушений порядка {order_check.violations}, '
+              f'смещение подтверждено: {runs[-1]["committed"]}')
+
+    await outbox.stop()
+    await telegram.stop()
+    await weather.stop()
+    return {'config': vars(args), 'runs': runs}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.polling')
+    parser.add_argument('--updates', type=int, default=3000)
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--workers', default='1,4,16,64',
+                        type=lambda value: [int(item)
+                                            for item in value.split(',')])
+    parser.add_argument('--limit', type=int, default=100,
+                        help='размер пачки getUpdates')
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--weather-latency', type=float, default=0.1)
+    parser.add_argument('--outbox-concurrency', type=int, default=256)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
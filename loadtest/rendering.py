@@ -0,0 +1,137 @@
+"""Измерение построения ответа с погодой и советом.
+
+Запуск из корня проекта:
+
+    python -m loadtest.rendering --replies 100000 --cities 200
+
+Ответы строятся для replies запросов пользователей к cities городам
+с одним текущим наблюдением на город, как между обновлениями кэша
+погоды. Сравнивается прежний путь - шаблон и советы через сопрограммы
+и линейный поиск по температурам - с render_weather_reply без
+запоминания и с ним.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import typing
+
+from loadtest.runner import LoadTestConfig, configure_environment
+
+STATUSES = ('ясно', 'облачно с прояснениями', 'небольшой дождь',
+            'пасмурно', 'снег')
+
+
+def build_legacy_reply(temperatures_list: typing.List,
+                       messages: typing.Dict) -> typing.Callable:
+    """Функция, возвращающая прежнее построение ответа."""
+    async def get_message(message_key: str) -> str:
+        return messages[message_key]
+
+    async def get_temperature_hint(temperature: float) -> str:
+        for example_temperature, hint in temperatures_list:
+            if temperature < example_temperature:
+                return hint
+        return 'Друже, тут я могу только посочувствовать.'
+
+    async def get_rain_hint(weather_status: str) -> str:
+        if 'дожд' in weather_status:
+            return '☔️ Возьмите с собой зонт.'
+        return ''
+
+    async def get_hint(weather) -> str:
+        return (f'{await get_temperature_hint(weather.temperature)}\n'
+                f'{await get_rain_hint(weather.status)}')
+
+    async def build_reply(city: str, weather) -> str:
+        return (await get_message('weather_in_city_message')).format(
+            city, weather.status, weather.temperature
+        ) + '\n\n' + await get_hint(weather)
+
+    return build_reply
+
+
+async def measure_async(build: typing.Callable,
+                        requests: typing.List) -> float:
+    started = time.perf_counter()
+    for city, weather in requests:
+        await build(city, weather)
+    return (time.perf_counter() - started) / len(requests) * 10 ** 6
+
+
+def measure(build: typing.Callable, requests: typing.List) -> float:
+    started = time.perf_counter()
+    for city, weather in requests:
+        build(city, weather)
+    return (time.perf_counter() - started) / len(requests) * 10 ** 6
+
+
+def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from weather.weather_hints import temperatures_list
+    from weather.weather_messages import MESSAGES, render_weather_reply
+    from weather.weather_service import WeatherInformation
+
+    rng = random.Random(args.seed)
+    observations = [
+        (f'Город {number}', WeatherInformation(
+            f'Город {number}', round(rng.uniform(-25, 35), 1),
+            rng.choice(STATUSES), number
+        )) for number in range(args.cities)
+    ]
+    requests = [rng.choice(observations) for _ in range(args.replies)]
+
+    legacy_reply = build_legacy_reply(temperatures_list, MESSAGES)
+    uncached_reply = render_weather_reply.__wrapped__
+
+    def cached_reply(city: str, weather) -> str:
+        return render_weather_reply('weather_in_city_message', city, weather)
+
+    def plain_reply(city: str, weather) -> str:
+        return uncached_reply('weather_in_city_message', city, weather)
+
+    for city, weather in observations:
+        assert (asyncio.run(legacy_reply(city, weather))
+                == plain_reply(city, weather))
+
+    # Лучший из пяти повторов; кэш ответов очищается перед каждым, чтобы
+    # первое обращение к городу строило ответ заново.
+    result = {'legacy_us': float('inf'), 'uncached_us': float('inf'),
+              'cached_us': float('inf')}
+    loop = asyncio.new_event_loop()
+    for _ in range(5):
+        result['legacy_us'] = min(result['legacy_us'], loop.run_until_complete(
+            measure_async(legacy_reply, requests)
+        ))
+        result['uncached_us'] = min(result['uncached_us'],
+                                    measure(plain_reply, requests))
+        render_weather_reply.cache_clear()
+        result['cached_us'] = min(result['cached_us'],
+                                  measure(cached_reply, requests))
+    loop.close()
+    for name in result:
+        result[name] = round(result[name], 3)
+    print(f'На ответ: прежний путь {result["legacy_us"]} мкс, '
+          f'render_weather_reply без запоминания {result["uncached_us"]} '
+          f'мкс, с запоминанием {result["cached_us"]} мкс', flush=True)
+    return {'config': vars(args), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.rendering')
+    parser.add_argument('--replies', type=int, default=100000)
+    parser.add_argument('--cities', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Runner"""
+import asyncio
+import atexit
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import typing
+from collections import Counter
+from datetime import datetime, timezone
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.scenarios import FLOWS, UpdateFactory
+
+# Версия формата результатов; меняется при несовместимых изменениях.
+RESULT_VERSION = 1
+# Показатели, которые сравниваются с предыдущим прогоном:
+# путь в результатах и признак того, что больше - лучше.
+COMPARED_METRICS = (
+    (('throughput', 'updates_per_second'), True),
+    (('throughput', 'flows_per_second'), True),
+    (('latency', 'update', 'p50_ms'), False),
+    (('latency', 'update', 'p95_ms'), False),
+    (('latency', 'update', 'p99_ms'), False),
+    (('latency', 'flow', 'p95_ms'), False),
+    (('errors', 'total'), False),
+    (('memory', 'peak_rss_mb'), False),
+)
+
+
+class LoadTestConfig(typing.NamedTuple):
+    """Параметры нагрузочного прогона."""
+    users: int = 100
+    duration: float = 30.0
+    # Относительные веса сценариев из FLOWS.
+    mix: typing.Dict[str, float] = {'city': 6, 'location': 3, 'cancel': 1}
+    seed: int = 1
+    telegram_latency: float = 0.05
+    telegram_error_rate: float = 0.0
+    telegram_retry_after_rate: float = 0.0
+    weather_latency: float = 0.1
+    weather_error_rate: float = 0.0
+    weather_retry_after_rate: float = 0.0
+    # Ограничения бота на отправку сообщений и запросы к API погоды.
+    global_rate: float = 1000.0
+    chat_rate: float = 100.0
+    weather_rate: float = 1000.0
+    # Ограничение частоты обновлений одного пользователя.
+    throttle_rate: float = 1000.0
+    # OUTBOX_CONCURRENCY; по умолчанию - значение из настроек бота.
+    outbox_concurrency: typing.Optional[int] = None
+
+
+def percentile(sorted_values: typing.Sequence[float],
+               fraction: float) -> float:
+    """Функция перцентиля по ближайшему рангу."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1,
+                      round(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(durations: typing.List[float]) -> typing.Dict[str, float]:
+    """Функция сводки длительностей в миллисекундах."""
+    values = sorted(durations)
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3)
+        if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def get_rss_mb() -> typing.Optional[float]:
+    """Функция, возвращающая текущий объём резидентной памяти процесса."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+
+
+def get_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS значение в байтах, в Linux - в килобайтах.
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+class Recorder:
+    """Сборщик длительностей шагов и сценариев и ошибок."""
+
+    def __init__(self) -> None:
+        self.steps: typing.Dict[str, typing.List[float]] = {}
+        self.flows: typing.Dict[str, typing.List[float]] = {}
+        self.errors: Counter = Counter()
+        self.failed_flows: Counter = Counter()
+
+    def step(self, name: str, duration: float) -> None:
+        self.steps.setdefault(name, []).append(duration)
+
+    def flow(self, name: str, duration: float) -> None:
+        self.flows.setdefault(name, []).append(duration)
+
+    def error(self, flow: str, step: str, error: Exception) -> None:
+        self.errors[f'{step}: {type(error).__name__}'] += 1
+        self.failed_flows[flow] += 1
+
+
+def configure_environment(config: LoadTestConfig, telegram_url: str,
+                          weather_url: str) -> None:
+    """Функция настройки бота на локальные заглушки через переменные
+    окружения; вызывается до импорта модулей бота.
+
+    Файлы бота (лог, подписки, SQLite) пишутся во временный каталог,
+    который удаляется при выходе.
+    """
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    # Регистрируется раньше остановки логгера и выполнится после неё.
+    atexit.register(shutil.rmtree, workdir, True)
+    os.environ.update({
+        'API_TOKEN': '123456:loadtest',
+        'TELEGRAM_API_URL': telegram_url,
+        'WEATHER_API_URL': weather_url,
+        'WEATHER_API_KEY': 'loadtest',
+        'WEATHER_CACHE_BACKEND': '',
+        'LOG_FILE': os.path.join(workdir, 'bot.log'),
+        'SUBSCRIPTIONS_PATH': os.path.join(workdir, 'subscriptions.sqlite3'),
+        'FSM_SQLITE_PATH': os.path.join(workdir, 'fsm.sqlite3'),
+        'CITY_IDS_PATH': os.path.join(workdir, 'city_ids.json'),
+        'WEATHER_HISTORY_PATH': os.path.join(workdir,
+                                             'weather_history.sqlite3'),
+        'OUTBOX_GLOBAL_RATE': str(config.global_rate),
+        'OUTBOX_CHAT_RATE': str(config.chat_rate),
+        'WEATHER_RATE_PER_SECOND': str(config.weather_rate),
+        'WEATHER_RATE_BURST': str(config.weather_rate),
+        'THROTTLE_RATE': str(config.throttle_rate),
+        'THROTTLE_BURST': str(config.throttle_rate),
+    })
+    if config.outbox_concurrency is not None:
+        os.environ['OUTBOX_CONCURRENCY'] = str(config.outbox_concurrency)
+
+
+async def run_user(dispatcher, user_id: int, deadline: float,
+                   rng: random.Random, factory: UpdateFactory,
+                   recorder: Recorder,
+                   mix: typing.Dict[str, float]) -> None:
+    """Функция виртуального пользователя: проходит случайные сценарии,
+    дожидаясь обработки каждого обновления, до наступления deadline.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        flow = rng.choices(names, weights)[0]
+        flow_started = time.perf_counter()
+        for step, update in FLOWS[flow](factory, user_id, rng):
+            started = time.perf_counter()
+            try:
+                # Как и в боте, каждое обновление обрабатывается отдельной
+                # задачей со своей копией контекста.
+                await asyncio.ensure_future(dispatcher.process_update(update))
+            except Exception as error:
+                recorder.error(flow, step, error)
+                await dispatcher.storage.finish(chat=user_id, user=user_id)
+                break
+            recorder.step(step, time.perf_counter() - started)
+        else:
+            recorder.flow(flow, time.perf_counter() - flow_started)
+
+
+async def run_load(config: LoadTestConfig) -> typing.Dict[str, typing.Any]:
+    """Функция нагрузочного прогона настоящего диспетчера бота
+    против локальных заглушек Bot API и API погоды.
+
+    Модули бота настраиваются при импорте, поэтому в одном процессе
+    возможен только один прогон.
+    """
+    if 'bot' in sys.modules:
+        raise RuntimeError('Модули бота уже импортированы, '
+                           'запустите прогон в отдельном процессе')
+    unknown = set(config.mix) - set(FLOWS)
+    if unknown:
+        raise ValueError(f'Неизвестные сценарии: {", ".join(unknown)}')
+
+    telegram = FakeTelegramServer(
+        latency=config.telegram_latency,
+        error_rate=config.telegram_error_rate,
+        retry_after_rate=config.telegram_retry_after_rate,
+        seed=config.seed,
+    )
+    weather = FakeWeatherServer(
+        latency=config.weather_latency,
+        error_rate=config.weather_error_rate,
+        retry_after_rate=config.weather_retry_after_rate,
+        seed=config.seed,
+    )
+    configure_environment(config, await telegram.start(),
+                          await weather.start())
+
+    # Импорт после настройки окружения: модули читают его при загрузке.
+    import handlers  # noqa: F401 - регистрирует обработчики
+    from aiogram import Bot, Dispatcher
+    from bot import bot, dp, outbox
+    from subscriptions import subscription_scheduler
+    from weather.weather_service import (close_session, get_upstream_stats,
+                                         weather_cache)
+
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+    outbox.start()
+
+    recorder = Recorder()
+    factory = UpdateFactory()
+    rss_start = get_rss_mb()
+    started = time.perf_counter()
+    deadline = time.monotonic() + config.duration
+    await asyncio.gather(*(
+        run_user(dp, user_id, deadline,
+                 random.Random(config.seed * 1000003 + user_id), factory,
+                 recorder, config.mix)
+        for user_id in range(1, config.users + 1)
+    ))
+    elapsed = time.perf_counter() - started
+    rss_end = get_rss_mb()
+
+    await outbox.stop()
+    await subscription_scheduler.stop()
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+    await close_session()
+    await (await bot.get_session()).close()
+    await telegram.stop()
+    await weather.stop()
+
+    updates = [duration for durations in recorder.steps.values()
+               for duration in durations]
+    flows = [duration for durations in recorder.flows.values()
+             for duration in durations]
+    return {
+        'version': RESULT_VERSION,
+        'started_at': datetime.now(timezone.utc).isoformat(
+            timespec='seconds'),
+        'python': platform.python_version(),
+        'config': config._asdict(),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput': {
+            'updates_per_second': round(len(updates) / elapsed, 1),
+            'flows_per_second': round(len(flows) / elapsed, 1),
+        },
+        'latency': {
+            'update': summarize(updates),
+            'flow': summarize(flows),
+            'steps': {name: summarize(durations)
+                      for name, durations in sorted(recorder.steps.items())},
+            'flows': {name: summarize(durations)
+                      for name, durations in sorted(recorder.flows.items())},
+        },
+        'errors': {
+            'total': sum(recorder.errors.values()),
+            'by_step': dict(recorder.errors),
+            'failed_flows': dict(recorder.failed_flows),
+        },
+        'upstream': {
+            'telegram': telegram.stats(),
+            'weather': weather.stats(),
+        },
+        'bot': {
+            'outbox_sent': outbox.sent,
+            'outbox_coalesced': outbox.coalesced,
+            'weather_cache': weather_cache.stats(),
+            'weather_protection': get_upstream_stats(),
+        },
+        'memory': {
+            'rss_start_mb': rss_start,
+            'rss_end_mb': rss_end,
+            'peak_rss_mb': get_peak_rss_mb(),
+        },
+    }
+
+
+def compare(result: typing.Dict, baseline: typing.Dict) -> typing.List[str]:
+    """Функция сравнения ключевых показателей с предыдущим прогоном."""
+    lines = []
+    for path, higher_is_better in COMPARED_METRICS:
+        current, previous = result, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if current is None or previous is None:
+            continue
+        change = ''
+        if previous:
+            delta = (current - previous) / previous * 100
+            better = (delta > 0) == higher_is_better
+            change = f' ({delta:+.1f}%{"" if better or not delta else " !"})'
+        lines.append(f'{".".join(path)}: {previous} -> {current}{change}')
+    return lines
@@ -0,0 +1,133 @@
+"""Scenarios"""
+import itertools
+import random
+import time
+import typing
+
+from aiogram import types
+
+# Города из справочника и несколько названий не из него: для них бот
+# обращается к API по названию.
+CITIES = ('Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург',
+          'Казань', 'Нижний Новгород', 'Самара', 'Омск', 'Ростов-на-Дону',
+          'Уфа', 'Пермь', 'Воронеж', 'Волгоград', 'Тверь', 'Сочи')
+# Границы, внутри которых выбираются случайные геолокации.
+LATITUDES = (43.0, 68.0)
+LONGITUDES = (28.0, 135.0)
+
+Step = typing.Tuple[str, types.Update]
+
+
+class UpdateFactory:
+    """Построитель обновлений Telegram от имени виртуальных
+    пользователей; чат пользователя совпадает с его идентификатором.
+    """
+
+    def __init__(self) -> None:
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields) -> types.Update:
+        return types.Update(**{
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'from': {'id': user_id, 'is_bot': False,
+                         'first_name': 'Load', 'language_code': 'ru'},
+                'chat': {'id': user_id, 'type': 'private'},
+                **fields,
+            },
+        })
+
+    def command(self, user_id: int, command: str) -> types.Update:
+        return self._message(user_id, text=command, entities=[
+            {'type': 'bot_command', 'offset': 0, 'length': len(command)}
+        ])
+
+    def text(self, user_id: int, text: str) -> types.Update:
+        return self._message(user_id, text=text)
+
+    def location(self, user_id: int, latitude: float,
+                 longitude: float) -> types.Update:
+        return self._message(user_id, location={'latitude': latitude,
+                                                'longitude': longitude})
+
+    def bot_message_id(self) -> int:
+        """Метод, выдающий номер сообщения бота с кнопками."""
+        return next(self._message_ids)
+
+    def callback(self, user_id: int, data: str,
+                 message_id: int) -> types.Update:
+        update_id = next(self._update_ids)
+        return types.Update(**{
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'from': {'id': user_id, 'is_bot': False,
+                         'first_name': 'Load', 'language_code': 'ru'},
+                'message': {'message_id': message_id,
+                            'date': int(time.time()),
+                            'chat': {'id': user_id, 'type': 'private'}},
+            },
+        })
+
+    def inline_query(self, user_id: int, query: str) -> types.Update:
+        update_id = next(self._update_ids)
+        return types.Update(**{
+            'update_id': update_id,
+            'inline_query': {
+                'id': str(update_id),
+                'from': {'id': user_id, 'is_bot': False,
+                         'first_name': 'Load', 'language_code': 'ru'},
+                'query': query,
+                'offset': '',
+            },
+        })
+
+
+def city_flow(factory: UpdateFactory, user_id: int,
+              rng: random.Random) -> typing.List[Step]:
+    """Меню → «Погода по городу» → название города."""
+    menu_id = factory.bot_message_id()
+    return [
+        ('menu', factory.command(user_id, '/menu')),
+        ('weather_in_city',
+         factory.callback(user_id, 'weather_in_city', menu_id)),
+        ('city', factory.text(user_id, rng.choice(CITIES))),
+    ]
+
+
+def location_flow(factory: UpdateFactory, user_id: int,
+                  rng: random.Random) -> typing.List[Step]:
+    """Меню → «Погода по геолокации» → геолокация."""
+    menu_id = factory.bot_message_id()
+    return [
+        ('menu', factory.command(user_id, '/menu')),
+        ('weather_from_location',
+         factory.callback(user_id, 'weather_from_location', menu_id)),
+        ('location', factory.location(user_id,
+                                      round(rng.uniform(*LATITUDES), 4),
+                                      round(rng.uniform(*LONGITUDES), 4))),
+    ]
+
+
+def cancel_flow(factory: UpdateFactory, user_id: int,
+                rng: random.Random) -> typing.List[Step]:
+    """Меню → «Погода по городу» → «Отмена»."""
+    menu_id = factory.bot_message_id()
+    return [
+        ('menu', factory.command(user_id, '/menu')),
+        ('weather_in_city',
+         factory.callback(user_id, 'weather_in_city', menu_id)),
+        ('cancel', factory.callback(user_id, 'cancel', menu_id)),
+    ]
+
+
+FLOWS: typing.Dict[str, typing.Callable[..., typing.List[Step]]] = {
+    'city': city_flow,
+    'location': location_flow,
+    'cancel': cancel_flow,
+}
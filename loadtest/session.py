@@ -0,0 +1,99 @@
+"""Измерение пропускной способности запросов к API погоды с новой
+сессией на каждый запрос и с общей сессией с пулом соединений.
+
+Запуск из корня проекта:
+
+    python -m loadtest.session --requests 5000 --concurrency 1,16,64
+
+Запросы идут к локальной заглушке API погоды без TLS, поэтому разница
+показывает только стоимость TCP-соединения и создания сессии; с TLS
+до api.openweathermap.org каждое новое соединение обходится дороже.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import typing
+
+import aiohttp
+
+from loadtest.fake_servers import FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment, summarize
+
+
+async def fetch_with_new_session(url: str) -> None:
+    """Запрос так, как он выполнялся до общей сессии."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            await response.read()
+
+
+async def measure(fetch: typing.Callable[[str], typing.Awaitable],
+                  url: str, requests: int,
+                  concurrency: int) -> typing.Dict[str, typing.Any]:
+    """Функция, выполняющая requests запросов в concurrency потоков."""
+    durations = []
+    remaining = iter(range(requests))
+
+    async def client() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await fetch(url)
+            durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {'requests_per_second': round(requests / elapsed, 1),
+            'latency': summarize(durations)}
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    weather = FakeWeatherServer(latency=args.latency)
+    weather_url = await weather.start()
+    configure_environment(LoadTestConfig(), '', weather_url)
+    from weather.weather_service import close_session, get_session
+
+    async def fetch_with_shared_session(url: str) -> None:
+        session = await get_session()
+        async with session.get(url) as response:
+            await response.read()
+
+    url = f'{weather_url}/data/2.5/weather?q=Москва&units=metric'
+    runs = []
+    for concurrency in args.concurrency:
+        for mode, fetch in (('new_session', fetch_with_new_session),
+                            ('shared_session', fetch_with_shared_session)):
+            result = await measure(fetch, url, args.requests, concurrency)
+            runs.append({'mode': mode, 'concurrency': concurrency,
+                         **result})
+            print(f'{mode:>14}, concurrency={concurrency:>3}: '
+                  f'{result["requests_per_second"]:>8} запросов/с, '
+                  f'p50 {result["latency"]["p50_ms"]} мс, '
+                  f'p95 {result["latency"]["p95_ms"]} мс', flush=True)
+
+    await close_session()
+    await weather.stop()
+    return {'config': vars(args), 'runs': runs}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.session')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', default='1,16,64',
+                        type=lambda value: [int(item)
+                                            for item in value.split(',')])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='задержка ответа заглушки в секундах')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Измерение пропускной способности бота в зависимости от количества
+процессов-обработчиков.
+
+Запуск из корня проекта:
+
+    python -m loadtest.shards --updates 5000 --processes 1,2,4,8
+
+Для каждого количества процессов запускается супервизор, как при
+BOT_PROCESSES, а заглушки Bot API и API погоды работают в отдельном
+процессе и не делят ядро с супервизором. Время считается с момента,
+когда все обработчики запустились, до обработки всех обновлений.
+Кроме обновлений в секунду выводится процессорное время супервизора
+и заглушек на одно обновление: масштабирование возможно, пока
+на машине хватает ядер и для них.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import typing
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.polling import build_updates
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import UpdateFactory
+
+
+async def run_fakes(updates: typing.List[typing.Dict],
+                    config: LoadTestConfig, connection) -> None:
+    """Функция работы заглушек до команды остановки из connection."""
+    telegram = FakeTelegramServer(latency=config.telegram_latency,
+                                  seed=config.seed)
+    weather = FakeWeatherServer(latency=config.weather_latency,
+                                seed=config.seed)
+    telegram.add_updates(updates)
+    connection.send((await telegram.start(), await weather.start()))
+    started = time.process_time()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, connection.recv)
+    connection.send({
+        'confirmed_update_id': telegram.confirmed_update_id,
+        'cpu_seconds': time.process_time() - started,
+    })
+    await telegram.stop()
+    await weather.stop()
+
+
+def serve_fakes(updates: typing.List[typing.Dict], config: LoadTestConfig,
+                connection) -> None:
+    asyncio.run(run_fakes(updates, config, connection))
+
+
+async def receive(connection) -> typing.Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, connection.recv)
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    config = LoadTestConfig(telegram_latency=args.telegram_latency,
+                            weather_latency=args.weather_latency,
+                            global_rate=10 ** 6, weather_rate=10 ** 6,
+                            outbox_concurrency=args.outbox_concurrency)
+    # Настоящие адреса заглушек задаются перед каждым прогоном.
+    configure_environment(config, '', '')
+
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer
+    from supervisor import RawPoller, ShardRouter
+
+    context = multiprocessing.get_context('spawn')
+    factory = UpdateFactory()
+    rng = random.Random(config.seed)
+    runs = []
+    for run_number, processes in enumerate(args.processes, 1):
+        chats = range(run_number * 10 ** 6,
+                      run_number * 10 ** 6 + args.chats)
+        updates = build_updates(factory, chats, args.updates, rng)
+        connection, fakes_connection = context.Pipe()
+        fakes = context.Process(target=serve_fakes,
+                                args=(updates, config, fakes_connection))
+        fakes.start()
+        telegram_url, weather_url = await receive(connection)
+        os.environ['TELEGRAM_API_URL'] = telegram_url
+        os.environ['WEATHER_API_URL'] = weather_url
+
+        router = ShardRouter(processes, queue_size=args.queue_size)
+        bot = Bot(token=os.environ['API_TOKEN'],
+                  server=TelegramAPIServer.from_base(telegram_url))
+        poller = RawPoller(bot, router, limit=args.limit, timeout=1)
+        router.start()
+        await router.wait_ready()
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        task = asyncio.ensure_future(poller.run())
+        while router.processed < len(updates) and not task.done():
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        supervisor_cpu = time.process_time() - cpu_started
+        poller.stop_polling()
+        await task
+        await (await bot.get_session()).close()
+
+        connection.send('stop')
+        fakes_stats = await receive(connection)
+        fakes.join()
+
+        runs.append({
+            'processes': processes,
+            'updates': router.processed,
+            'seconds': round(elapsed, 3),
+            'updates_per_second': round(router.processed / elapsed, 1),
+            'supervisor_cpu_us_per_update': round(
+                supervisor_cpu / router.processed * 10 ** 6, 1),
+            'fakes_cpu_us_per_update': round(
+                fakes_stats['cpu_seconds'] / router.processed * 10 ** 6, 1),
+            'duplicates': poller.duplicates,
+            'committed': fakes_stats['confirmed_update_id']
+            == updates[-1]['update_id'],
+        })
+        print(f'processes={processes:>3}: '
+              f'{runs[-1]["updates_per_second"]:>8} обновлений/с, '
+              f'CPU супервизора '
+              f'{runs[-1]["supervisor_cpu_us_per_update"]} мкс, '
+              f'заглушек {runs[-1]["fakes_cpu_us_per_update"]} мкс '
+              f'на обновление, смещение подтверждено: '
+              f'{runs[-1]["committed"]}', flush=True)
+
+    return {'config': vars(args), 'cpu_count': os.cpu_count(), 'runs': runs}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.shards')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--processes', default='1,2,4,8',
+                        type=lambda value: [int(item)
+                                            for item in value.split(',')])
+    parser.add_argument('--limit', type=int, default=100,
+                        help='размер пачки getUpdates')
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--weather-latency', type=float, default=0.0)
+    parser.add_argument('--outbox-concurrency', type=int, default=256)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
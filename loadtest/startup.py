@@ -0,0 +1,125 @@
+"""Измерение времени холодного запуска бота.
+
+Запуск из корня проекта:
+
+    python -m loadtest.startup --runs 10 --max-seconds 1.5
+
+Бот запускается отдельным процессом `python main.py` в режиме polling
+на локальных заглушках Bot API и API погоды. В очереди getUpdates уже
+лежит команда /start, и время считается от запуска процесса до ответа
+на неё, то есть включает импорт модулей, инициализацию и первый цикл
+обработки. С --profile последний запуск выводит отчёт профилировщика
+запуска (STARTUP_PROFILE=1). Если медиана превышает --max-seconds,
+команда завершается с ошибкой.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import sys
+import time
+import typing
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import UpdateFactory
+
+USER_ID = 1000
+ADMIN_CHAT_ID = 1
+
+
+async def measure(telegram: FakeTelegramServer, update: typing.Dict,
+                  args: argparse.Namespace, profile: bool) -> float:
+    """Функция одного запуска бота: возвращает время до первого ответа
+    пользователю в секундах.
+    """
+    telegram.first_message_at.clear()
+    telegram.add_updates([update])
+    environment = dict(os.environ, STARTUP_PROFILE='1' if profile else '0')
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, 'main.py', env=environment,
+        stderr=None if profile else asyncio.subprocess.DEVNULL,
+    )
+    deadline = started + args.timeout
+    while (USER_ID not in telegram.first_message_at
+           and process.returncode is None
+           and time.perf_counter() < deadline):
+        await asyncio.sleep(0.001)
+    if process.returncode is None:
+        process.send_signal(signal.SIGTERM)
+    await process.wait()
+    if USER_ID not in telegram.first_message_at:
+        raise RuntimeError(f'Бот не ответил, код выхода {process.returncode}')
+    return telegram.first_message_at[USER_ID] - started
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    config = LoadTestConfig(telegram_latency=args.telegram_latency,
+                            weather_latency=args.weather_latency)
+    telegram = FakeTelegramServer(latency=config.telegram_latency)
+    weather = FakeWeatherServer(latency=config.weather_latency)
+    configure_environment(config, await telegram.start(),
+                          await weather.start())
+    os.environ.update({
+        'BOT_MODE': 'polling',
+        'BOT_PROCESSES': '1',
+        'ADMIN_CHAT_ID': str(ADMIN_CHAT_ID),
+        'POLLING_TIMEOUT': '1',
+    })
+    factory = UpdateFactory()
+    seconds = []
+    try:
+        for number in range(1, args.runs + 1):
+            update = factory.command(USER_ID, 'start').to_python()
+            update['update_id'] = number
+            profile = args.profile and number == args.runs
+            seconds.append(await measure(telegram, update, args, profile))
+            print(f'Запуск {number}: {seconds[-1] * 1000:.1f} мс',
+                  flush=True)
+    finally:
+        await telegram.stop()
+        await weather.stop()
+
+    result = {
+        'runs': args.runs,
+        'median_seconds': round(statistics.median(seconds), 4),
+        'min_seconds': round(min(seconds), 4),
+        'max_seconds': round(max(seconds), 4),
+    }
+    print(f'Время до первого ответа: медиана '
+          f'{result["median_seconds"] * 1000:.1f} мс, минимум '
+          f'{result["min_seconds"] * 1000:.1f} мс, максимум '
+          f'{result["max_seconds"] * 1000:.1f} мс')
+    return result
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.startup')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='время ожидания ответа одного запуска')
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--weather-latency', type=float, default=0.1)
+    parser.add_argument('--profile', action='store_true',
+                        help='вывести отчёт профилировщика запуска')
+    parser.add_argument('--max-seconds', type=float,
+                        help='допустимая медиана времени запуска')
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+    if args.max_seconds is not None \
+            and result['median_seconds'] > args.max_seconds:
+        print(f'Медиана превышает {args.max_seconds} с', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Измерение стоимости планирования и рассылки ежедневной погоды.
+
+Запуск из корня проекта:
+
+    python -m loadtest.subscriptions --subscriptions 100000 --cities 200
+
+Подписки равномерно распределяются по cities городам, times вариантам
+времени рассылки и двум часовым поясам. Измеряются добавление подписок
+в планировщик и память на подписку, выбор всех слотов, время которых
+наступило, с их перепланированием на следующий день, и рассылка:
+погода для каждого слота запрашивается у заглушки API погоды один раз,
+а сообщения подписчикам ставятся в очередь исходящих сообщений. Очередь
+не запущена, поэтому измеряется только сама рассылка, без Bot API.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import typing
+
+from loadtest.fake_servers import FakeWeatherServer
+from loadtest.runner import LoadTestConfig, configure_environment
+
+TIMEZONES = ('Europe/Moscow', 'Asia/Novosibirsk')
+LETTERS = 'абвгдежзиклмнопрстуфхчшэюя'
+
+
+def get_city_name(number: int) -> str:
+    """Функция, возвращающая выдуманное название города без цифр,
+    которое пройдёт проверку перед запросом к API.
+    """
+    suffix = ''
+    while True:
+        number, index = divmod(number, len(LETTERS))
+        suffix += LETTERS[index]
+        if not number:
+            return f'Город {suffix.capitalize()}'
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    weather = FakeWeatherServer()
+    configure_environment(LoadTestConfig(), '', await weather.start())
+    # Ограничитель запросов к API погоды снимается: измеряется
+    # стоимость самой рассылки.
+    os.environ['WEATHER_RATE_PER_SECOND'] = str(10 ** 6)
+    os.environ['WEATHER_RATE_BURST'] = str(10 ** 6)
+    from bot import outbox
+    from subscriptions import (SQLiteSubscriptionStore, Subscription,
+                               SubscriptionScheduler)
+    from settings import settings
+    from weather.weather_service import close_session
+
+    rng = random.Random(args.seed)
+    cities = [get_city_name(number) for number in range(args.cities)]
+    minutes = [7 * 60 + 15 * number for number in range(args.times)]
+    subscriptions = [
+        Subscription(chat_id, rng.choice(cities), None, None,
+                     rng.choice(minutes), rng.choice(TIMEZONES))
+        for chat_id in range(1, args.subscriptions + 1)
+    ]
+    scheduler = SubscriptionScheduler(
+        SQLiteSubscriptionStore(settings.subscriptions_path)
+    )
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    for subscription in subscriptions:
+        scheduler._add(subscription)
+    add_seconds = time.perf_counter() - started
+    bytes_per_subscription = ((tracemalloc.get_traced_memory()[0] - before)
+                              / len(subscriptions))
+    tracemalloc.stop()
+    slots = len(scheduler._slots)
+    print(f'Добавление: {add_seconds / len(subscriptions) * 10 ** 6:.2f} '
+          f'мкс и {bytes_per_subscription:.0f} байт на подписку, '
+          f'{slots} слотов', flush=True)
+
+    # Через сутки наступает время всех слотов.
+    started = time.perf_counter()
+    due = scheduler._pop_due(time.time() + 86400)
+    pop_ms = (time.perf_counter() - started) * 1000
+    print(f'Выбор {len(due)} слотов с перепланированием: {pop_ms:.1f} мс',
+          flush=True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(scheduler._deliver(slot) for slot in due))
+    deliver_seconds = time.perf_counter() - started
+    upstream = weather.stats()['weather']['calls']
+    print(f'Рассылка: {scheduler.delivered} сообщений за '
+          f'{deliver_seconds:.2f} с '
+          f'({deliver_seconds / scheduler.delivered * 10 ** 6:.1f} мкс '
+          f'на подписчика), запросов к API погоды: {upstream}, '
+          f'в очереди {len(outbox)}', flush=True)
+
+    await scheduler.stop()
+    await close_session()
+    await weather.stop()
+    return {
+        'config': vars(args),
+        'slots': slots,
+        'add_us_per_subscription': round(
+            add_seconds / len(subscriptions) * 10 ** 6, 2
+        ),
+        'bytes_per_subscription': round(bytes_per_subscription),
+        'pop_due_ms': round(pop_ms, 2),
+        'delivered': scheduler.delivered,
+        'deliver_seconds': round(deliver_seconds, 3),
+        'upstream_calls': upstream,
+    }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.subscriptions')
+    parser.add_argument('--subscriptions', type=int, default=100000)
+    parser.add_argument('--cities', type=int, default=200)
+    parser.add_argument('--times', type=int, default=8,
+                        help='вариантов времени рассылки')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Измерение накладных расходов ограничения частоты обновлений.
+
+Запуск из корня проекта:
+
+    python -m loadtest.throttling --updates 200000 --users 1000000
+
+Выводит время ThrottlingMiddleware на одно обновление (пропущенное,
+отброшенное как повторная доставка и отброшенное по частоте) и память
+на одного отслеживаемого пользователя в KeyedRateLimiter. Для
+сравнения память считается и для отдельного TokenBucket
+на пользователя.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+import typing
+
+from aiogram.dispatcher.handler import CancelHandler
+
+from loadtest.runner import LoadTestConfig, configure_environment
+from loadtest.scenarios import UpdateFactory
+
+
+async def time_updates(middleware, updates) -> typing.Tuple[float, int]:
+    """Функция, возвращающая среднее время на обновление в микросекундах
+    и количество отброшенных обновлений.
+    """
+    dropped = 0
+    started = time.perf_counter()
+    for update in updates:
+        try:
+            await middleware.on_pre_process_update(update, {})
+        except CancelHandler:
+            dropped += 1
+    elapsed = time.perf_counter() - started
+    return elapsed / len(updates) * 10 ** 6, dropped
+
+
+def measure_memory(create: typing.Callable[[], typing.Any],
+                   add: typing.Callable[[typing.Any, int], typing.Any],
+                   users: int) -> float:
+    """Функция, возвращающая память в байтах на одного пользователя."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    storage = create()
+    for user_id in range(10 ** 6, 10 ** 6 + users):
+        add(storage, user_id)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / users
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    configure_environment(LoadTestConfig(), '', '')
+    from middlewares import ThrottlingMiddleware
+    from weather.resilience import KeyedRateLimiter, TokenBucket
+
+    factory = UpdateFactory()
+    texts = ('Москва', 'Казань', 'Омск', 'Сочи')
+    # Каждый пользователь пишет один раз: все обновления пропускаются.
+    unique = [factory.text(10 ** 6 + number, texts[number % len(texts)])
+              for number in range(args.updates)]
+    # Одно и то же обновление доставляется повторно.
+    repeated = [factory.text(1, 'Москва')] * args.updates
+    # Один пользователь пишет разные тексты чаще разрешённого.
+    flood = [factory.text(2, f'Город {number}')
+             for number in range(args.updates)]
+
+    result = {}
+    for name, updates in (('passed', unique), ('duplicate', repeated),
+                          ('rate_limit', flood)):
+        middleware = ThrottlingMiddleware(rate=args.rate, burst=args.burst,
+                                          duplicate_window=args.window)
+        per_update, dropped = await time_updates(middleware, updates)
+        result[f'{name}_us_per_update'] = round(per_update, 2)
+        result[f'{name}_dropped'] = dropped
+        print(f'{name:>10}: {per_update:6.2f} мкс на обновление, '
+              f'отброшено {dropped} из {len(updates)}', flush=True)
+
+    gcra = measure_memory(lambda: KeyedRateLimiter(args.rate, args.burst),
+                          lambda limiter, user_id: limiter.allow(user_id),
+                          args.users)
+    buckets = measure_memory(
+        dict,
+        lambda storage, user_id: storage.setdefault(
+            user_id, TokenBucket(args.rate, args.burst)
+        ).try_acquire(),
+        args.users
+    )
+    result['gcra_bytes_per_user'] = round(gcra, 1)
+    result['token_bucket_bytes_per_user'] = round(buckets, 1)
+    print(f'Память на пользователя: KeyedRateLimiter {gcra:.1f} байт, '
+          f'TokenBucket на пользователя {buckets:.1f} байт '
+          f'({args.users} пользователей)')
+    return {'config': vars(args), **result}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.throttling')
+    parser.add_argument('--updates', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000000,
+                        help='пользователей при замере памяти')
+    parser.add_argument('--rate', type=float, default=1)
+    parser.add_argument('--burst', type=float, default=5)
+    parser.add_argument('--window', type=float, default=2)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Измерение скорости приёма обновлений через вебхук и времени ответа
+Telegram на каждое обновление.
+
+Запуск из корня проекта:
+
+    python -m loadtest.webhook --updates 3000 --connections 40
+
+Обновления сценариев из loadtest.scenarios отправляются POST-запросами
+в aiohttp-приложение с webhook_handler из main.py, как это делает
+Telegram: не больше connections запросов одновременно (max_connections
+вебхука). Для сравнения тот же поток обновлений отправляется в
+обработчик, который отвечает только после dp.process_update, как
+до пула обработчиков.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import typing
+
+import aiohttp
+from aiohttp import web
+
+from loadtest.fake_servers import FakeTelegramServer, FakeWeatherServer
+from loadtest.polling import build_updates
+from loadtest.runner import LoadTestConfig, configure_environment, summarize
+from loadtest.scenarios import UpdateFactory
+
+
+async def post_updates(url: str, updates: typing.List[typing.Dict],
+                       connections: int) -> typing.Tuple[float,
+                                                         typing.List[float]]:
+    """Функция отправки обновлений; возвращает общее время и время
+    ответа на каждое обновление.
+    """
+    acks = []
+    remaining = iter(updates)
+    connector = aiohttp.TCPConnector(limit=connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def connection() -> None:
+            for update in remaining:
+                started = time.perf_counter()
+                async with session.post(url, json=update) as response:
+                    assert response.status == 200, response.status
+                acks.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(connections)))
+        return time.perf_counter() - started, acks
+
+
+async def run(args: argparse.Namespace) -> typing.Dict[str, typing.Any]:
+    config = LoadTestConfig(telegram_latency=args.telegram_latency,
+                            weather_latency=args.weather_latency,
+                            outbox_concurrency=args.outbox_concurrency)
+    telegram = FakeTelegramServer(latency=config.telegram_latency,
+                                  seed=config.seed)
+    weather = FakeWeatherServer(latency=config.weather_latency,
+                                seed=config.seed)
+    configure_environment(config, await telegram.start(),
+                          await weather.start())
+
+    import handlers  # noqa: F401 - регистрирует обработчики
+    from aiogram import Bot, Dispatcher, types
+    from bot import bot, dp, outbox
+    from main import update_pool, webhook_handler
+    from settings import settings
+
+    async def process_before_ack(request: web.Request) -> web.Response:
+        update = types.Update(**await request.json())
+        await asyncio.ensure_future(dp.process_update(update))
+        return web.Response()
+
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+    outbox.start()
+    update_pool.start()
+
+    factory = UpdateFactory()
+    rng = random.Random(config.seed)
+    runs = []
+    for run_number, (mode, handler) in enumerate(
+            (('process_before_ack', process_before_ack),
+             ('update_pool', webhook_handler)), 1):
+        app = web.Application()
+        app.router.add_post('/{token}', handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        url = f'http://127.0.0.1:{port}/{settings.api_token}'
+
+        chats = range(run_number * 10 ** 6,
+                      run_number * 10 ** 6 + args.chats)
+        updates = build_updates(factory, chats, args.updates, rng)
+        elapsed, acks = await post_updates(url, updates, args.connections)
+        # Пул отвечает раньше обработки, поэтому отдельно считается
+        # время до обработки всех принятых обновлений.
+        drain_started = time.perf_counter()
+        await update_pool.stop()
+        processed = elapsed + time.perf_counter() - drain_started
+        update_pool.start()
+        await runner.cleanup()
+
+        runs.append({'mode': mode,
+                     'updates_per_second': round(len(updates) / elapsed, 1),
+                     'processed_per_second': round(len(updates) / processed,
+                                                   1),
+                     'ack': summarize(acks)})
+        print(f'{mode:>18}: принято {runs[-1]["updates_per_second"]:>8} '
+              f'обновлений/с, обработано '
+              f'{runs[-1]["processed_per_second"]:>8} обновлений/с, '
+              f'ответ Telegram p50 '
+              f'{runs[-1]["ack"]["p50_ms"]} мс, p95 '
+              f'{runs[-1]["ack"]["p95_ms"]} мс, p99 '
+              f'{runs[-1]["ack"]["p99_ms"]} мс', flush=True)
+
+    await update_pool.stop()
+    await outbox.stop()
+    await telegram.stop()
+    await weather.stop()
+    return {'config': vars(args), 'runs': runs}
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m loadtest.webhook')
+    parser.add_argument('--updates', type=int, default=3000)
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--connections', type=int, default=40,
+                        help='одновременных запросов, как max_connections')
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--weather-latency', type=float, default=0.1)
+    parser.add_argument('--outbox-concurrency', type=int, default=256)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
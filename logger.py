@@ -1,14 +1,142 @@
 """Logger"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import List, Optional
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-handler = RotatingFileHandler(
-    'bot.log',
+from settings import settings
+
+# Идентификатор обрабатываемого обновления Telegram.
+request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    """Фильтр, добавляющий к записи идентификатор текущего обновления."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирование записей в JSON-строки для сборщиков логов."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None) is not None:
+            entry['request_id'] = record.request_id
+        if getattr(record, 'duration_ms', None) is not None:
+            entry['duration_ms'] = record.duration_ms
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Обработчик, который только кладёт запись в очередь.
+
+    В отличие от QueueHandler запись не форматируется целиком в потоке
+    событийного цикла: подставляются только аргументы сообщения и текст
+    исключения, остальное делает фоновый поток.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """Файловый обработчик, сбрасывающий буфер на диск пачками."""
+
+    def flush(self) -> None:
+        # Вызывается после каждой записи; сброс делает flush_batch.
+        pass
+
+    def flush_batch(self) -> None:
+        super().flush()
+
+
+class BatchQueueListener:
+    """Фоновый поток, забирающий записи из очереди и пишущий их пачками."""
+
+    _stop = None
+
+    def __init__(self, log_queue: queue.SimpleQueue,
+                 handler: BatchFileHandler, batch_size: int = 500) -> None:
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='logger',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Метод остановки потока с записью всех накопленных записей."""
+        if self._thread is not None:
+            self.queue.put(self._stop)
+            self._thread.join()
+            self._thread = None
+        self.handler.close()
+
+    def _next_batch(self) -> List[Optional[logging.LogRecord]]:
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not self._stop:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            for record in batch:
+                if record is not self._stop:
+                    self.handler.handle(record)
+            self.handler.flush_batch()
+            if batch[-1] is self._stop:
+                return
+
+
+log_queue = queue.SimpleQueue()
+
+handler = BatchFileHandler(
+    settings.log_file,
     encoding='UTF-8',
-    maxBytes=5000000,
+    maxBytes=settings.log_max_bytes,
+    backupCount=settings.log_backup_count,
 )
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+if settings.log_format == 'json':
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+listener = BatchQueueListener(log_queue, handler,
+                              batch_size=settings.log_batch_size)
+listener.start()
+atexit.register(listener.stop)
+
+queue_handler = NonBlockingQueueHandler(log_queue)
+queue_handler.addFilter(RequestIdFilter())
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings.log_level)
+logger.addHandler(queue_handler)
@@ -1,109 +1,376 @@
+# Профилировщик запуска подключается раньше остальных модулей, чтобы
+# замерить их импорт (STARTUP_PROFILE=1).
+from startup import profiler
+
 import asyncio
+import json
 import os
+import signal
 import ssl
+from typing import Optional
 
 from aiogram import types
 from aiogram.utils.exceptions import ChatNotFound, ChatIdIsEmpty, BotBlocked
 from aiohttp import web
-from dotenv import load_dotenv
 
-import handlers
-from bot import bot, dp
+from bot import bot, dp, outbox
 from logger import logger
-
-load_dotenv()
-
-API_TOKEN = os.getenv('API_TOKEN')
-ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
-WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')
-WEBHOOK_PORT = os.getenv('WEBHOOK_PORT')
+from metrics import registry
+from settings import settings
+from supervisor import RawPoller, RawUpdate, ShardRouter, serve_shard
+from update_pool import UpdatePool
 
 # Путь к SSL сертификату.
 WEBHOOK_SSL_CERT = './webhook_certificates/webhook_cert.pem'
 # Путь к приватному ключу SSL.
 WEBHOOK_SSL_PRIV = './webhook_certificates/webhook_pkey.pem'
 
-# Инициализация SSL контекста
-# ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
-# ssl_context.load_cert_chain(certfile=WEBHOOK_SSL_CERT, keyfile=WEBHOOK_SSL_PRIV)
-
 app = web.Application()
+update_pool = UpdatePool(dp, workers=settings.update_workers,
+                         queue_size=settings.update_queue_size)
+# Супервизор принимает обновления и распределяет их по процессам.
+shard_router = (ShardRouter(settings.bot_processes,
+                            queue_size=settings.update_queue_size)
+                if settings.bot_processes > 1
+                and settings.bot_mode != 'worker' else None)
+
+
+def create_ssl_context() -> Optional[ssl.SSLContext]:
+    """Функция инициализации SSL контекста для вебхука.
+
+    Возвращает None, если сертификат не найден: в этом случае TLS
+    завершается на внешнем прокси.
+    """
+    if not (os.path.exists(WEBHOOK_SSL_CERT)
+            and os.path.exists(WEBHOOK_SSL_PRIV)):
+        logger.warning('SSL сертификат не найден, вебхук запускается без TLS')
+        return None
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    ssl_context.load_cert_chain(certfile=WEBHOOK_SSL_CERT,
+                                keyfile=WEBHOOK_SSL_PRIV)
+    return ssl_context
+
+
+async def notify_admin(text: str) -> None:
+    """Функция отправки администратору сообщения о состоянии бота."""
+    try:
+        await bot.send_message(chat_id=settings.admin_chat_id, text=text)
+
+    except ChatNotFound as chat_nf_error:
+        msg_error = f'Пользователь с таким Chat_ID не найден! {chat_nf_error}'
+        logger.error(msg_error)
+
+    except ChatIdIsEmpty as chat_id_error:
+        msg_error = (f'Для ADMIN_CHAT_ID в '
+                     f'.env файле не задано значение! {chat_id_error}')
+        logger.error(msg_error)
+
+    except BotBlocked as bot_blocked_error:
+        msg_error = f'Бот заблокирован администратором! {bot_blocked_error}'
+        logger.error(msg_error)
+
+    except Exception as error:
+        msg_error = (f'Ошибка отправки сообщения '
+                     f'о состоянии бота администратору! {error}')
+        logger.error(msg_error)
+
+
+async def set_webhook() -> None:
+    """Функция регистрации вебхука в Telegram, если задан WEBHOOK_URL."""
+    if not settings.webhook_url:
+        return
+    logger.debug('Устанавливаем вебхук')
+    certificate = None
+    if os.path.exists(WEBHOOK_SSL_CERT):
+        # Самоподписанный сертификат нужно передать в Telegram.
+        certificate = types.InputFile(WEBHOOK_SSL_CERT)
+    await bot.set_webhook(f'{settings.webhook_url}/{settings.api_token}',
+                          certificate=certificate, max_connections=100)
 
 
 async def on_startup(*args) -> None:
     """Функция, запускащаяся при старте бота.
 
-    Отправляет администратору сообщение об успешном запуске.
+    Запускает прогрев кэша погоды, фоновое обновление популярных
+    запросов, очередь исходящих сообщений, рассылку по подпискам
+    и обработчики обновлений, в режиме webhook регистрирует вебхук
+    и отправляет администратору сообщение об успешном запуске.
+
+    Прогрев кэша и сообщение администратору выполняются в фоне и не
+    задерживают приём первых обновлений: до окончания прогрева кэш
+    при промахе сам обращается к постоянному хранилищу.
+
+    Обработчики, рассылка и сервис погоды импортируются здесь: они
+    нужны только процессам, которые сами обрабатывают обновления,
+    и супервизор их не загружает.
     """
-    logger.debug('Отправляем сообщение о старте бота администратору')
-    await bot.send_message(chat_id=ADMIN_CHAT_ID, text="Бот запущен!")
+    import handlers  # noqa: F401 - регистрирует обработчики
+    from subscriptions import subscription_scheduler
+    from weather.weather_service import start_prefetch, warm_cache
+
+    logger.debug('Прогреваем кэш погоды из постоянного хранилища')
+    asyncio.ensure_future(warm_cache())
+
+    # Каждый процесс обновляет популярные запросы своих чатов; квота
+    # запросов на обновление делится между процессами супервизором.
+    logger.debug('Запускаем фоновое обновление популярных запросов погоды')
+    start_prefetch()
+
+    logger.debug('Запускаем очередь исходящих сообщений')
+    outbox.start()
+
+    logger.debug('Запускаем рассылку погоды по подпискам')
+    with profiler.step('subscription_scheduler.start'):
+        await subscription_scheduler.start()
+
+    if settings.bot_mode in ('webhook', 'worker'):
+        logger.debug('Запускаем обработчики обновлений')
+        update_pool.start()
+
+    if settings.bot_mode == 'webhook':
+        with profiler.step('set_webhook'):
+            await set_webhook()
+
+    if settings.bot_mode != 'worker':
+        logger.debug('Отправляем сообщение о старте бота администратору')
+        asyncio.ensure_future(notify_admin('Бот запущен!'))
+
+    profiler.finish()
 
 
 async def on_shutdown(*args):
     """Функция, запускащаяся при завершении работы бота.
 
-    Отправляет администратору сообщение об остановке, снимает вебхук и
-    завершает сессию.
+    Дожидается обработки принятых обновлений и отправки исходящих
+    сообщений, отправляет администратору сообщение об остановке,
+    снимает вебхук и завершает сессию.
+    """
+    from subscriptions import subscription_scheduler
+    from weather.weather_service import close_session, stop_prefetch
+
+    logger.warning('Завершаем работу бота..')
+
+    logger.debug('Дожидаемся обработки принятых обновлений')
+    await update_pool.stop()
+
+    logger.debug('Останавливаем рассылку погоды по подпискам')
+    await subscription_scheduler.stop()
+
+    logger.debug('Отправляем накопленные исходящие сообщения')
+    await outbox.stop()
+
+    if settings.bot_mode != 'worker':
+        logger.debug('Отправляем сообщение об остановке бота администратору')
+        await notify_admin('Bot is shutting down')
+
+        logger.debug('Снимаем вебхук')
+        await bot.delete_webhook()
+
+    logger.debug('Закрываем хранилище состояний')
+    await dp.storage.close()
+    await dp.storage.wait_closed()
+
+    logger.debug('Останавливаем фоновое обновление запросов погоды')
+    await stop_prefetch()
+
+    logger.debug('Закрываем пул соединений с API погоды')
+    await close_session()
+
+    logger.debug('Завершаем сессию')
+    await (await bot.get_session()).close()
+
+
+async def webhook_handler(request: web.Request) -> web.Response:
+    """Функция приёма обновлений от Telegram через вебхук.
+
+    Обновление ставится в очередь на фоновую обработку, а Telegram сразу
+    получает ответ, не дожидаясь запросов к API погоды.
+    """
+    if request.match_info.get('token') != settings.api_token:
+        return web.Response(status=403)
+
+    if shard_router is not None:
+        # Супервизору достаточно номера обновления и чата.
+        await shard_router.submit(RawUpdate.from_body(await request.read()))
+        return web.Response()
+
+    request_body_dict = await request.json()
+    update = types.Update(**request_body_dict)
+    await update_pool.submit(update)
+    return web.Response()
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Функция выдачи метрик бота в текстовом формате Prometheus."""
+    return web.Response(text=registry.render(), content_type='text/plain')
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    """Функция выдачи состояния процессов-обработчиков супервизора."""
+    workers = shard_router.health()
+    healthy = all(worker['healthy'] for worker in workers)
+    return web.json_response({'healthy': healthy, 'workers': workers},
+                             status=200 if healthy else 503,
+                             dumps=json.dumps)
+
+
+def restart_workers() -> None:
+    """Функция плавного перезапуска процессов-обработчиков по SIGHUP."""
+    logger.warning('Перезапускаем процессы-обработчики')
+    asyncio.ensure_future(shard_router.restart())
+
+
+async def on_supervisor_startup(*args) -> None:
+    """Функция, запускающаяся при старте супервизора.
+
+    Запускает процессы-обработчики, в режиме webhook регистрирует
+    вебхук и отправляет администратору сообщение об успешном запуске.
+    """
+    logger.debug('Запускаем процессы-обработчики: %s', settings.bot_processes)
+    shard_router.start()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP,
+                                                  restart_workers)
+
+    if settings.bot_mode == 'webhook':
+        with profiler.step('set_webhook'):
+            await set_webhook()
+
+    logger.debug('Отправляем сообщение о старте бота администратору')
+    asyncio.ensure_future(notify_admin('Бот запущен!'))
+
+    profiler.finish()
+
+
+async def on_supervisor_shutdown(*args) -> None:
+    """Функция, запускающаяся при завершении работы супервизора.
+
+    Дожидается обработки принятых обновлений и остановки
+    процессов-обработчиков, отправляет администратору сообщение
+    об остановке, снимает вебхук и завершает сессию.
     """
     logger.warning('Завершаем работу бота..')
 
+    logger.debug('Дожидаемся остановки процессов-обработчиков')
+    await shard_router.stop()
+
     logger.debug('Отправляем сообщение об остановке бота администратору')
-    await bot.send_message(chat_id=ADMIN_CHAT_ID, text="Bot is shutting down")
+    await notify_admin('Bot is shutting down')
 
     logger.debug('Снимаем вебхук')
     await bot.delete_webhook()
 
     logger.debug('Завершаем сессию')
-    await bot.session.close()
+    await (await bot.get_session()).close()
 
 
-async def webhook_handler(request):
-    """Функция установки вебхука и """
-    if request.match_info.get('token') == API_TOKEN:
-        request_body_dict = await request.json()
-        update = types.Update(**request_body_dict)
-        await dp.process_update(update)
-        return web.Response()
+def run_webhook() -> None:
+    """Функция запуска бота в режиме webhook."""
+    if shard_router is not None:
+        app.router.add_get('/health', health_handler)
+        app.on_startup.append(on_supervisor_startup)
+        app.on_shutdown.append(on_supervisor_shutdown)
     else:
-        return web.Response(status=403)
+        app.router.add_get('/metrics', metrics_handler)
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
+    app.router.add_post('/{token}', webhook_handler)
+    web.run_app(app, host=settings.webhook_host, port=settings.webhook_port,
+                ssl_context=create_ssl_context())
 
 
-async def main() -> None:
-    """Основная логика для запуска webhook."""
+async def run_worker() -> None:
+    """Основная логика процесса-обработчика, запущенного супервизором.
+
+    Прерывание с терминала получает вся группа процессов, но остановкой
+    обработчиков управляет супервизор.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    metrics_runner = None
+    if settings.metrics_port:
+        app.router.add_get('/metrics', metrics_handler)
+        metrics_runner = web.AppRunner(app)
+        await metrics_runner.setup()
+        await web.TCPSite(metrics_runner, settings.webhook_host,
+                          settings.metrics_port).start()
+
+    await on_startup()
     try:
-        # Раскомментировать строки с пометкой #WEBHOOK, если запуск бота ;
-        # Производится через webhook. Аналогично, если запуск производится ;
-        # Через polling - раскомментировать строку с пометкой #POLLING.
+        await serve_shard(update_pool)
+    finally:
+        await on_shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
-        #WEBHOOK app.router.add_post('/{token}', webhook_handler)
-        await on_startup()
-        #WEBHOOK app.on_startup.append(on_startup)
-        #WEBHOOK app.on_shutdown.append(on_shutdown)
-        #WEBHOOK web.run_app(app, host=WEBHOOK_HOST,
-        #WEBHOOK             port=WEBHOOK_PORT, ssl_context=ssl_context)
 
-    except ChatNotFound as chat_nf_error:
-        msg_error = f'Пользователь с таким Chat_ID не найден! {chat_nf_error}'
-        logger.error(msg_error)
+async def supervise() -> None:
+    """Основная логика супервизора в режиме polling.
 
-    except ChatIdIsEmpty as chat_id_error:
-        msg_error = (f'Для ADMIN_CHAT_ID в '
-                     f'.env файле не задано значение! {chat_id_error}')
-        logger.error(msg_error)
+    Состояние процессов-обработчиков отдаётся на METRICS_PORT.
+    """
+    health_runner = None
+    if settings.metrics_port:
+        app.router.add_get('/health', health_handler)
+        health_runner = web.AppRunner(app)
+        await health_runner.setup()
+        await web.TCPSite(health_runner, settings.webhook_host,
+                          settings.metrics_port).start()
 
-    except BotBlocked as bot_blocked_error:
-        msg_error = f'Бот заблокирован администратором! {bot_blocked_error}'
-        logger.error(msg_error)
+    shard_poller = RawPoller(bot, shard_router,
+                             limit=settings.polling_limit,
+                             timeout=settings.polling_timeout)
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, shard_poller.stop_polling)
 
-    except Exception as error:
-        msg_error = (f'Ошибка отправки сообщения '
-                     f'о состоянии бота администратору! {error}')
-        logger.error(msg_error)
+    await on_supervisor_startup()
+    try:
+        await shard_poller.run()
+    finally:
+        await on_supervisor_shutdown()
+        if health_runner is not None:
+            await health_runner.cleanup()
+
+
+async def main() -> None:
+    """Основная логика для запуска бота в режиме polling."""
+    if shard_router is not None:
+        await supervise()
+        return
+
+    from polling import Poller
+
+    poller = Poller(bot, update_pool, limit=settings.polling_limit,
+                    timeout=settings.polling_timeout)
+    metrics_runner = None
+    if settings.metrics_port:
+        app.router.add_get('/metrics', metrics_handler)
+        metrics_runner = web.AppRunner(app)
+        await metrics_runner.setup()
+        await web.TCPSite(metrics_runner, settings.webhook_host,
+                          settings.metrics_port).start()
+
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        # Остановка дожидается обработки уже принятых обновлений.
+        loop.add_signal_handler(signal_number, poller.stop_polling)
+
+    await on_startup()
+    try:
+        await poller.run()
+    finally:
+        await on_shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
-    # Раскомментировать строку если бот запускается через polling.
-    # loop.run_until_complete(dp.start_polling())
+    if settings.bot_mode == 'webhook':
+        run_webhook()
+    elif settings.bot_mode == 'worker':
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(run_worker())
+    else:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(main())
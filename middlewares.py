@@ -0,0 +1,145 @@
+"""Middlewares"""
+import asyncio
+import time
+import typing
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from logger import logger, request_id
+from metrics import HANDLER_ERRORS, HANDLER_LATENCY, THROTTLED_UPDATES
+from weather.resilience import KeyedRateLimiter
+
+
+def get_update_user_id(update: types.Update) -> typing.Optional[int]:
+    """Функция, возвращающая пользователя, частота обновлений которого
+    ограничивается: автора сообщения или нажавшего кнопку.
+
+    Inline-запросы не ограничиваются: ввод в них Telegram отправляет
+    с задержкой сам и кэширует ответы на cache_time, а отброшенный
+    последний запрос оставил бы пользователя без карточек.
+    """
+    message = update.message
+    if message is not None:
+        user = message.from_user or message.chat
+        return user.id
+    callback_query = update.callback_query
+    if callback_query is not None:
+        return callback_query.from_user.id
+    return None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Middleware, отбрасывающий лишние обновления до обработчиков.
+
+    Обновления одного пользователя ограничены rate в секунду с всплеском
+    до burst, а обновление с номером, уже полученным в пределах
+    duplicate_window секунд (повторная доставка вебхука или опроса),
+    пропускается. Одинаковый текст в разных обновлениях повтором
+    не считается. Отброшенные обновления не доходят до фильтров,
+    хранилища состояний и API погоды; на отброшенное нажатие кнопки
+    в фоне отправляется пустой ответ, чтобы у пользователя не крутились
+    часы на кнопке. На каждого недавно активного пользователя хранится
+    одно число, см. KeyedRateLimiter.
+    """
+
+    def __init__(self, rate: float, burst: float,
+                 duplicate_window: float) -> None:
+        super().__init__()
+        self.users = KeyedRateLimiter(rate, burst) if rate > 0 else None
+        self.duplicates = (KeyedRateLimiter(1 / duplicate_window, 1)
+                           if duplicate_window > 0 else None)
+
+    async def on_pre_process_update(self, update, data: dict) -> None:
+        now = time.monotonic()
+        if (self.duplicates is not None
+                and not self.duplicates.allow(update.update_id, now)):
+            self._drop('duplicate')
+        user_id = get_update_user_id(update)
+        if (user_id is not None and self.users is not None
+                and not self.users.allow(user_id, now)):
+            if update.callback_query is not None:
+                asyncio.ensure_future(
+                    self._answer_callback_query(update.callback_query)
+                )
+            self._drop('rate_limit')
+
+    @staticmethod
+    async def _answer_callback_query(callback_query: types.CallbackQuery
+                                     ) -> None:
+        try:
+            await callback_query.answer()
+        except Exception as error:
+            # Без ответа часы на кнопке пропадут сами через несколько
+            # секунд.
+            logger.debug('Не удалось ответить на отброшенное нажатие '
+                         'кнопки: %r', error)
+
+    @staticmethod
+    def _drop(reason: str) -> None:
+        # Без записи в лог: при наплыве она стоила бы дороже проверки.
+        THROTTLED_UPDATES.inc(reason)
+        raise CancelHandler()
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Middleware, измеряющий длительность обработчиков сообщений
+    и нажатий на кнопки и считающий ошибки обработки обновлений.
+    """
+
+    @staticmethod
+    def _start(data: dict, event=None) -> None:
+        handler = current_handler.get(None)
+        # Для таблицы обработчиков учитывается обработчик нажатой кнопки.
+        if hasattr(handler, 'resolve'):
+            handler = handler.resolve(event)
+        data['_metrics_handler'] = getattr(handler, '__name__', 'unknown')
+        data['_metrics_started'] = time.perf_counter()
+
+    @staticmethod
+    def _finish(data: dict) -> None:
+        started = data.pop('_metrics_started', None)
+        if started is None:
+            return
+        handler = data.pop('_metrics_handler')
+        HANDLER_LATENCY.observe(time.perf_counter() - started, handler)
+
+    async def on_process_message(self, message, data: dict) -> None:
+        self._start(data)
+
+    async def on_post_process_message(self, message, results,
+                                      data: dict) -> None:
+        self._finish(data)
+
+    async def on_process_callback_query(self, callback_query,
+                                        data: dict) -> None:
+        self._start(data, callback_query)
+
+    async def on_post_process_callback_query(self, callback_query, results,
+                                             data: dict) -> None:
+        self._finish(data)
+
+    async def on_pre_process_error(self, update, exception,
+                                   data: dict) -> None:
+        HANDLER_ERRORS.inc(type(exception).__name__)
+
+
+class RequestLoggingMiddleware(BaseMiddleware):
+    """Middleware, помечающий записи лога идентификатором обновления
+    и записывающий время его обработки.
+    """
+
+    async def on_pre_process_update(self, update, data: dict) -> None:
+        request_id.set(str(update.update_id))
+        data['_logging_started'] = time.perf_counter()
+
+    async def on_post_process_update(self, update, results,
+                                     data: dict) -> None:
+        started = data.pop('_logging_started', None)
+        if started is None:
+            return
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.debug('Обновление %s обработано за %s мс',
+                     update.update_id, duration_ms,
+                     extra={'duration_ms': duration_ms})
@@ -0,0 +1,293 @@
+"""Outbox"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+import typing
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from logger import logger
+from metrics import OUTBOX_RETRIES
+from weather.resilience import TokenBucket
+
+# Ответы пользователю отправляются раньше служебных правок и удалений,
+# а рассылка по подпискам - в последнюю очередь.
+PRIORITY_REPLY = 0
+PRIORITY_CLEANUP = 1
+PRIORITY_BROADCAST = 2
+
+ChatId = typing.Union[int, str]
+
+
+class OutboxItem:
+    """Отложенный вызов метода Bot API."""
+
+    __slots__ = ('chat_id', 'method', 'params', 'priority', 'seq', 'key',
+                 'futures', 'retries', 'cancelled')
+
+    def __init__(self, chat_id: ChatId, method: str, params: dict,
+                 priority: int, seq: int,
+                 key: typing.Optional[tuple] = None) -> None:
+        self.chat_id = chat_id
+        self.method = method
+        self.params = params
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.futures: typing.List[asyncio.Future] = []
+        self.retries = 0
+        self.cancelled = False
+
+
+class Outbox:
+    """Очередь исходящих вызовов Bot API с учётом ограничений Telegram.
+
+    Вызовы отправляются не чаще global_rate в секунду на всего бота
+    и не чаще chat_rate в секунду в один чат; в каждый чат одновременно
+    идёт не больше одного вызова, поэтому порядок сообщений сохраняется.
+    Ответы пользователю имеют приоритет над удалением и правкой старых
+    сообщений. При RetryAfter вызов возвращается в очередь и чат
+    приостанавливается на указанное Telegram время.
+
+    Повторные правки одного сообщения, ещё не отправленные в Telegram,
+    объединяются в одну, а правки сообщения, которое будет удалено,
+    отбрасываются.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = 30.0,
+                 chat_rate: float = 1.0, concurrency: int = 16,
+                 max_retries: int = 5) -> None:
+        self.bot = bot
+        self.chat_interval = 1 / chat_rate
+        self.max_retries = max_retries
+        self.sent = 0
+        self.coalesced = 0
+        # Без запаса токенов: иначе за первую секунду уйдёт вдвое больше.
+        self._rate = TokenBucket(rate=global_rate, capacity=1)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._seq = itertools.count()
+        # Очередь вызовов каждого чата: (приоритет, номер, вызов).
+        self._pending: typing.Dict[ChatId, list] = {}
+        # Чаты, готовые к отправке: (приоритет, номер) первого вызова.
+        self._ready: list = []
+        # Чаты, ожидающие окончания паузы: (время готовности, чат).
+        self._sleeping: list = []
+        self._ready_at: typing.Dict[ChatId, float] = {}
+        self._in_flight: typing.Set[ChatId] = set()
+        self._keys: typing.Dict[tuple, OutboxItem] = {}
+        self._tasks: typing.Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._runner: typing.Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def start(self) -> None:
+        """Метод запуска отправки вызовов из очереди."""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Метод остановки, дожидающийся отправки накопленных вызовов
+        не дольше timeout секунд.
+        """
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._tasks) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+
+    def submit(self, chat_id: ChatId, method: str, params: dict,
+               priority: int = PRIORITY_REPLY,
+               key: typing.Optional[tuple] = None,
+               wait: bool = False) -> typing.Optional[asyncio.Future]:
+        """Метод постановки вызова метода Bot API в очередь.
+
+        Параметры:
+            chat_id (int or str): Чат, к лимиту которого относится вызов.
+
+            method (str): Имя метода объекта Bot, например send_message.
+
+            params (dict): Именованные аргументы метода.
+
+            priority (int): Приоритет, меньшее значение отправляется раньше.
+
+            key (tuple): Ключ объединения: вызов с тем же ключом, ещё
+            стоящий в очереди, заменяется новым.
+
+            wait (bool): Вернуть Future с результатом вызова. Иначе
+            ошибки вызова только записываются в лог.
+        """
+        future = asyncio.get_event_loop().create_future() if wait else None
+        item = self._keys.get(key) if key is not None else None
+        if item is not None and not item.cancelled:
+            item.params = params
+            self.coalesced += 1
+        else:
+            item = OutboxItem(chat_id, method, params, priority,
+                              next(self._seq), key)
+            if key is not None:
+                self._keys[key] = item
+            heapq.heappush(self._pending.setdefault(chat_id, []),
+                           (item.priority, item.seq, item))
+            self._schedule(chat_id)
+        if future is not None:
+            item.futures.append(future)
+        return future
+
+    async def send_message(self, chat_id: ChatId, text: str, **kwargs):
+        """Метод отправки сообщения, ожидающий ответа Telegram."""
+        return await self.submit(chat_id, 'send_message',
+                                 dict(chat_id=chat_id, text=text, **kwargs),
+                                 wait=True)
+
+    async def edit_message_text(self, text: str, chat_id: ChatId,
+                                message_id: int, **kwargs):
+        """Метод изменения текста сообщения, ожидающий ответа Telegram."""
+        return await self.submit(
+            chat_id, 'edit_message_text',
+            dict(text=text, chat_id=chat_id, message_id=message_id,
+                 **kwargs),
+            key=('edit', chat_id, message_id), wait=True
+        )
+
+    def edit_message_reply_markup(self, chat_id: ChatId, message_id: int,
+                                  reply_markup=None) -> None:
+        """Метод фоновой замены клавиатуры сообщения."""
+        self.submit(chat_id, 'edit_message_reply_markup',
+                    dict(chat_id=chat_id, message_id=message_id,
+                         reply_markup=reply_markup),
+                    priority=PRIORITY_CLEANUP,
+                    key=('markup', chat_id, message_id))
+
+    def delete_message(self, chat_id: ChatId, message_id: int) -> None:
+        """Метод фонового удаления сообщения."""
+        for kind in ('edit', 'markup'):
+            item = self._keys.get((kind, chat_id, message_id))
+            # Правку, результата которой никто не ждёт, незачем отправлять.
+            if item is not None and not item.futures:
+                item.cancelled = True
+                del self._keys[item.key]
+        self.submit(chat_id, 'delete_message',
+                    dict(chat_id=chat_id, message_id=message_id),
+                    priority=PRIORITY_CLEANUP,
+                    key=('delete', chat_id, message_id))
+
+    def _schedule(self, chat_id: ChatId) -> None:
+        """Метод постановки чата в очередь готовых или ожидающих."""
+        queue = self._pending.get(chat_id)
+        if not queue or chat_id in self._in_flight:
+            return
+        ready_at = self._ready_at.get(chat_id, 0.0)
+        if ready_at > time.monotonic():
+            heapq.heappush(self._sleeping, (ready_at, chat_id))
+        else:
+            priority, seq, _ = queue[0]
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+        self._wakeup.set()
+
+    def _pop_ready(self) -> typing.Optional[OutboxItem]:
+        """Метод выбора самого приоритетного вызова среди готовых чатов.
+
+        Записи в кучах не удаляются при изменении очереди чата, поэтому
+        устаревшие записи пропускаются здесь.
+        """
+        now = time.monotonic()
+        while self._sleeping and self._sleeping[0][0] <= now:
+            _, chat_id = heapq.heappop(self._sleeping)
+            self._schedule(chat_id)
+        while self._ready:
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._pending.get(chat_id)
+            if (not queue or chat_id in self._in_flight
+                    or queue[0][:2] != (priority, seq)):
+                continue
+            item = heapq.heappop(queue)[2]
+            if not queue:
+                del self._pending[chat_id]
+            if item.key is not None and self._keys.get(item.key) is item:
+                del self._keys[item.key]
+            if item.cancelled:
+                self._schedule(chat_id)
+                continue
+            return item
+        return None
+
+    async def _next_item(self) -> OutboxItem:
+        while True:
+            item = self._pop_ready()
+            if item is not None:
+                return item
+            timeout = None
+            if self._sleeping:
+                timeout = max(0.0, self._sleeping[0][0] - time.monotonic())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _purge_ready_at(self) -> None:
+        now = time.monotonic()
+        self._ready_at = {chat_id: ready_at
+                          for chat_id, ready_at in self._ready_at.items()
+                          if ready_at > now or chat_id in self._pending}
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            item = await self._next_item()
+            self._in_flight.add(item.chat_id)
+            await self._rate.acquire(math.inf)
+            if len(self._ready_at) > 10000:
+                self._purge_ready_at()
+            task = asyncio.ensure_future(self._execute(item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, item: OutboxItem) -> None:
+        try:
+            result = await getattr(self.bot, item.method)(**item.params)
+        except RetryAfter as error:
+            OUTBOX_RETRIES.inc(item.method)
+            self._ready_at[item.chat_id] = time.monotonic() + error.timeout
+            if item.retries < self.max_retries:
+                item.retries += 1
+                if item.key is not None:
+                    self._keys.setdefault(item.key, item)
+                heapq.heappush(self._pending.setdefault(item.chat_id, []),
+                               (item.priority, item.seq, item))
+            else:
+                self._fail(item, error)
+        except Exception as error:
+            self._fail(item, error)
+        else:
+            self.sent += 1
+            for future in item.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # Интервал отсчитывается от ответа, а не от отправки: иначе
+            # из-за разброса задержек сети два вызова в чат могут дойти
+            # до Telegram чаще chat_rate.
+            self._ready_at[item.chat_id] = max(
+                self._ready_at.get(item.chat_id, 0.0),
+                time.monotonic() + self.chat_interval
+            )
+            self._in_flight.discard(item.chat_id)
+            self._slots.release()
+            self._schedule(item.chat_id)
+
+    @staticmethod
+    def _fail(item: OutboxItem, error: Exception) -> None:
+        if not item.futures:
+            logger.error('Ошибка вызова %s для чата %s: %s',
+                         item.method, item.chat_id, error)
+        for future in item.futures:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,171 @@
+"""Polling"""
+import asyncio
+import heapq
+import typing
+
+from aiogram import Bot, types
+from aiogram.utils.exceptions import (CantGetUpdates, TelegramAPIError,
+                                      Unauthorized)
+
+from logger import logger
+from update_pool import UpdatePool
+
+
+class Poller:
+    """Приём обновлений через getUpdates с параллельной обработкой.
+
+    Обновления запрашиваются пачками до limit штук с длинным опросом
+    и передаются в пул обработчиков, который сохраняет порядок внутри
+    чата. Telegram считает обновление доставленным, когда следующий
+    getUpdates приходит со смещением больше его номера, поэтому смещение
+    продвигается только до первого ещё не обработанного обновления:
+    после перезапуска бота необработанные обновления придут снова.
+    Повторно полученные обновления, которые уже обрабатываются или
+    обработаны, пропускаются.
+
+    Окно необработанных обновлений не превышает limit: если самое старое
+    обновление обрабатывается долго, приём новых ждёт его завершения.
+    Следующая пачка запрашивается, когда в окне освободилась хотя бы
+    половина мест, так что смещение подтверждается пачками.
+    """
+
+    def __init__(self, bot: Bot, pool: UpdatePool, limit: int = 100,
+                 timeout: int = 30,
+                 allowed_updates: typing.Optional[typing.List[str]] = None,
+                 retry_delay: float = 1.0,
+                 max_retry_delay: float = 30.0) -> None:
+        self.bot = bot
+        self.pool = pool
+        self.limit = limit
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.received = 0
+        self.duplicates = 0
+        self._last_update_id = -1
+        # Номера полученных обновлений; обработанные удаляются из кучи
+        # при вычислении смещения.
+        self._fetched: typing.List[int] = []
+        self._in_flight: typing.Set[int] = set()
+        self._advanced = asyncio.Event()
+        self._requested_offset = 0
+        self._stopping = False
+        self._request: typing.Optional[asyncio.Task] = None
+
+    @property
+    def offset(self) -> int:
+        """Смещение для getUpdates: первое не обработанное обновление."""
+        while self._fetched and self._fetched[0] not in self._in_flight:
+            heapq.heappop(self._fetched)
+        if self._fetched:
+            return self._fetched[0]
+        return self._last_update_id + 1
+
+    async def run(self) -> None:
+        """Метод приёма обновлений до вызова stop_polling.
+
+        После остановки дожидается обработки принятых обновлений
+        и подтверждает их в Telegram. Вебхук снимается, только если
+        Telegram отказал в getUpdates из-за него: при остановке бот
+        снимает вебхук сам, и лишний запрос задерживал бы запуск.
+        """
+        self._stopping = False
+        self.pool.start()
+        delay = self.retry_delay
+        try:
+            while not self._stopping:
+                await self._wait_for_window()
+                try:
+                    updates = await self._get_updates()
+                except asyncio.CancelledError:
+                    if self._stopping:
+                        break
+                    raise
+                except Unauthorized:
+                    raise
+                except CantGetUpdates:
+                    logger.warning('Снимаем вебхук, мешающий getUpdates')
+                    await self.bot.delete_webhook()
+                    continue
+                except (TelegramAPIError, asyncio.TimeoutError) as error:
+                    # Сетевые ошибки и конфликт с другим getUpdates.
+                    logger.error('Ошибка получения обновлений: %s', error)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+                delay = self.retry_delay
+                await self._dispatch(updates)
+        finally:
+            await self.pool.stop()
+            await self._commit()
+
+    def stop_polling(self) -> None:
+        """Метод остановки приёма обновлений; текущий длинный опрос
+        прерывается.
+        """
+        self._stopping = True
+        self._advanced.set()
+        if self._request is not None:
+            self._request.cancel()
+
+    async def _wait_for_window(self) -> None:
+        """Метод ожидания, пока в окне освободится хотя бы половина мест.
+
+        Иначе getUpdates вернул бы в основном уже полученные обновления,
+        а смещение подтверждалось бы по одному обновлению.
+        """
+        while (self._last_update_id - self.offset + 1 > self.limit // 2
+               and not self._stopping):
+            self._advanced.clear()
+            await self._advanced.wait()
+
+    def _fetch(self, offset: int) -> typing.Awaitable[typing.List]:
+        """Метод запроса пачки обновлений, начиная с offset."""
+        return self.bot.get_updates(offset=offset, limit=self.limit,
+                                    timeout=self.timeout,
+                                    allowed_updates=self.allowed_updates)
+
+    async def _get_updates(self) -> typing.List[types.Update]:
+        self._requested_offset = self.offset
+        self._request = asyncio.ensure_future(
+            self._fetch(self._requested_offset)
+        )
+        try:
+            return await self._request
+        finally:
+            self._request = None
+
+    async def _dispatch(self, updates: typing.List[types.Update]) -> None:
+        new = [update for update in updates
+               if update.update_id > self._last_update_id]
+        self.duplicates += len(updates) - len(new)
+        if updates and not new:
+            # Окно заполнено обновлениями в обработке: ждём, пока
+            # обработается самое старое, иначе Telegram вернёт те же.
+            if self.offset == self._requested_offset:
+                self._advanced.clear()
+                await self._advanced.wait()
+            return
+        for update in new:
+            self._last_update_id = update.update_id
+            self._in_flight.add(update.update_id)
+            heapq.heappush(self._fetched, update.update_id)
+            self.received += 1
+            await self.pool.submit(update, self._processed)
+
+    def _processed(self, update: types.Update) -> None:
+        oldest = self.offset
+        self._in_flight.discard(update.update_id)
+        if update.update_id == oldest:
+            self._advanced.set()
+
+    async def _commit(self) -> None:
+        """Метод подтверждения обработанных обновлений в Telegram."""
+        if self._last_update_id < 0:
+            return
+        try:
+            await self.bot.get_updates(offset=self.offset, limit=1,
+                                       timeout=0)
+        except TelegramAPIError as error:
+            logger.error('Не удалось подтвердить обновления: %s', error)
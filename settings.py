@@ -0,0 +1,202 @@
+"""Settings"""
+import os
+import typing
+
+from dotenv import load_dotenv
+
+DEFAULT_CITY_INDEX_PATH = os.path.join(os.path.dirname(__file__), 'weather',
+                                       'data', 'cities.tsv')
+
+
+class Settings(typing.NamedTuple):
+    """Настройки бота.
+
+    Каждое поле читается из переменной окружения с тем же именем
+    в верхнем регистре, например api_token - из API_TOKEN. Значения
+    приводятся к типу поля, для логических полей включением считается
+    '1'.
+    """
+    # Telegram.
+    api_token: typing.Optional[str] = None
+    admin_chat_id: typing.Optional[str] = None
+    # Адрес Bot API: локальный сервер telegram-bot-api или тестовый стенд.
+    telegram_api_url: typing.Optional[str] = None
+
+    # Режим запуска бота: polling или webhook; worker - процесс-обработчик,
+    # который запускает супервизор при BOT_PROCESSES больше 1.
+    bot_mode: str = 'polling'
+    webhook_host: typing.Optional[str] = None
+    webhook_port: int = 8443
+    # Публичный адрес, который регистрируется в Telegram как вебхук.
+    webhook_url: typing.Optional[str] = None
+    # Количество фоновых обработчиков обновлений и размер их очереди.
+    update_workers: int = 32
+    update_queue_size: int = 1000
+    # Размер пачки getUpdates и время длинного опроса в секундах.
+    polling_limit: int = 100
+    polling_timeout: int = 30
+    # Порт страницы /metrics в режиме polling; если не задан, она
+    # не запускается.
+    metrics_port: typing.Optional[int] = None
+    # Отчёт о времени импорта модулей и запуска бота.
+    startup_profile: bool = False
+
+    # Количество процессов-обработчиков; при 1 бот работает в одном
+    # процессе.
+    bot_processes: int = 1
+    # Интервал проверки обработчиков и время без ответа на проверку,
+    # после которого обработчик перезапускается, в секундах.
+    health_check_interval: float = 5
+    health_check_timeout: float = 30
+    # Время на обработку принятых обновлений при остановке обработчика.
+    worker_stop_timeout: float = 60
+    # Номер процесса-обработчика и их общее количество; задаются
+    # супервизором, в одиночном процессе шард один.
+    shard_index: int = 0
+    shard_count: int = 1
+    # Дескриптор сокета связи с супервизором, задаётся обработчику.
+    shard_fd: typing.Optional[int] = None
+
+    # Логи.
+    log_level: str = 'INFO'
+    log_file: str = 'bot.log'
+    # Формат записей: text или json (одна JSON-строка на запись).
+    log_format: str = 'text'
+    log_max_bytes: int = 5000000
+    log_backup_count: int = 0
+    # Максимальное количество записей, сбрасываемых на диск за одну запись.
+    log_batch_size: int = 500
+
+    # Хранилище состояний FSM: memory, sqlite или redis.
+    fsm_storage: str = 'memory'
+    fsm_sqlite_path: str = 'fsm.sqlite3'
+    fsm_redis_url: str = 'redis://localhost:6379/1'
+    # Время жизни брошенного состояния в секундах.
+    fsm_state_ttl: int = 3600
+
+    # Ограничение частоты обновлений от одного пользователя: в секунду
+    # и допустимый всплеск; при 0 не ограничивается.
+    throttle_rate: float = 1
+    throttle_burst: float = 5
+    # Повторно доставленные обновления (с уже полученным номером)
+    # в пределах этого окна в секундах отбрасываются; 0 - нет.
+    throttle_duplicate_window: float = 2
+
+    # Ограничения Telegram на отправку: сообщений в секунду на бота
+    # и на чат.
+    outbox_global_rate: float = 30
+    outbox_chat_rate: float = 1
+    outbox_concurrency: int = 16
+
+    # Подписки.
+    subscriptions_path: str = 'subscriptions.sqlite3'
+    # Часовой пояс времени рассылки, если пользователь не указал свой.
+    subscription_timezone: str = 'Europe/Moscow'
+    subscriptions_limit: int = 5
+
+    # API погоды.
+    weather_api_key: typing.Optional[str] = None
+    weather_api_url: str = 'https://api.openweathermap.org'
+    # Параметры пула соединений с API погоды.
+    weather_pool_limit: int = 100
+    weather_pool_limit_per_host: int = 50
+    weather_keepalive_timeout: float = 60
+    weather_dns_cache_ttl: int = 300
+    weather_connect_timeout: float = 5
+    weather_request_timeout: float = 10
+    # Тайм-аут одной попытки запроса и число повторов при временных
+    # ошибках.
+    weather_attempt_timeout: float = 5
+    weather_retries: int = 2
+    weather_retry_base_delay: float = 0.2
+    weather_retry_max_delay: float = 2
+    # Квота тарифа API погоды: запросов в секунду и допустимый всплеск.
+    weather_rate_per_second: float = 1
+    weather_rate_burst: float = 60
+    # Сколько секунд запрос может ждать квоту или место среди
+    # одновременных запросов, прежде чем будет сброшен.
+    weather_rate_max_wait: float = 2
+    # Максимальное количество одновременных запросов к API погоды.
+    weather_concurrency: int = 50
+    # Параметры выключателя запросов к неисправному API.
+    circuit_failure_threshold: int = 5
+    circuit_recovery_timeout: float = 30
+    # Параметры кэша ответов API погоды.
+    weather_cache_ttl: float = 600
+    weather_cache_size: int = 10000
+    # Сколько секунд после истечения срока хранится устаревшая запись и
+    # сколько секунд ждать API, прежде чем отдать её пользователю.
+    weather_cache_stale_ttl: float = 600
+    weather_stale_timeout: float = 1
+    # Прогноз обновляется в API раз в 3 часа, поэтому хранится дольше.
+    forecast_cache_ttl: float = 1800
+    forecast_cache_size: int = 1000
+    # Параметры фонового обновления популярных запросов.
+    prefetch_top_k: int = 100
+    prefetch_interval: float = 30
+    prefetch_ahead: float = 60
+    prefetch_rate_per_minute: float = 30
+    # Постоянное хранилище кэша: memory, sqlite, redis или пусто
+    # (без него).
+    weather_cache_backend: str = ''
+    weather_cache_sqlite_path: str = 'weather_cache.sqlite3'
+    weather_cache_redis_url: str = 'redis://localhost:6379/0'
+    # Таймаут подключения и обмена командами с Redis в секундах.
+    weather_cache_redis_timeout: float = 0.5
+    # Прогревать ли кэш из постоянного хранилища при старте бота.
+    weather_cache_warm: bool = True
+    # Максимальное число городов в одном групповом запросе к API и
+    # количество одновременно выполняемых групповых запросов.
+    weather_group_size: int = 20
+    weather_group_concurrency: int = 4
+    # Файл истории наблюдений погоды по городам для команды /trend;
+    # по умолчанию история не сохраняется и команда недоступна.
+    weather_history_path: str = ''
+    # За сколько дней команда /trend показывает изменение погоды.
+    weather_history_days: int = 30
+    # Файл с сохранёнными идентификаторами городов API погоды.
+    city_ids_path: str = 'city_ids.json'
+    # Локальный справочник городов. В строгом режиме названия, которых
+    # нет в справочнике, отклоняются без запроса к API.
+    city_index_path: str = DEFAULT_CITY_INDEX_PATH
+    city_index_strict: bool = False
+    # Радиус в километрах, в котором запрос по геолокации может получить
+    # погоду недавнего соседнего наблюдения вместо запроса к API.
+    geo_snap_radius_km: float = 3
+    # Число знаков после запятой при округлении координат до ячейки сетки.
+    location_cache_precision: int = 2
+
+
+def parse_value(value: str, annotation: typing.Any) -> typing.Any:
+    """Функция приведения значения переменной окружения к типу поля."""
+    if typing.get_origin(annotation) is typing.Union:
+        # Optional[X]: пустая строка считается незаданным значением.
+        if not value:
+            return None
+        annotation = typing.get_args(annotation)[0]
+    if annotation is bool:
+        return value == '1'
+    return annotation(value)
+
+
+def load_settings(environ: typing.Optional[typing.Mapping[str, str]] = None
+                  ) -> Settings:
+    """Функция чтения настроек из окружения.
+
+    Если окружение не передано, используется os.environ, дополненное
+    переменными из файла .env.
+    """
+    if environ is None:
+        load_dotenv()
+        environ = os.environ
+    annotations = typing.get_type_hints(Settings)
+    values = {}
+    for field in Settings._fields:
+        value = environ.get(field.upper())
+        if value is not None:
+            values[field] = parse_value(value, annotations[field])
+    settings = Settings(**values)
+    return settings._replace(log_level=settings.log_level.upper())
+
+
+settings = load_settings()
@@ -0,0 +1,47 @@
+"""Shards"""
+import typing
+
+from settings import settings
+
+# События, в которых чат указан в поле chat, в порядке проверки
+# get_update_chat_id.
+CHAT_EVENTS = ('message', 'edited_message', 'channel_post',
+               'edited_channel_post')
+MEMBER_EVENTS = ('my_chat_member', 'chat_member')
+USER_EVENTS = ('inline_query', 'chosen_inline_result')
+
+
+def get_raw_update_chat_id(data: typing.Dict) -> typing.Optional[int]:
+    """Функция, возвращающая чат обновления по его JSON без разбора
+    в объекты aiogram; результат совпадает с get_update_chat_id.
+    """
+    for event in CHAT_EVENTS:
+        if event in data:
+            return data[event]['chat']['id']
+    callback_query = data.get('callback_query')
+    if callback_query is not None:
+        message = callback_query.get('message')
+        if message is not None:
+            return message['chat']['id']
+        return callback_query['from']['id']
+    for event in USER_EVENTS:
+        if event in data:
+            return data[event]['from']['id']
+    for event in MEMBER_EVENTS:
+        if event in data:
+            return data[event]['chat']['id']
+    return None
+
+
+def get_shard(chat_id: int, count: int = settings.shard_count) -> int:
+    """Функция, возвращающая номер шарда, который обслуживает чат.
+
+    Номер зависит только от чата и количества шардов, поэтому все
+    обновления чата попадают в один процесс вместе с его состоянием.
+    """
+    return chat_id % count
+
+
+def owns_chat(chat_id: int) -> bool:
+    """Функция, проверяющая, что чат обслуживает текущий процесс."""
+    return get_shard(chat_id) == settings.shard_index
@@ -0,0 +1,105 @@
+"""Startup profiling"""
+import builtins
+import contextlib
+import sys
+import time
+import typing
+
+from settings import settings
+
+
+class ImportTime(typing.NamedTuple):
+    """Время импорта модуля в секундах: всего и без вложенных импортов."""
+    module: str
+    total: float
+    own: float
+
+
+class StartupProfiler:
+    """Замер времени запуска бота: импорта модулей и шагов инициализации.
+
+    Импорты замеряются подменой builtins.__import__, поэтому профилировщик
+    нужно включить до импорта остальных модулей. Время собственного
+    модуля включает выполнение его кода верхнего уровня, то есть
+    создание объектов при импорте. Относительные импорты внутри пакетов
+    относятся к импортирующему модулю.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.imports: typing.List[ImportTime] = []
+        self.steps: typing.List[typing.Tuple[str, float]] = []
+        # Суммарное время вложенных импортов для каждого уровня.
+        self._nested: typing.List[float] = []
+        self._import = builtins.__import__
+
+    def install(self) -> None:
+        if self.enabled:
+            builtins.__import__ = self._timed_import
+
+    def uninstall(self) -> None:
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(),
+                      level=0):
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._nested.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += total
+            self.imports.append(ImportTime(name, total, total - nested))
+
+    @contextlib.contextmanager
+    def step(self, name: str) -> typing.Iterator[None]:
+        """Контекстный менеджер замера шага запуска."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.steps.append((name, time.perf_counter() - started))
+
+    def report(self, limit: int = 25) -> str:
+        """Метод, возвращающий отчёт: шаги запуска, импорты по пакетам
+        и самые долгие модули.
+        """
+        packages: typing.Dict[str, float] = {}
+        for record in self.imports:
+            package = record.module.partition('.')[0]
+            packages[package] = packages.get(package, 0.0) + record.own
+        lines = [f'Запуск: {time.perf_counter() - self.started:.3f} с, '
+                 f'импорт модулей: {sum(packages.values()):.3f} с', '',
+                 'Шаги запуска, мс:']
+        lines += [f'{duration * 1000:10.1f}  {name}'
+                  for name, duration in self.steps]
+        lines += ['', 'Импорт по пакетам, мс:']
+        lines += [f'{duration * 1000:10.1f}  {package}'
+                  for package, duration in sorted(packages.items(),
+                                                  key=lambda item: -item[1])
+                  [:limit]]
+        lines += ['', 'Модули, мс (собственное / всего):']
+        lines += [f'{record.own * 1000:10.1f} {record.total * 1000:10.1f}  '
+                  f'{record.module}'
+                  for record in sorted(self.imports,
+                                       key=lambda record: -record.own)
+                  [:limit]]
+        return '\n'.join(lines)
+
+    def finish(self) -> None:
+        """Метод завершения замера: отчёт выводится в stderr."""
+        if not self.enabled:
+            return
+        self.uninstall()
+        sys.stderr.write(self.report() + '\n')
+        sys.stderr.flush()
+
+
+profiler = StartupProfiler(enabled=settings.startup_profile)
+profiler.install()
@@ -0,0 +1,310 @@
+"""Subscriptions"""
+import asyncio
+import heapq
+import sqlite3
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from aiogram.types import Location
+
+from bot import outbox
+from logger import logger
+from outbox import PRIORITY_BROADCAST
+from settings import settings
+from shards import owns_chat
+from weather.exceptions import (GetWeatherFromJSONError, WeatherAPIError,
+                                WeatherCustomError)
+from weather.weather_messages import render_weather_reply
+from weather.weather_service import (get_weather_for_city,
+                                     get_weather_for_location)
+
+
+class Subscription(typing.NamedTuple):
+    """Подписка чата на ежедневную погоду в городе или по координатам."""
+    chat_id: int
+    # Название города или None для подписки по геолокации.
+    city: typing.Optional[str]
+    latitude: typing.Optional[float]
+    longitude: typing.Optional[float]
+    # Время рассылки в минутах от полуночи по местному времени.
+    minute: int
+    timezone: str
+
+    @property
+    def target(self) -> typing.Tuple:
+        """Что запрашивать у API: город или округлённые координаты."""
+        if self.city is not None:
+            return ('city', self.city)
+        precision = settings.location_cache_precision
+        return ('location', round(self.latitude, precision),
+                round(self.longitude, precision))
+
+    @property
+    def slot(self) -> typing.Tuple:
+        """Группа подписок, которым погода отправляется одновременно."""
+        return (self.timezone, self.minute, self.target)
+
+
+class SQLiteSubscriptionStore:
+    """Хранилище подписок в файле SQLite.
+
+    Файл открывается при первом обращении, поэтому процессы, которые
+    не рассылают погоду (супервизор), его не создают.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # Один поток гарантирует последовательный доступ к соединению.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection: typing.Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False,
+                                               isolation_level=None,
+                                               timeout=30)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS subscription ('
+                'chat_id INTEGER NOT NULL, target TEXT NOT NULL, city TEXT, '
+                'latitude REAL, longitude REAL, minute INTEGER NOT NULL, '
+                'timezone TEXT NOT NULL, PRIMARY KEY (chat_id, target)) '
+                'WITHOUT ROWID'
+            )
+        return self._connection
+
+    async def _run(self, function, *args) -> typing.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _load(self) -> typing.List[Subscription]:
+        rows = self._connect().execute(
+            'SELECT chat_id, city, latitude, longitude, minute, timezone '
+            'FROM subscription'
+        ).fetchall()
+        return [Subscription(*row) for row in rows]
+
+    def _save(self, subscription: Subscription) -> None:
+        self._connect().execute(
+            'INSERT OR REPLACE INTO subscription (chat_id, target, city, '
+            'latitude, longitude, minute, timezone) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (subscription.chat_id, repr(subscription.target),
+             subscription.city, subscription.latitude,
+             subscription.longitude, subscription.minute,
+             subscription.timezone)
+        )
+
+    def _delete(self, subscription: Subscription) -> None:
+        self._connect().execute(
+            'DELETE FROM subscription WHERE chat_id = ? AND target = ?',
+            (subscription.chat_id, repr(subscription.target))
+        )
+
+    async def load(self) -> typing.List[Subscription]:
+        return await self._run(self._load)
+
+    async def save(self, subscription: Subscription) -> None:
+        await self._run(self._save, subscription)
+
+    async def delete(self, subscription: Subscription) -> None:
+        await self._run(self._delete, subscription)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._run(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+def get_next_run(minute: int, timezone: str, now: float) -> float:
+    """Функция, возвращающая ближайший момент рассылки после now.
+
+    Время считается в часовом поясе подписки, поэтому переходы на летнее
+    время учитываются при каждом пересчёте.
+    """
+    zone = ZoneInfo(timezone)
+    local_now = datetime.fromtimestamp(now, zone)
+    run_at = local_now.replace(hour=minute // 60, minute=minute % 60,
+                               second=0, microsecond=0)
+    if run_at.timestamp() <= now:
+        run_at += timedelta(days=1)
+    return run_at.timestamp()
+
+
+class SubscriptionScheduler:
+    """Планировщик ежедневной рассылки погоды подписчикам.
+
+    Подписки с одинаковыми временем, часовым поясом и городом (или
+    ячейкой координат) объединяются в слот: погода для слота
+    запрашивается один раз и рассылается всем его чатам. В куче
+    хранится по одной записи на слот, поэтому стоимость планирования
+    зависит от числа слотов, а не подписчиков. Сообщения отправляются
+    через очередь исходящих сообщений с низким приоритетом.
+    """
+
+    def __init__(self, store: SQLiteSubscriptionStore) -> None:
+        self.store = store
+        self.delivered = 0
+        self._slots: typing.Dict[typing.Tuple, typing.Set[int]] = {}
+        self._next_run: typing.Dict[typing.Tuple, float] = {}
+        self._by_chat: typing.Dict[int, typing.Dict[typing.Tuple,
+                                                    Subscription]] = {}
+        # Записи (время рассылки, слот); устаревшие пропускаются.
+        self._heap: list = []
+        self._wakeup = asyncio.Event()
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(chats) for chats in self._by_chat.values())
+
+    async def start(self) -> None:
+        """Метод загрузки подписок из хранилища и запуска рассылки.
+
+        При запуске в нескольких процессах каждый загружает только
+        подписки своих чатов, чтобы погода не приходила несколько раз.
+        """
+        for subscription in await self.store.load():
+            if owns_chat(subscription.chat_id):
+                self._add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Метод остановки рассылки и закрытия хранилища подписок."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.store.close()
+
+    def get_subscriptions(self, chat_id: int) -> typing.List[Subscription]:
+        """Метод, возвращающий подписки чата."""
+        return list(self._by_chat.get(chat_id, {}).values())
+
+    async def subscribe(self, subscription: Subscription) -> None:
+        """Метод добавления подписки или изменения времени рассылки."""
+        await self.store.save(subscription)
+        self._remove(subscription.chat_id, subscription.target)
+        self._add(subscription)
+
+    async def unsubscribe(self, chat_id: int,
+                          city: typing.Optional[str] = None) -> int:
+        """Метод удаления подписок чата на город или всех подписок чата.
+
+        Возвращает количество удалённых подписок.
+        """
+        removed = [subscription
+                   for subscription in self.get_subscriptions(chat_id)
+                   if city is None or subscription.city == city]
+        for subscription in removed:
+            await self.store.delete(subscription)
+            self._remove(chat_id, subscription.target)
+        return len(removed)
+
+    def _add(self, subscription: Subscription) -> None:
+        slot = subscription.slot
+        self._by_chat.setdefault(subscription.chat_id, {})[
+            subscription.target] = subscription
+        chats = self._slots.setdefault(slot, set())
+        chats.add(subscription.chat_id)
+        if len(chats) == 1:
+            self._schedule(slot, time.time())
+
+    def _remove(self, chat_id: int, target: typing.Tuple) -> None:
+        subscriptions = self._by_chat.get(chat_id, {})
+        subscription = subscriptions.pop(target, None)
+        if not subscriptions:
+            self._by_chat.pop(chat_id, None)
+        if subscription is None:
+            return
+        chats = self._slots.get(subscription.slot)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                # Запись в куче станет устаревшей и будет пропущена.
+                del self._slots[subscription.slot]
+                del self._next_run[subscription.slot]
+
+    def _schedule(self, slot: typing.Tuple, now: float) -> None:
+        timezone, minute, _ = slot
+        run_at = get_next_run(minute, timezone, now)
+        self._next_run[slot] = run_at
+        heapq.heappush(self._heap, (run_at, slot))
+        if self._heap[0][1] == slot:
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> typing.List[typing.Tuple]:
+        """Метод выбора слотов, время рассылки которых наступило."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            run_at, slot = heapq.heappop(self._heap)
+            if self._next_run.get(slot) != run_at:
+                continue
+            due.append(slot)
+            self._schedule(slot, now)
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, self._heap[0][0] - time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            due = self._pop_due(time.time())
+            if not due:
+                continue
+            # Ошибка одного слота не должна останавливать рассылку
+            # остальных и сам планировщик.
+            results = await asyncio.gather(
+                *(self._deliver(slot) for slot in due),
+                return_exceptions=True
+            )
+            for slot, result in zip(due, results):
+                if isinstance(result, BaseException):
+                    logger.error('Ошибка рассылки погоды для %s: %r',
+                                 slot, result)
+
+    async def _deliver(self, slot: typing.Tuple) -> None:
+        """Метод запроса погоды для слота и рассылки её подписчикам."""
+        chats = list(self._slots.get(slot, ()))
+        if not chats:
+            return
+        target = slot[2]
+        try:
+            if target[0] == 'city':
+                weather = await get_weather_for_city(target[1])
+                name = target[1]
+            else:
+                weather = await get_weather_for_location(
+                    Location(latitude=target[1], longitude=target[2])
+                )
+                name = weather.name
+            text = render_weather_reply('subscription_message', name,
+                                        weather)
+        except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+                WeatherCustomError) as error:
+            logger.error('Не удалось подготовить рассылку погоды для %s: %s',
+                         target, error)
+            return
+
+        for chat_id in chats:
+            outbox.submit(chat_id, 'send_message',
+                          dict(chat_id=chat_id, text=text),
+                          priority=PRIORITY_BROADCAST)
+        self.delivered += len(chats)
+        logger.debug('Погода для %s поставлена в рассылку %s подписчикам',
+                     target, len(chats))
+
+
+subscription_scheduler = SubscriptionScheduler(
+    SQLiteSubscriptionStore(settings.subscriptions_path)
+)
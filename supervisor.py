@@ -0,0 +1,407 @@
+"""Supervisor"""
+import asyncio
+import collections
+import functools
+import json
+import os
+import socket
+import sys
+import time
+import typing
+
+from aiogram import types
+from aiogram.bot import api
+
+from logger import logger
+from polling import Poller
+from settings import settings
+from shards import get_raw_update_chat_id, get_shard
+from update_pool import UpdatePool
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'main.py')
+PING = b'ping\n'
+PONG = b'pong\n'
+
+
+class RawUpdate(typing.NamedTuple):
+    """Обновление Telegram в том виде, в котором его пересылает
+    супервизор: без разбора в объекты aiogram, только номер, чат
+    и JSON одной строкой.
+    """
+    update_id: int
+    chat_id: typing.Optional[int]
+    line: bytes
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict) -> 'RawUpdate':
+        line = json.dumps(data, separators=(',', ':')).encode()
+        return cls(data['update_id'], get_raw_update_chat_id(data),
+                   line + b'\n')
+
+    @classmethod
+    def from_body(cls, body: bytes) -> 'RawUpdate':
+        data = json.loads(body)
+        # Внутри строк JSON перевод строки экранируется, а между
+        # лексемами его можно заменить пробелом.
+        return cls(data['update_id'], get_raw_update_chat_id(data),
+                   body.replace(b'\n', b' ') + b'\n')
+
+
+RawUpdateCallback = typing.Callable[[RawUpdate], None]
+
+
+def get_worker_environment(index: int,
+                           processes: int) -> typing.Dict[str, str]:
+    """Функция подготовки переменных окружения процесса-обработчика.
+
+    Ограничения Telegram и API погоды действуют на бота целиком, поэтому
+    делятся между процессами поровну. Кэш погоды по умолчанию общий
+    для всех процессов и хранится в SQLite, логи и страницы метрик
+    у каждого процесса свои.
+    """
+    log_root, log_ext = os.path.splitext(settings.log_file)
+    environment = dict(
+        os.environ,
+        BOT_MODE='worker',
+        SHARD_INDEX=str(index),
+        SHARD_COUNT=str(processes),
+        LOG_FILE=f'{log_root}.{index}{log_ext}',
+        OUTBOX_GLOBAL_RATE=str(settings.outbox_global_rate / processes),
+        WEATHER_RATE_PER_SECOND=str(
+            settings.weather_rate_per_second / processes
+        ),
+        WEATHER_RATE_BURST=str(settings.weather_rate_burst / processes),
+        WEATHER_CONCURRENCY=str(
+            max(1, settings.weather_concurrency // processes)
+        ),
+        PREFETCH_RATE_PER_MINUTE=str(
+            settings.prefetch_rate_per_minute / processes
+        ),
+    )
+    environment.setdefault('WEATHER_CACHE_BACKEND', 'sqlite')
+    if settings.metrics_port:
+        environment['METRICS_PORT'] = str(settings.metrics_port + 1 + index)
+    else:
+        environment.pop('METRICS_PORT', None)
+    return environment
+
+
+class WorkerProcess:
+    """Процесс-обработчик одного шарда.
+
+    Обновления передаются процессу JSON-строками через сокет, в ответ
+    приходят номера обработанных обновлений и ответы на проверки.
+    Обновления хранятся до подтверждения: если процесс упал или
+    перестал отвечать, он перезапускается и получает неподтверждённые
+    обновления повторно в прежнем порядке.
+    """
+
+    def __init__(self, index: int, environment: typing.Dict[str, str]
+                 ) -> None:
+        self.index = index
+        self.environment = environment
+        self.restarts = 0
+        self.process: typing.Optional[asyncio.subprocess.Process] = None
+        # Запуск, остановка и перезапуск не выполняются одновременно.
+        self.lock = asyncio.Lock()
+        # Процесс запустился и ответил на первую проверку.
+        self.ready = asyncio.Event()
+        self._pending: typing.Dict[
+            int, typing.Tuple[RawUpdate, RawUpdateCallback]
+        ] = collections.OrderedDict()
+        self._writer: typing.Optional[asyncio.StreamWriter] = None
+        self._reader_task: typing.Optional[asyncio.Task] = None
+        self._last_pong = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def healthy(self, timeout: float) -> bool:
+        """Метод проверки, что процесс жив и отвечал на проверку
+        не раньше timeout секунд назад.
+        """
+        return self.alive and time.monotonic() - self._last_pong < timeout
+
+    async def start(self) -> None:
+        """Метод запуска процесса и повторной отправки ему
+        неподтверждённых обновлений.
+        """
+        parent, child = socket.socketpair()
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, MAIN_PATH,
+            env=dict(self.environment, SHARD_FD=str(child.fileno())),
+            pass_fds=(child.fileno(),),
+        )
+        child.close()
+        reader, writer = await asyncio.open_connection(sock=parent)
+        self._last_pong = time.monotonic()
+        self._reader_task = asyncio.ensure_future(self._read(reader))
+        self._writer = writer
+        self.ready.clear()
+        for update, _ in self._pending.values():
+            writer.write(update.line)
+        writer.write(PING)
+        logger.info('Запущен обработчик %s (pid %s), повторно передано '
+                    'обновлений: %s', self.index, self.process.pid,
+                    len(self._pending))
+
+    async def stop(self, timeout: float) -> None:
+        """Метод остановки процесса после обработки переданных обновлений.
+
+        Процесс, не завершившийся за timeout секунд, убивается.
+        """
+        if self.process is None:
+            return
+        writer, self._writer = self._writer, None
+        if writer is not None and not writer.is_closing():
+            # Конец потока - сигнал обработчику завершиться.
+            writer.write_eof()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.error('Обработчик %s не завершился за %s с', self.index,
+                         timeout)
+            self.process.kill()
+            await self.process.wait()
+        await self._close(writer)
+
+    async def kill(self) -> None:
+        """Метод немедленной остановки зависшего процесса."""
+        writer, self._writer = self._writer, None
+        if self.alive:
+            self.process.kill()
+        await self.process.wait()
+        await self._close(writer)
+
+    async def submit(self, update: RawUpdate,
+                     callback: RawUpdateCallback) -> None:
+        self._pending[update.update_id] = (update, callback)
+        writer = self._writer
+        if writer is None or writer.is_closing():
+            # Процесс перезапускается: обновление будет отправлено
+            # после запуска.
+            return
+        writer.write(update.line)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            # Процесс упал: обновление останется неподтверждённым
+            # и будет отправлено повторно после перезапуска.
+            pass
+
+    def ping(self) -> None:
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(PING)
+
+    async def _close(self, writer: typing.Optional[asyncio.StreamWriter]
+                     ) -> None:
+        # Дочитываем подтверждения, отправленные перед завершением.
+        if self._reader_task is not None:
+            await self._reader_task
+            self._reader_task = None
+        if writer is not None:
+            writer.close()
+
+    async def _read(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                return
+            if not line:
+                return
+            if line == PONG:
+                self._last_pong = time.monotonic()
+                self.ready.set()
+                continue
+            entry = self._pending.pop(int(line), None)
+            if entry is not None:
+                update, callback = entry
+                callback(update)
+
+
+class ShardRouter:
+    """Распределение обновлений между процессами-обработчиками.
+
+    Номер процесса вычисляется по чату обновления, поэтому состояние
+    FSM чата хранится в одном процессе, а его обновления обрабатываются
+    по порядку пулом этого процесса. Интерфейс совпадает с UpdatePool,
+    так что маршрутизатор можно передать в Poller.
+
+    Процессы периодически проверяются: упавший или не ответивший
+    за health_timeout секунд процесс перезапускается. Одновременно
+    в обработке не больше queue_size обновлений.
+    """
+
+    def __init__(self, processes: int, queue_size: int = 1000,
+                 health_interval: float = settings.health_check_interval,
+                 health_timeout: float = settings.health_check_timeout,
+                 stop_timeout: float = settings.worker_stop_timeout) -> None:
+        self.workers = [
+            WorkerProcess(index, get_worker_environment(index, processes))
+            for index in range(processes)
+        ]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.stop_timeout = stop_timeout
+        self.processed = 0
+        self._slots = asyncio.Semaphore(queue_size)
+        self._pending = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._monitor_task: typing.Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._pending
+
+    @property
+    def running(self) -> bool:
+        return self._monitor_task is not None
+
+    def start(self) -> None:
+        """Метод запуска процессов-обработчиков и их проверки.
+
+        Обновления, переданные до запуска процесса, ждут его старта.
+        """
+        if self.running:
+            return
+        self._monitor_task = asyncio.ensure_future(self._monitor())
+
+    async def submit(self, update: RawUpdate,
+                     callback: typing.Optional[RawUpdateCallback] = None
+                     ) -> None:
+        """Метод передачи обновления процессу, обслуживающему его чат."""
+        await self._slots.acquire()
+        self._pending += 1
+        self._drained.clear()
+        # Обновления без чата распределяются по номеру.
+        key = (update.chat_id if update.chat_id is not None
+               else update.update_id)
+        worker = self.workers[get_shard(key, len(self.workers))]
+        await worker.submit(update, functools.partial(self._processed,
+                                                      callback))
+
+    async def wait_ready(self) -> None:
+        """Метод ожидания запуска всех процессов-обработчиков."""
+        await asyncio.gather(*(worker.ready.wait()
+                               for worker in self.workers))
+
+    async def stop(self) -> None:
+        """Метод остановки, дожидающийся обработки переданных обновлений."""
+        if not self.running:
+            return
+        await self._drained.wait()
+        self._monitor_task.cancel()
+        await asyncio.gather(self._monitor_task, return_exceptions=True)
+        self._monitor_task = None
+        await asyncio.gather(*(self._stop_worker(worker)
+                               for worker in self.workers))
+
+    async def restart(self) -> None:
+        """Метод плавного перезапуска процессов по одному.
+
+        Пока процесс дообрабатывает принятые обновления, новые обновления
+        его чатов накапливаются и передаются новому процессу; остальные
+        процессы продолжают работу.
+        """
+        for worker in self.workers:
+            async with worker.lock:
+                await worker.stop(self.stop_timeout)
+                await worker.start()
+                worker.restarts += 1
+
+    def health(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Метод, возвращающий состояние процессов-обработчиков."""
+        return [{
+            'index': worker.index,
+            'pid': worker.process.pid if worker.process else None,
+            'ready': worker.ready.is_set(),
+            'healthy': worker.healthy(self.health_timeout),
+            'pending': len(worker),
+            'restarts': worker.restarts,
+        } for worker in self.workers]
+
+    def _processed(self, callback: typing.Optional[RawUpdateCallback],
+                   update: RawUpdate) -> None:
+        self.processed += 1
+        self._pending -= 1
+        if not self._pending:
+            self._drained.set()
+        self._slots.release()
+        if callback is not None:
+            callback(update)
+
+    async def _stop_worker(self, worker: WorkerProcess) -> None:
+        async with worker.lock:
+            await worker.stop(self.stop_timeout)
+
+    async def _monitor(self) -> None:
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if worker.lock.locked():
+                    continue
+                if worker.healthy(self.health_timeout):
+                    worker.ping()
+                    continue
+                async with worker.lock:
+                    if worker.alive:
+                        logger.error('Обработчик %s не отвечает, '
+                                     'перезапускаем', worker.index)
+                    else:
+                        logger.error('Обработчик %s завершился с кодом %s, '
+                                     'перезапускаем', worker.index,
+                                     worker.process.returncode)
+                    await worker.kill()
+                    await worker.start()
+                    worker.restarts += 1
+
+
+class RawPoller(Poller):
+    """Приём обновлений супервизором без разбора в объекты aiogram:
+    для маршрутизации достаточно номера обновления и чата.
+    """
+
+    async def _fetch(self, offset: int) -> typing.List[RawUpdate]:
+        payload = {'offset': offset, 'limit': self.limit,
+                   'timeout': self.timeout}
+        if self.allowed_updates is not None:
+            payload['allowed_updates'] = json.dumps(self.allowed_updates)
+        result = await self.bot.request(api.Methods.GET_UPDATES, payload)
+        return [RawUpdate.from_dict(data) for data in result]
+
+
+async def serve_shard(pool: UpdatePool) -> None:
+    """Функция приёма обновлений от супервизора в процессе-обработчике.
+
+    Обновления читаются из сокета, пока супервизор его не закроет,
+    и передаются в пул; супервизору возвращаются номера обработанных.
+    Перед возвратом дожидается обработки всех принятых обновлений.
+    """
+    reader, writer = await asyncio.open_connection(
+        sock=socket.socket(fileno=settings.shard_fd)
+    )
+
+    def processed(update: types.Update) -> None:
+        if not writer.is_closing():
+            writer.write(b'%d\n' % update.update_id)
+
+    logger.info('Обработчик %s из %s принимает обновления',
+                settings.shard_index, settings.shard_count)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line == PING:
+            writer.write(PONG)
+            continue
+        await pool.submit(types.Update(**json.loads(line)), processed)
+    await pool.stop()
+    writer.close()
+    await writer.wait_closed()
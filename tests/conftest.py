@@ -0,0 +1,25 @@
+"""Общие настройки тестов.
+
+Модули бота читают настройки из окружения при импорте, поэтому
+окружение задаётся здесь, до импорта тестов: файлы бота пишутся
+во временный каталог, а внешние API указывают на закрытый порт.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix='tests-')
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ.update({
+    'API_TOKEN': '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'TELEGRAM_API_URL': 'http://127.0.0.1:9',
+    'WEATHER_API_URL': 'http://127.0.0.1:9',
+    'WEATHER_API_KEY': 'test',
+    'WEATHER_CACHE_BACKEND': '',
+    'LOG_FILE': os.path.join(_workdir, 'bot.log'),
+    'SUBSCRIPTIONS_PATH': os.path.join(_workdir, 'subscriptions.sqlite3'),
+    'FSM_SQLITE_PATH': os.path.join(_workdir, 'fsm.sqlite3'),
+    'CITY_IDS_PATH': os.path.join(_workdir, 'city_ids.json'),
+    'WEATHER_HISTORY_PATH': '',
+})
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+import pytest
+
+from loadtest.fake_servers import FakeRedisServer
+from weather.cache_backends import (MemoryCacheBackend, RedisCacheBackend,
+                                    SQLiteCacheBackend)
+from weather.weather_cache import WeatherCache
+
+
+async def check_backend(backend) -> None:
+    await backend.set('moscow', b'sunny', 60)
+    value, expires_at = await backend.get('moscow')
+    assert value == b'sunny'
+    assert 55 < expires_at - time.time() <= 60
+    assert await backend.get('kazan') is None
+
+    await backend.set('expired', b'rain', 0.001)
+    await asyncio.sleep(0.01)
+    assert await backend.get('expired') is None
+
+    items = await backend.items(10)
+    assert [(key, value) for key, value, _ in items] == [('moscow', b'sunny')]
+    await backend.close()
+
+
+def test_memory_backend():
+    asyncio.run(check_backend(MemoryCacheBackend()))
+
+
+def test_sqlite_backend(tmp_path):
+    async def scenario():
+        await check_backend(SQLiteCacheBackend(str(tmp_path / 'cache.db')))
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend():
+    async def scenario():
+        server = FakeRedisServer()
+        backend = RedisCacheBackend(await server.start())
+        await check_backend(backend)
+        await server.stop()
+        return server
+
+    server = asyncio.run(scenario())
+    assert server.commands['SET'] == 2
+
+
+def test_redis_backend_times_out_on_hung_server():
+    async def scenario():
+        server = FakeRedisServer(latency=1.0)
+        backend = RedisCacheBackend(await server.start(), timeout=0.05)
+        started = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.get('moscow')
+        elapsed = time.perf_counter() - started
+        # Соединение с неизвестным состоянием не переиспользуется.
+        assert backend._writer is None
+        await backend.close()
+        await server.stop()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_backend_hit_keeps_remaining_ttl():
+    async def scenario():
+        backend = MemoryCacheBackend()
+        await backend.set('moscow', b'sunny', 10)
+        cache = WeatherCache(ttl=600, max_size=10, backend=backend,
+                             deserializer=bytes.decode)
+
+        async def fetch():
+            raise AssertionError('значение должно прийти из хранилища')
+
+        value = await cache.get_or_fetch('moscow', fetch)
+        return cache, value
+
+    cache, value = asyncio.run(scenario())
+    assert value == 'sunny'
+    assert cache.backend_hits == 1
+    assert cache.remaining_ttl('moscow') <= 10
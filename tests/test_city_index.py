@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from weather import weather_service
+from weather.city_index import (CityIndex, is_plausible_city_name,
+                                levenshtein_distance, normalize_city_name)
+
+CITIES_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'weather',
+                           'data', 'cities.tsv')
+
+
+@pytest.fixture(scope='module')
+def city_index():
+    return CityIndex(CITIES_PATH)
+
+
+def test_find_by_name_alias_and_transliteration(city_index):
+    assert city_index.find('москва').city_id == 524901
+    assert city_index.find('Moscow').name == 'Москва'
+    assert city_index.find('Питер').name == 'Санкт-Петербург'
+    assert city_index.find('sankt peterburg').name == 'Санкт-Петербург'
+    assert city_index.find('Атлантида') is None
+
+
+def test_find_by_prefix(city_index):
+    names = [city.name for city in city_index.find_by_prefix('крас')]
+    assert names == ['Краснодар', 'Красноярск']
+    assert city_index.find_by_prefix('кра', limit=1)[0].name == 'Краснодар'
+
+
+def test_find_similar_corrects_typos(city_index):
+    assert city_index.find_similar('Новосибирсп').name == 'Новосибирск'
+    # Короткие названия не исправляются: Орск - не опечатка в Омске.
+    assert city_index.find_similar('Орск') is None
+
+
+@pytest.mark.parametrize('city_name', [
+    'Красногорск', 'Краснодон', 'Хабаровка', 'Берлинго',
+])
+def test_real_cities_are_not_corrected(city_index, city_name):
+    # Настоящие города не из справочника уходят в API как есть.
+    assert city_index.resolve(city_name) is None
+    assert weather_service.get_city_display_name(city_name) == city_name
+    assert weather_service.get_city_cache_key(city_name) == (
+        'city:' + normalize_city_name(city_name)
+    )
+    assert 'q=' in weather_service.get_city_url(city_name)
+
+
+def test_suggestion_is_offered_only_as_a_hint():
+    assert weather_service.get_city_suggestion('Красногорск') == 'Красноярск'
+    assert weather_service.get_city_suggestion('Атлантида') is None
+
+
+def test_levenshtein_distance_stops_early():
+    assert levenshtein_distance('омск', 'орск', 2) == 1
+    assert levenshtein_distance('москва', 'казань', 2) == 3
+
+
+def test_is_plausible_city_name():
+    assert is_plausible_city_name('Ростов-на-Дону')
+    assert is_plausible_city_name("Сен-Мало")
+    assert not is_plausible_city_name('123')
+    assert not is_plausible_city_name('/start')
+    assert not is_plausible_city_name('х' * 100)
@@ -0,0 +1,91 @@
+import types
+
+import pytest
+
+from weather import geo_index as geo_index_module
+from weather.geo_index import GeoIndex, haversine_distance
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(geo_index_module, 'time',
+                        types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_haversine_distance():
+    # Москва - Санкт-Петербург, около 635 км.
+    assert haversine_distance(55.7558, 37.6173,
+                              59.9343, 30.3351) == pytest.approx(635, abs=5)
+    assert haversine_distance(10, 20, 10, 20) == 0
+
+
+def test_nearest_point_within_radius(clock):
+    index = GeoIndex(radius_km=3, max_age=600)
+    index.add(55.75, 37.62, 'center')
+    index.add(55.77, 37.62, 'north')
+    # 1.1 км от center и 1.1 км от north: выбирается ближайший.
+    assert index.nearest(55.751, 37.62) == 'center'
+    assert index.nearest(55.769, 37.62) == 'north'
+    assert index.nearest(55.90, 37.62) is None
+
+
+def test_nearest_across_cell_border_at_high_latitude(clock):
+    index = GeoIndex(radius_km=3, max_age=600)
+    # На 69° широты градус долготы втрое короче, чем на экваторе.
+    index.add(69.0, 33.0, 'murmansk')
+    assert index.nearest(69.0, 33.07) == 'murmansk'
+
+
+def test_old_points_expire_and_are_purged(clock):
+    index = GeoIndex(radius_km=3, max_age=600, max_points=2)
+    index.add(55.75, 37.62, 'moscow')
+    clock.now += 600
+    assert index.nearest(55.75, 37.62) is None
+    index.add(59.93, 30.34, 'spb')
+    index.add(56.84, 60.60, 'ekb')
+    # Переполнение вытесняет самую старую точку.
+    assert len(index) == 2
+    assert index.nearest(59.93, 30.34) == 'spb'
+
+
+def test_same_key_replaces_point(clock):
+    index = GeoIndex(radius_km=3, max_age=600)
+    index.add(55.75, 37.62, 'loc:55.75:37.62')
+    index.add(55.751, 37.621, 'loc:55.75:37.62')
+    assert len(index) == 1
+
+
+def test_overflow_evicts_oldest_fresh_points(clock):
+    index = GeoIndex(radius_km=3, max_age=600, max_points=2)
+    index.add(55.75, 37.62, 'moscow')
+    clock.now += 1
+    index.add(59.93, 30.34, 'spb')
+    clock.now += 1
+    # Повторное добавление делает точку самой новой.
+    index.add(55.75, 37.62, 'moscow')
+    index.add(56.84, 60.60, 'ekb')
+    assert len(index) == 2
+    assert index.nearest(59.93, 30.34) is None
+    assert index.nearest(55.75, 37.62) == 'moscow'
+    assert index.nearest(56.84, 60.60) == 'ekb'
+
+
+def test_purge_removes_expired_points(clock):
+    index = GeoIndex(radius_km=3, max_age=600)
+    index.add(55.75, 37.62, 'moscow')
+    clock.now += 300
+    index.add(59.93, 30.34, 'spb')
+    clock.now += 300
+    index.purge()
+    assert len(index) == 1
+    assert index.nearest(59.93, 30.34) == 'spb'
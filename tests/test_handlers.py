@@ -0,0 +1,243 @@
+import asyncio
+
+import pytest
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher import FSMContext
+from aiogram.types import Message
+
+import handlers
+from fsm_storage import SQLiteStorage
+from weather.exceptions import GetWeatherFromJSONError, WeatherCustomError
+
+
+class FakeOutbox:
+    def __init__(self) -> None:
+        self.sent = []
+        self.deleted = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def delete_message(self, chat_id, message_id):
+        self.deleted.append((chat_id, message_id))
+
+
+def make_message(chat_id, text):
+    return Message.to_object({
+        'message_id': 10,
+        'date': 0,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+        'text': text,
+    })
+
+
+def make_location_message(chat_id, latitude, longitude):
+    return Message.to_object({
+        'message_id': 10,
+        'date': 0,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+        'location': {'latitude': latitude, 'longitude': longitude},
+    })
+
+
+def test_location_is_stored_as_json_coordinates(tmp_path, monkeypatch):
+    # Объект Location не сериализуется в JSON, и хранилища кроме памяти
+    # падали при записи данных состояния.
+    requested = []
+
+    async def get_weather_for_location(location):
+        requested.append((location.latitude, location.longitude))
+        return None
+
+    async def scenario():
+        storage = SQLiteStorage(str(tmp_path / 'fsm.sqlite3'))
+        monkeypatch.setattr(handlers.dp, 'storage', storage)
+        monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+        monkeypatch.setattr(handlers, 'get_weather_for_location',
+                            get_weather_for_location)
+        state = FSMContext(storage, chat=1, user=1)
+        await state.set_state(handlers.WaitingForLocationInput.location)
+        await handlers.get_weather_in_location(
+            make_location_message(1, 55.75, 37.62), state
+        )
+        bucket = await storage.get_bucket(chat=1, user=1)
+        remaining_state = await state.get_state()
+        await storage.close()
+        return bucket, remaining_state
+
+    bucket, remaining_state = asyncio.run(scenario())
+    assert requested == [(55.75, 37.62)]
+    assert bucket['last_location'] == [55.75, 37.62]
+    assert remaining_state is None
+    assert handlers.outbox.sent == [
+        (1, handlers.WEATHER_FOR_LOC_FAILED_MESSAGE)
+    ]
+
+
+def test_save_city_replies_on_weather_error(monkeypatch):
+    async def get_weather_for_city(city):
+        raise WeatherCustomError('ошибка запроса')
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_weather_for_city',
+                        get_weather_for_city)
+    asyncio.run(handlers.save_city(make_message(1, '/save Москва')))
+    assert handlers.outbox.sent == [
+        (1, handlers.WEATHER_UNAVAILABLE_MESSAGE)
+    ]
+
+
+def test_unknown_city_reply_suggests_similar_city():
+    assert handlers.get_city_not_found_text('Красногорск') == (
+        handlers.render_message('city_not_found_suggestion',
+                                'Красногорск', 'Красноярск')
+    )
+    assert handlers.get_city_not_found_text('Атлантида') == (
+        handlers.WEATHER_FOR_LOC_FAILED_MESSAGE
+    )
+
+
+def test_trend_reports_disabled_history(monkeypatch):
+    async def get_history_for_city(city):
+        raise AssertionError('история не ведётся')
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_history_for_city',
+                        get_history_for_city)
+    monkeypatch.setattr(handlers, 'settings',
+                        handlers.settings._replace(weather_history_path=''))
+    asyncio.run(handlers.trend(make_message(1, '/trend Москва')))
+    assert handlers.outbox.sent == [(1, handlers.HISTORY_DISABLED_TEXT)]
+
+
+@pytest.mark.parametrize('error', [GetWeatherFromJSONError('неверный JSON'),
+                                   WeatherCustomError('ошибка запроса')])
+def test_weather_in_city_error_replies_and_finishes_state(monkeypatch,
+                                                          error):
+    async def get_weather_for_city(city):
+        raise error
+
+    async def scenario():
+        storage = MemoryStorage()
+        monkeypatch.setattr(handlers.dp, 'storage', storage)
+        state = FSMContext(storage, chat=1, user=1)
+        await state.set_state(handlers.WaitingForCityInput.city)
+        await state.update_data(last_message_id=5)
+        await handlers.get_weather_in_city(make_message(1, 'Москва'), state)
+        return await state.get_state()
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_weather_for_city',
+                        get_weather_for_city)
+    assert asyncio.run(scenario()) is None
+    assert handlers.outbox.sent == [(1, handlers.WEATHER_UNAVAILABLE_MESSAGE)]
+    assert handlers.outbox.deleted == [(1, 5)]
+
+
+def test_weather_in_location_error_finishes_state(monkeypatch):
+    async def get_weather_for_location(location):
+        raise WeatherCustomError('ошибка запроса')
+
+    async def scenario():
+        storage = MemoryStorage()
+        monkeypatch.setattr(handlers.dp, 'storage', storage)
+        state = FSMContext(storage, chat=1, user=1)
+        await state.set_state(handlers.WaitingForLocationInput.location)
+        await handlers.get_weather_in_location(
+            make_location_message(1, 55.75, 37.62), state
+        )
+        return await state.get_state()
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_weather_for_location',
+                        get_weather_for_location)
+    assert asyncio.run(scenario()) is None
+    assert handlers.outbox.sent == [(1, handlers.WEATHER_UNAVAILABLE_MESSAGE)]
+
+
+class FakeScheduler:
+    def __init__(self) -> None:
+        self.subscriptions = []
+
+    def get_subscriptions(self, chat_id):
+        return self.subscriptions
+
+    async def subscribe(self, subscription):
+        self.subscriptions.append(subscription)
+
+
+def make_subscribe_scenario(monkeypatch):
+    async def check_city(chat_id, city):
+        return True
+
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'check_city', check_city)
+    monkeypatch.setattr(handlers, 'subscription_scheduler', scheduler)
+    return scheduler
+
+
+def test_subscribe_accepts_timezone(monkeypatch):
+    scheduler = make_subscribe_scenario(monkeypatch)
+    asyncio.run(handlers.subscribe(
+        make_message(1, '/subscribe 07:30 Нижний Новгород Asia/Novosibirsk')
+    ))
+    asyncio.run(handlers.subscribe(make_message(1, '/subscribe 08:00 Омск')))
+    assert [(item.city, item.minute, item.timezone)
+            for item in scheduler.subscriptions] == [
+        ('Нижний Новгород', 7 * 60 + 30, 'Asia/Novosibirsk'),
+        ('Омск', 8 * 60, handlers.settings.subscription_timezone),
+    ]
+
+
+def test_subscribe_rejects_unknown_timezone(monkeypatch):
+    scheduler = make_subscribe_scenario(monkeypatch)
+    asyncio.run(handlers.subscribe(
+        make_message(1, '/subscribe 07:30 Москва Europe/Atlantis')
+    ))
+    assert scheduler.subscriptions == []
+    assert handlers.outbox.sent == [
+        (1, handlers.UNKNOWN_TIMEZONE_TEXT.format('Europe/Atlantis'))
+    ]
+
+
+@pytest.mark.parametrize('error', [GetWeatherFromJSONError('неверный JSON'),
+                                   WeatherCustomError('ошибка истории')])
+def test_trend_replies_on_weather_error(monkeypatch, error):
+    async def get_history_for_city(city):
+        raise error
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_history_for_city',
+                        get_history_for_city)
+    monkeypatch.setattr(handlers, 'settings', handlers.settings._replace(
+        weather_history_path='history.db'
+    ))
+    asyncio.run(handlers.trend(make_message(1, '/trend Москва')))
+    assert handlers.outbox.sent == [(1, handlers.WEATHER_UNAVAILABLE_MESSAGE)]
+
+
+@pytest.mark.parametrize('error', [GetWeatherFromJSONError('неверный JSON'),
+                                   WeatherCustomError('ошибка запроса')])
+def test_forecast_replies_on_weather_error(monkeypatch, error):
+    async def get_forecast_for_city(city):
+        raise error
+
+    monkeypatch.setattr(handlers, 'outbox', FakeOutbox())
+    monkeypatch.setattr(handlers, 'get_forecast_for_city',
+                        get_forecast_for_city)
+    asyncio.run(handlers.forecast(make_message(1, '/forecast Москва')))
+    assert handlers.outbox.sent == [(1, handlers.WEATHER_UNAVAILABLE_MESSAGE)]
+
+
+def test_inline_result_id_fits_telegram_limit():
+    city = 'Ж' * 60
+    weather = handlers.WeatherInformation(city, 1.0, 'ясно')
+    result_id = handlers.get_inline_result_id(city, weather)
+    assert len(result_id.encode('UTF-8')) <= 64
+    assert result_id == handlers.get_inline_result_id(city.lower(), weather)
+    assert handlers.get_inline_result_id(
+        'Москва', handlers.WeatherInformation('Москва', 1.0, 'ясно', 524901)
+    ) == '524901'
@@ -0,0 +1,98 @@
+import asyncio
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+
+from middlewares import ThrottlingMiddleware
+
+
+def make_message_update(update_id, user_id, text):
+    return types.Update.to_object({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'text': text,
+        },
+    })
+
+
+def make_callback_update(update_id, user_id, data):
+    return types.Update.to_object({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'message': {'message_id': 1, 'date': 0,
+                        'chat': {'id': user_id, 'type': 'private'}},
+        },
+    })
+
+
+def make_inline_update(update_id, user_id, query):
+    return types.Update.to_object({
+        'update_id': update_id,
+        'inline_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'query': query,
+            'offset': '',
+        },
+    })
+
+
+async def process(middleware, updates):
+    """Функция, возвращающая номера пропущенных обновлений."""
+    passed = []
+    for update in updates:
+        try:
+            await middleware.on_pre_process_update(update, {})
+        except CancelHandler:
+            continue
+        passed.append(update.update_id)
+    return passed
+
+
+def test_repeated_text_is_not_a_duplicate():
+    middleware = ThrottlingMiddleware(rate=0, burst=0, duplicate_window=2)
+    updates = [make_message_update(update_id, 1, 'Москва')
+               for update_id in range(1, 4)]
+    assert asyncio.run(process(middleware, updates)) == [1, 2, 3]
+
+
+def test_redelivered_update_is_dropped():
+    middleware = ThrottlingMiddleware(rate=0, burst=0, duplicate_window=2)
+    update = make_message_update(1, 1, 'Москва')
+    assert asyncio.run(process(middleware, [update, update])) == [1]
+
+
+def test_throttled_callback_query_is_answered(monkeypatch):
+    answered = []
+
+    async def answer(self, *args, **kwargs):
+        answered.append(self.id)
+
+    monkeypatch.setattr(types.CallbackQuery, 'answer', answer)
+    middleware = ThrottlingMiddleware(rate=1, burst=1, duplicate_window=0)
+    updates = [make_callback_update(update_id, 1, 'menu')
+               for update_id in range(1, 4)]
+
+    async def scenario():
+        passed = await process(middleware, updates)
+        # Ответ на отброшенное нажатие отправляется в фоне.
+        await asyncio.sleep(0)
+        return passed
+
+    assert asyncio.run(scenario()) == [1]
+    assert answered == ['2', '3']
+
+
+def test_inline_queries_are_not_throttled():
+    middleware = ThrottlingMiddleware(rate=1, burst=1, duplicate_window=2)
+    updates = [make_inline_update(update_id, 1, 'Мос')
+               for update_id in range(1, 6)]
+    assert asyncio.run(process(middleware, updates)) == [1, 2, 3, 4, 5]
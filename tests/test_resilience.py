@@ -0,0 +1,133 @@
+import types
+
+import pytest
+
+from weather import resilience
+from weather.resilience import CircuitBreaker, KeyedRateLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, 'time',
+                        types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.shed == 1
+
+
+def test_success_resets_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_single_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.transitions == {'closed->open': 1, 'open->half_open': 1,
+                                   'half_open->closed': 1}
+
+
+def test_failed_probe_reopens_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_released_probe_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_keyed_limiter_allows_burst_then_rate(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=3)
+    assert all(limiter.allow('user', clock.now) for _ in range(3))
+    assert not limiter.allow('user', clock.now)
+    assert limiter.limited == 1
+    clock.now += 1
+    assert limiter.allow('user', clock.now)
+    assert not limiter.allow('user', clock.now)
+
+
+def test_keyed_limiter_keys_are_independent(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=1)
+    assert limiter.allow(1, clock.now)
+    assert not limiter.allow(1, clock.now)
+    assert limiter.allow(2, clock.now)
+
+
+def test_keyed_limiter_forgets_idle_keys(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=2)
+    for key in range(100):
+        limiter.allow(key, clock.now)
+    assert len(limiter) == 100
+    # Через period записи переходят в предыдущее поколение.
+    clock.now += 2
+    assert limiter.allow('other', clock.now)
+    assert len(limiter) == 101
+    # Ещё через period без обращений они отброшены, а ведро полное;
+    # остаётся только запись, обновлённая в прошлом поколении.
+    clock.now += 2
+    assert limiter.allow(0, clock.now)
+    assert limiter.allow(0, clock.now)
+    assert len(limiter) == 2
+
+
+def test_keyed_limiter_keeps_limit_across_rotation(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=2)
+    assert limiter.allow('user', clock.now)
+    assert limiter.allow('user', clock.now)
+    clock.now += 1.9
+    # Поколения сменились, но за 1,9 секунды накопился один запрос.
+    assert limiter.allow('user', clock.now)
+    assert not limiter.allow('user', clock.now)
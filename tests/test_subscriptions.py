@@ -0,0 +1,107 @@
+import asyncio
+import heapq
+
+import subscriptions
+from subscriptions import (SQLiteSubscriptionStore, Subscription,
+                           SubscriptionScheduler)
+from weather.exceptions import GetWeatherFromJSONError, WeatherCustomError
+from weather.weather_service import WeatherInformation
+
+
+class FakeStore:
+    async def load(self):
+        return []
+
+    async def save(self, subscription):
+        pass
+
+    async def delete(self, subscription):
+        pass
+
+    async def close(self):
+        pass
+
+
+class FakeOutbox:
+    def __init__(self) -> None:
+        self.sent = []
+
+    def submit(self, chat_id, method, params, **kwargs):
+        self.sent.append((chat_id, params['text']))
+
+
+async def get_weather_for_city(city_name):
+    if city_name == 'Атлантида':
+        raise GetWeatherFromJSONError('неверный ответ API')
+    if city_name == 'Лемурия':
+        raise WeatherCustomError('неизвестная ошибка')
+    return WeatherInformation(city_name, 20.0, 'ясно')
+
+
+def make_scheduler(monkeypatch, cities):
+    outbox = FakeOutbox()
+    monkeypatch.setattr(subscriptions, 'outbox', outbox)
+    monkeypatch.setattr(subscriptions, 'get_weather_for_city',
+                        get_weather_for_city)
+    scheduler = SubscriptionScheduler(FakeStore())
+    for chat_id, city in enumerate(cities, 1):
+        scheduler._add(Subscription(chat_id, city, None, None, 9 * 60,
+                                    'Europe/Moscow'))
+    return scheduler, outbox
+
+
+def test_weather_errors_do_not_escape_delivery(monkeypatch):
+    scheduler, outbox = make_scheduler(monkeypatch,
+                                       ['Атлантида', 'Лемурия', 'Москва'])
+
+    async def scenario():
+        for slot in list(scheduler._slots):
+            await scheduler._deliver(slot)
+
+    asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in outbox.sent] == [3]
+    assert scheduler.delivered == 1
+
+
+def test_failed_slot_does_not_stop_scheduler(monkeypatch):
+    scheduler, outbox = make_scheduler(monkeypatch, ['Казань', 'Москва'])
+    deliver = scheduler._deliver
+
+    async def broken_deliver(slot):
+        if slot[2] == ('city', 'Казань'):
+            raise RuntimeError('ошибка рассылки')
+        await deliver(slot)
+
+    scheduler._deliver = broken_deliver
+
+    async def scenario():
+        # Оба слота становятся готовыми к рассылке прямо сейчас.
+        for slot in scheduler._slots:
+            scheduler._next_run[slot] = 0.0
+            heapq.heappush(scheduler._heap, (0.0, slot))
+        task = asyncio.ensure_future(scheduler._run())
+        await asyncio.sleep(0.05)
+        running = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return running
+
+    assert asyncio.run(scenario())
+    assert [chat_id for chat_id, _ in outbox.sent] == [2]
+
+
+def test_store_opens_file_on_first_use(tmp_path):
+    path = tmp_path / 'subscriptions.sqlite3'
+    store = SQLiteSubscriptionStore(str(path))
+    assert not path.exists()
+    subscription = Subscription(1, 'Москва', None, None, 9 * 60,
+                                'Europe/Moscow')
+
+    async def scenario():
+        await store.save(subscription)
+        loaded = await store.load()
+        await store.close()
+        return loaded
+
+    assert asyncio.run(scenario()) == [subscription]
+    assert path.exists()
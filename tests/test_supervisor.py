@@ -0,0 +1,15 @@
+from settings import settings
+from supervisor import get_worker_environment
+
+
+def test_worker_environment_splits_rate_quotas():
+    environment = get_worker_environment(1, 4)
+    assert environment['BOT_MODE'] == 'worker'
+    assert environment['SHARD_INDEX'] == '1'
+    assert environment['SHARD_COUNT'] == '4'
+    assert (float(environment['OUTBOX_GLOBAL_RATE'])
+            == settings.outbox_global_rate / 4)
+    assert (float(environment['WEATHER_RATE_PER_SECOND'])
+            == settings.weather_rate_per_second / 4)
+    assert (float(environment['PREFETCH_RATE_PER_MINUTE'])
+            == settings.prefetch_rate_per_minute / 4)
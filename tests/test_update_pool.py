@@ -0,0 +1,94 @@
+import asyncio
+import random
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from update_pool import UpdatePool, get_update_chat_id
+
+TOKEN = '123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+
+
+def make_update(update_id, chat_id, text='text'):
+    return types.Update.to_object({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+            'text': text,
+        },
+    })
+
+
+def make_dispatcher():
+    return Dispatcher(Bot(TOKEN), storage=MemoryStorage())
+
+
+def test_get_update_chat_id():
+    assert get_update_chat_id(make_update(1, 42)) == 42
+    callback = types.Update.to_object({
+        'update_id': 2,
+        'callback_query': {
+            'id': '1', 'chat_instance': '1', 'data': 'menu',
+            'from': {'id': 7, 'is_bot': False, 'first_name': 'user'},
+        },
+    })
+    assert get_update_chat_id(callback) == 7
+    assert get_update_chat_id(types.Update.to_object({'update_id': 3})) is None
+
+
+def test_updates_of_one_chat_are_processed_in_order():
+    async def scenario():
+        dispatcher = make_dispatcher()
+        rng = random.Random(1)
+        seen = {}
+
+        @dispatcher.message_handler()
+        async def handler(message: types.Message):
+            await asyncio.sleep(rng.random() / 100)
+            seen.setdefault(message.chat.id, []).append(message.message_id)
+
+        pool = UpdatePool(dispatcher, workers=8, queue_size=16)
+        pool.start()
+        updates = [make_update(update_id, update_id % 5 + 1)
+                   for update_id in range(1, 101)]
+        for update in updates:
+            await pool.submit(update)
+        await pool.stop()
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert sum(len(ids) for ids in seen.values()) == 100
+    for ids in seen.values():
+        assert ids == sorted(ids)
+
+
+def test_state_is_not_cached_between_updates():
+    # Фильтр состояний кэширует состояние в контексте задачи: обработчик
+    # должен видеть состояние, установленное предыдущим обновлением.
+    async def scenario():
+        dispatcher = make_dispatcher()
+        handled = []
+
+        @dispatcher.message_handler(state='waiting_city')
+        async def city(message: types.Message, state):
+            handled.append(('city', message.text))
+            await state.finish()
+
+        @dispatcher.message_handler()
+        async def menu(message: types.Message):
+            handled.append(('menu', message.text))
+            await dispatcher.current_state().set_state('waiting_city')
+
+        pool = UpdatePool(dispatcher, workers=1)
+        pool.start()
+        for update_id, text in enumerate(['menu', 'Москва', 'menu'], 1):
+            await pool.submit(make_update(update_id, 1, text))
+        await pool.stop()
+        return handled
+
+    assert asyncio.run(scenario()) == [
+        ('menu', 'menu'), ('city', 'Москва'), ('menu', 'menu'),
+    ]
@@ -0,0 +1,108 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from weather import weather_cache as weather_cache_module
+from weather.exceptions import WeatherAPIError
+from weather.weather_cache import WeatherCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Подменяется только время модуля кэша, а не часы событийного цикла.
+    monkeypatch.setattr(weather_cache_module, 'time',
+                        types.SimpleNamespace(monotonic=clock,
+                                              time=time.time))
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = WeatherCache(ttl=60, max_size=10)
+    cache.set('moscow', 'sunny')
+    clock.now += 59
+    assert cache.get('moscow') == 'sunny'
+    clock.now += 1
+    assert cache.get('moscow') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = WeatherCache(ttl=60, max_size=2)
+    cache.set('moscow', 1)
+    cache.set('kazan', 2)
+    assert cache.get('moscow') == 1
+    cache.set('omsk', 3)
+    assert cache.get('kazan') is None
+    assert cache.get('moscow') == 1
+    assert cache.get('omsk') == 3
+
+
+def test_stale_value_is_kept_for_stale_ttl(clock):
+    cache = WeatherCache(ttl=60, max_size=10, stale_ttl=30)
+    cache.set('moscow', 'sunny')
+    clock.now += 70
+    assert cache.get('moscow') is None
+    assert cache.get_stale('moscow') == 'sunny'
+    clock.now += 20
+    assert cache.get_stale('moscow') is None
+
+
+def test_concurrent_misses_are_coalesced():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'sunny'
+
+    async def scenario():
+        cache = WeatherCache(ttl=60, max_size=10)
+        results = await asyncio.gather(
+            *(cache.get_or_fetch('moscow', fetch) for _ in range(10))
+        )
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert results == ['sunny'] * 10
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.coalesced == 9
+
+
+def test_stale_value_is_served_when_api_fails(clock):
+    async def fetch():
+        raise WeatherAPIError('API погоды недоступен')
+
+    async def scenario():
+        cache = WeatherCache(ttl=60, max_size=10, stale_ttl=300)
+        cache.set('moscow', 'sunny')
+        clock.now += 120
+        return cache, await cache.get_or_fetch('moscow', fetch)
+
+    cache, value = asyncio.run(scenario())
+    assert value == 'sunny'
+    assert cache.stale_hits == 1
+
+
+def test_missing_value_is_not_cached():
+    async def fetch():
+        return None
+
+    async def scenario():
+        cache = WeatherCache(ttl=60, max_size=10)
+        return cache, await cache.get_or_fetch('atlantis', fetch)
+
+    cache, value = asyncio.run(scenario())
+    assert value is None
+    assert len(cache) == 0
@@ -0,0 +1,78 @@
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from weather.weather_history import (DAY_SECONDS, Observation, decode_block,
+                                     encode_block, summarize_history)
+
+# 2024-03-10 12:00 UTC.
+NOON = int(datetime(2024, 3, 10, 12, tzinfo=timezone.utc).timestamp())
+
+
+def observe(offset, temperature, status='ясно'):
+    return Observation(NOON + offset, temperature, status)
+
+
+def test_empty_history_has_no_summary():
+    assert summarize_history([]) is None
+
+
+def test_single_observation():
+    summary = summarize_history([observe(0, 5.0)])
+    assert summary.current == observe(0, 5.0)
+    assert summary.yesterday is None
+    assert [day.day for day in summary.days] == [date(2024, 3, 10)]
+    assert summary.min_temperature == summary.max_temperature == 5.0
+    assert summary.trend_per_day == 0.0
+
+
+def test_yesterday_is_closest_observation_within_three_hours():
+    observations = [observe(-DAY_SECONDS - 2 * 3600, 1.0),
+                    observe(-DAY_SECONDS + 1800, 2.0),
+                    observe(-3600, 3.0),
+                    observe(0, 4.0)]
+    summary = summarize_history(observations)
+    assert summary.current.temperature == 4.0
+    assert summary.yesterday.temperature == 2.0
+
+
+def test_no_yesterday_further_than_three_hours():
+    observations = [observe(-DAY_SECONDS - 4 * 3600, 1.0), observe(0, 4.0)]
+    assert summarize_history(observations).yesterday is None
+
+
+def test_days_follow_time_zone():
+    # 22:00 и 23:00 UTC - уже следующий день по Москве.
+    observations = [observe(0, 10.0), observe(10 * 3600, 4.0),
+                    observe(11 * 3600, 2.0)]
+    utc_days = summarize_history(observations).days
+    assert [(day.day, day.min_temperature, day.max_temperature)
+            for day in utc_days] == [(date(2024, 3, 10), 2.0, 10.0)]
+
+    moscow_days = summarize_history(observations,
+                                    ZoneInfo('Europe/Moscow')).days
+    assert [day.day for day in moscow_days] == [date(2024, 3, 10),
+                                                date(2024, 3, 11)]
+    assert moscow_days[0].mean_temperature == 10.0
+    assert moscow_days[1].mean_temperature == 3.0
+
+
+def test_period_statistics_and_trend():
+    # Температура растёт на 2 градуса в сутки, наблюдения раз в 6 часов.
+    observations = [observe(step * 6 * 3600, -4.0 + step * 0.5)
+                    for step in range(17)]
+    summary = summarize_history(observations)
+    assert len(summary.days) == 5
+    assert summary.min_temperature == -4.0
+    assert summary.max_temperature == 4.0
+    assert summary.mean_temperature == pytest.approx(0.0)
+    assert summary.trend_per_day == pytest.approx(2.0)
+    assert summary.yesterday.temperature == 2.0
+
+
+def test_block_round_trip():
+    observations = [Observation(NOON + 600, -3.5, 'снег', 80, 4.2, 1012),
+                    Observation(NOON, -2.0, 'снег'),
+                    Observation(NOON + 1200, 0.1, 'пасмурно', 75, None, 1010)]
+    assert decode_block(encode_block(observations)) == sorted(observations)
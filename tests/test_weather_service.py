@@ -0,0 +1,103 @@
+import asyncio
+import types
+import zlib
+
+import pytest
+
+from weather import weather_service
+from weather.exceptions import (GetWeatherFromJSONError, WeatherAPIError,
+                                WeatherCustomError,
+                                WeatherServiceUnavailableError)
+from weather.resilience import CircuitBreaker
+
+
+def test_failed_group_does_not_fail_batch(monkeypatch):
+    async def fetch_json(url):
+        raise GetWeatherFromJSONError('неверный ответ API')
+
+    monkeypatch.setattr(weather_service, 'fetch_json', fetch_json)
+    result = asyncio.run(
+        weather_service.get_weather_for_cities(['Москва', 'Казань'])
+    )
+    assert result == {'Москва': None, 'Казань': None}
+
+
+@pytest.fixture
+def half_open_breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    monkeypatch.setattr(weather_service, 'circuit_breaker', breaker)
+    monkeypatch.setattr(weather_service, 'settings',
+                        weather_service.settings._replace(weather_retries=0))
+    return breaker
+
+
+def test_shed_request_releases_probe(monkeypatch, half_open_breaker):
+    async def acquire(max_wait):
+        return False
+
+    monkeypatch.setattr(weather_service.rate_limiter, 'acquire', acquire)
+
+    async def scenario():
+        with pytest.raises(WeatherServiceUnavailableError):
+            await weather_service.fetch_json('http://weather/moscow')
+        await weather_service.close_session()
+
+    asyncio.run(scenario())
+    # Сброшенный запрос не отправлялся, поэтому следующий запрос снова
+    # может стать пробным, а не отклоняется выключателем.
+    assert half_open_breaker.state == CircuitBreaker.HALF_OPEN
+    assert half_open_breaker.allow()
+
+
+def test_invalid_json_is_counted_as_failure(monkeypatch, half_open_breaker):
+    class Response:
+        status = 200
+
+        async def read(self):
+            return b'<html>502 Bad Gateway</html>'
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            return None
+
+    async def get_session():
+        return types.SimpleNamespace(get=lambda url, timeout: Response())
+
+    monkeypatch.setattr(weather_service, 'get_session', get_session)
+    with pytest.raises(WeatherAPIError):
+        asyncio.run(weather_service.fetch_json('http://weather/moscow'))
+    assert half_open_breaker.state == CircuitBreaker.OPEN
+
+
+def test_cached_weather_round_trip():
+    weather = weather_service.WeatherInformation(
+        'Москва', 20.5, 'ясно', 524901, 40, 3.2, 1012, 1700000000
+    )
+    data = weather_service.serialize_weather(weather)
+    assert weather_service.deserialize_weather(data) == weather
+    # Записи старого формата с четырьмя полями.
+    legacy = weather_service.deserialize_weather(
+        '["Москва",20.5,"ясно",524901]'.encode()
+    )
+    assert legacy == weather_service.WeatherInformation('Москва', 20.5,
+                                                        'ясно', 524901)
+
+
+def test_history_read_error_is_weather_error(monkeypatch):
+    async def get_weather_for_city(city_name):
+        return weather_service.WeatherInformation('Москва', 20.5, 'ясно',
+                                                  524901)
+
+    async def get_observations(city_id, since):
+        raise zlib.error('повреждённый блок')
+
+    monkeypatch.setattr(weather_service, 'get_weather_for_city',
+                        get_weather_for_city)
+    monkeypatch.setattr(weather_service, 'weather_history',
+                        types.SimpleNamespace(
+                            get_observations=get_observations))
+    with pytest.raises(WeatherCustomError):
+        asyncio.run(weather_service.get_history_for_city('Москва'))
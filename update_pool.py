@@ -0,0 +1,151 @@
+"""Update pool"""
+import asyncio
+import collections
+import typing
+
+from aiogram import Bot, Dispatcher, types
+
+from logger import logger
+
+UpdateCallback = typing.Callable[[types.Update], None]
+
+
+def get_update_chat_id(update: types.Update) -> typing.Optional[int]:
+    """Функция, возвращающая чат, к которому относится обновление.
+
+    Для нажатий на кнопки без сообщения и inline-запросов возвращается
+    пользователь: его состояние хранится под тем же ключом.
+    """
+    message = (update.message or update.edited_message
+               or update.channel_post or update.edited_channel_post)
+    if message is not None:
+        return message.chat.id
+    callback_query = update.callback_query
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    event = update.inline_query or update.chosen_inline_result
+    if event is not None:
+        return event.from_user.id
+    event = update.my_chat_member or update.chat_member
+    if event is not None:
+        return event.chat.id
+    return None
+
+
+class UpdatePool:
+    """Пул фоновых обработчиков входящих обновлений Telegram.
+
+    Обновления обрабатываются workers задачами параллельно, но обновления
+    одного чата - строго по очереди в порядке поступления, чтобы переходы
+    состояний FSM не перемешивались. У каждого чата своя очередь; чат
+    с необработанными обновлениями стоит в общей очереди готовых и после
+    каждого обновления встаёт в её конец, так что активный чат
+    не задерживает остальные.
+
+    Одновременно в пуле находится не больше queue_size обновлений. Когда
+    пул заполнен, submit ждёт освобождения места - так медленная
+    обработка притормаживает приём новых обновлений, а не раздувает
+    память.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, workers: int = 32,
+                 queue_size: int = 1000) -> None:
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.queue_size = queue_size
+        self.processed = 0
+        # Необработанные обновления каждого чата с обратными вызовами.
+        self._chats: typing.Dict[typing.Any, collections.deque] = {}
+        # Чаты, которые ждут свободного обработчика.
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(queue_size)
+        self._pending = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks: typing.List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return self._pending
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Метод запуска фоновых обработчиков."""
+        if self.running:
+            return
+        self._tasks = [asyncio.ensure_future(self._worker())
+                       for _ in range(self.workers)]
+
+    async def submit(self, update: types.Update,
+                     callback: typing.Optional[UpdateCallback] = None
+                     ) -> None:
+        """Метод постановки обновления в очередь на обработку.
+
+        callback вызывается после обработки обновления, в том числе
+        завершившейся ошибкой.
+        """
+        await self._slots.acquire()
+        self._pending += 1
+        self._drained.clear()
+        chat_id = get_update_chat_id(update)
+        # Обновления без чата не упорядочиваются между собой.
+        key = chat_id if chat_id is not None else ('update', update.update_id)
+        queue = self._chats.get(key)
+        if queue is None:
+            self._chats[key] = collections.deque([(update, callback)])
+            self._ready.put_nowait(key)
+        else:
+            queue.append((update, callback))
+
+    async def stop(self) -> None:
+        """Метод остановки пула, дожидающийся обработки всей очереди."""
+        if not self.running:
+            return
+        await self._drained.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _process(self, update: types.Update) -> None:
+        try:
+            # Отдельная задача получает свою копию контекста: фильтр
+            # состояний aiogram кэширует в нём состояние пользователя,
+            # и без копии оно переходило бы к следующим обновлениям.
+            await asyncio.ensure_future(
+                self.dispatcher.process_update(update)
+            )
+        except asyncio.CancelledError:
+            raise
+        except BaseException as error:
+            # Ошибки сервиса погоды наследуются от BaseException.
+            logger.error('Ошибка обработки обновления %s: %s',
+                         update.update_id, error)
+
+    async def _worker(self) -> None:
+        # Контекст задачи не наследует текущие бот и диспетчер.
+        Dispatcher.set_current(self.dispatcher)
+        Bot.set_current(self.dispatcher.bot)
+        while True:
+            key = await self._ready.get()
+            queue = self._chats[key]
+            update, callback = queue[0]
+            try:
+                await self._process(update)
+            finally:
+                queue.popleft()
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self.processed += 1
+                self._pending -= 1
+                if not self._pending:
+                    self._drained.set()
+                self._slots.release()
+                if callback is not None:
+                    callback(update)
@@ -0,0 +1,304 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Запись хранилища: ключ, сериализованное значение и время истечения
+# срока жизни (unix-время).
+CacheItem = Tuple[str, bytes, float]
+# Значение из хранилища и время истечения его срока жизни (unix-время).
+CacheEntry = Tuple[bytes, float]
+
+
+class CacheBackend:
+    """Базовый класс хранилища кэша погоды.
+
+    Хранилище работает с уже сериализованными значениями и временем
+    истечения в unix-времени, чтобы срок жизни записи был одинаковым
+    для всех процессов, которые используют хранилище.
+    """
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """Метод, возвращающий актуальное значение по ключу вместе
+        со временем истечения его срока жизни или None.
+        """
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Метод, сохраняющий значение на ttl секунд."""
+        raise NotImplementedError
+
+    async def items(self, limit: int) -> List[CacheItem]:
+        """Метод, возвращающий до limit актуальных записей для прогрева."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Метод, завершающий работу с хранилищем."""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Хранилище кэша в памяти процесса с ограничением по размеру."""
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Tuple[bytes, float]]' = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def items(self, limit: int) -> List[CacheItem]:
+        now = time.time()
+        result = [(key, value, expires_at)
+                  for key, (value, expires_at) in reversed(self._entries.items())
+                  if expires_at > now]
+        return result[:limit]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Хранилище кэша в файле SQLite.
+
+    База открывается в режиме WAL, поэтому её могут читать несколько
+    процессов одновременно. Записи накапливаются в памяти и сохраняются
+    одной транзакцией раз в flush_interval секунд или по достижении
+    batch_size записей. Все обращения к базе выполняются в отдельном
+    потоке, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(self, path: str, batch_size: int = 100,
+                 flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Tuple[bytes, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Один поток гарантирует последовательный доступ к соединению.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS weather_cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'expires_at REAL NOT NULL)'
+        )
+
+    async def _run(self, function, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._pending.get(key)
+        if entry is not None:
+            return entry if entry[1] > time.time() else None
+        return await self._run(self._select, key)
+
+    def _select(self, key: str) -> Optional[CacheEntry]:
+        row = self._connection.execute(
+            'SELECT value, expires_at FROM weather_cache '
+            'WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return tuple(row) if row else None
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._pending[key] = (value, time.time() + ttl)
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Метод, сохраняющий накопленные записи одной транзакцией."""
+        if not self._pending:
+            return
+        batch = [(key, value, expires_at)
+                 for key, (value, expires_at) in self._pending.items()]
+        self._pending = {}
+        await self._run(self._write_batch, batch)
+
+    def _write_batch(self, batch: List[CacheItem]) -> None:
+        with self._connection:
+            self._connection.execute('BEGIN')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO weather_cache (key, value, expires_at) '
+                'VALUES (?, ?, ?)', batch
+            )
+            self._connection.execute(
+                'DELETE FROM weather_cache WHERE expires_at <= ?',
+                (time.time(),)
+            )
+
+    async def items(self, limit: int) -> List[CacheItem]:
+        await self.flush()
+        return await self._run(self._select_items, limit)
+
+    def _select_items(self, limit: int) -> List[CacheItem]:
+        return self._connection.execute(
+            'SELECT key, value, expires_at FROM weather_cache '
+            'WHERE expires_at > ? ORDER BY expires_at DESC LIMIT ?',
+            (time.time(), limit)
+        ).fetchall()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        await self._run(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+class RedisProtocolError(Exception):
+    """Ошибка, полученная от сервера Redis."""
+    pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """Хранилище кэша на сервере, поддерживающем протокол Redis (RESP).
+
+    Использует одно соединение и минимальный набор команд
+    (GET, SET PX, SCAN, MGET, PTTL), поэтому работает как с Redis,
+    так и с совместимыми серверами и локальными заглушками.
+
+    Подключение и каждый обмен командами ограничены timeout секундами:
+    зависший сервер не должен задерживать ответ пользователю дольше,
+    чем запрос к самому API погоды.
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0',
+                 prefix: str = 'weather:', timeout: float = 1.0) -> None:
+        parsed_url = urlparse(url)
+        self.host = parsed_url.hostname or 'localhost'
+        self.port = parsed_url.port or 6379
+        self.password = parsed_url.password
+        self.db = int(parsed_url.path.strip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            await self._send([('AUTH', self.password)])
+        if self.db:
+            await self._send([('SELECT', self.db)])
+
+    @staticmethod
+    def _encode(command: Tuple) -> bytes:
+        parts = [b'*%d\r\n' % len(command)]
+        for argument in command:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(argument), argument))
+        return b''.join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('Сервер Redis закрыл соединение')
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode()
+        if prefix == b'-':
+            raise RedisProtocolError(payload.decode())
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisProtocolError(f'Неизвестный ответ сервера: {line!r}')
+
+    async def _send(self, commands: List[Tuple]) -> List[Any]:
+        """Метод, отправляющий команды одним пакетом и читающий ответы."""
+        self._writer.write(b''.join(self._encode(command)
+                                    for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def execute(self, *commands: Tuple) -> List[Any]:
+        """Метод выполнения команд с переподключением при обрыве связи."""
+        async with self._lock:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    await self._connect()
+                return await asyncio.wait_for(self._send(list(commands)),
+                                              self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError):
+                # После таймаута ответы могут прийти позже и перепутаться
+                # со следующими командами, поэтому соединение закрывается.
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                raise
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        value, ttl = await self.execute(('GET', self.prefix + key),
+                                        ('PTTL', self.prefix + key))
+        if value is None or ttl == -2:
+            return None
+        # У ключа без срока жизни PTTL возвращает -1.
+        expires_at = now + ttl / 1000 if ttl >= 0 else float('inf')
+        return value, expires_at
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute(('SET', self.prefix + key, value,
+                            'PX', max(int(ttl * 1000), 1)))
+
+    async def items(self, limit: int) -> List[CacheItem]:
+        result: List[CacheItem] = []
+        cursor = b'0'
+        while len(result) < limit:
+            ((cursor, keys),) = await self.execute(
+                ('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            )
+            if keys:
+                replies = await self.execute(
+                    ('MGET', *keys), *[('PTTL', key) for key in keys]
+                )
+                now = time.time()
+                for key, value, ttl in zip(keys, replies[0], replies[1:]):
+                    if value is not None and ttl > 0:
+                        result.append((key.decode()[len(self.prefix):],
+                                       value, now + ttl / 1000))
+            if cursor == b'0':
+                break
+        return result[:limit]
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
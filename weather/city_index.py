@@ -0,0 +1,173 @@
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+# Допустимые символы в названии города: буквы, пробелы, дефисы,
+# апострофы и точки.
+CITY_NAME_PATTERN = re.compile(r"^[^\W\d_]+(?:[ .'’-]+[^\W\d_]+)*\.?$")
+CITY_NAME_MAX_LENGTH = 60
+
+TRANSLITERATION = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n',
+    'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f',
+    'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+
+class City(NamedTuple):
+    """Город из локального справочника."""
+    name: str
+    city_id: int
+    latitude: float
+    longitude: float
+
+
+def normalize_city_name(city_name: str) -> str:
+    """Функция приведения названия города к виду для поиска."""
+    city_name = city_name.casefold().replace('ё', 'е')
+    return ' '.join(re.split(r"[\s.'’-]+", city_name)).strip()
+
+
+def transliterate(city_name: str) -> str:
+    """Функция транслитерации названия города на латиницу."""
+    return ''.join(TRANSLITERATION.get(char, char) for char in city_name)
+
+
+def is_plausible_city_name(city_name: str) -> bool:
+    """Функция быстрой проверки, что текст похож на название города."""
+    city_name = city_name.strip()
+    return (1 < len(city_name) <= CITY_NAME_MAX_LENGTH
+            and CITY_NAME_PATTERN.match(city_name) is not None)
+
+
+def levenshtein_distance(first: str, second: str, max_distance: int) -> int:
+    """Функция расстояния Левенштейна с ранним выходом.
+
+    Возвращает max_distance + 1, если расстояние больше max_distance.
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    previous_row = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current_row = [row]
+        for column, second_char in enumerate(second, 1):
+            current_row.append(min(
+                previous_row[column] + 1,
+                current_row[column - 1] + 1,
+                previous_row[column - 1] + (first_char != second_char),
+            ))
+        if min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    return previous_row[-1]
+
+
+class CityIndex:
+    """Локальный справочник городов для проверки ввода пользователя.
+
+    Названия и псевдонимы городов (на русском, латиницей и
+    в транслитерации) хранятся в отсортированном списке, а
+    идентификаторы и координаты - в параллельных компактных массивах.
+    Точный и префиксный поиск выполняются двоичным поиском, нечёткий -
+    по названиям с той же первой буквой и близкой длиной.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._names: List[str] = []
+        self._cities: List[int] = []
+        self._by_first_char: Dict[str, List[int]] = {}
+        self._display_names: List[str] = []
+        self._city_ids = array('l')
+        self._latitudes = array('d')
+        self._longitudes = array('d')
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._display_names)
+
+    def _load(self) -> None:
+        aliases: Dict[str, int] = {}
+        with open(self.path, encoding='UTF-8') as index_file:
+            for line in index_file:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                city_id, latitude, longitude, names = (
+                    line.rstrip('\n').split('\t')
+                )
+                city = len(self._display_names)
+                names = names.split('|')
+                self._display_names.append(names[0])
+                self._city_ids.append(int(city_id))
+                self._latitudes.append(float(latitude))
+                self._longitudes.append(float(longitude))
+                for name in names:
+                    name = normalize_city_name(name)
+                    aliases.setdefault(name, city)
+                    aliases.setdefault(transliterate(name), city)
+
+        for name in sorted(aliases):
+            self._by_first_char.setdefault(name[0], []).append(
+                len(self._names)
+            )
+            self._names.append(name)
+            self._cities.append(aliases[name])
+
+    def _get_city(self, city: int) -> City:
+        return City(self._display_names[city], self._city_ids[city],
+                    self._latitudes[city], self._longitudes[city])
+
+    def find(self, city_name: str) -> Optional[City]:
+        """Метод точного поиска города по названию или псевдониму."""
+        name = normalize_city_name(city_name)
+        position = bisect_left(self._names, name)
+        if position < len(self._names) and self._names[position] == name:
+            return self._get_city(self._cities[position])
+        return None
+
+    def find_by_prefix(self, prefix: str, limit: int = 10) -> List[City]:
+        """Метод поиска городов, название которых начинается с prefix."""
+        prefix = normalize_city_name(prefix)
+        result: List[City] = []
+        seen = set()
+        position = bisect_left(self._names, prefix)
+        while (position < len(self._names) and len(result) < limit
+               and self._names[position].startswith(prefix)):
+            city = self._cities[position]
+            if city not in seen:
+                seen.add(city)
+                result.append(self._get_city(city))
+            position += 1
+        return result
+
+    def find_similar(self, city_name: str) -> Optional[City]:
+        """Метод нечёткого поиска города с учётом опечаток."""
+        name = normalize_city_name(city_name)
+        # В коротких названиях одна опечатка часто даёт другой
+        # настоящий город (Орск - Омск), поэтому их не исправляем.
+        if len(name) <= 4:
+            return None
+        max_distance = 1 if len(name) <= 7 else 2
+        best_city, best_distance = None, max_distance + 1
+        for position in self._by_first_char.get(name[0], ()):
+            distance = levenshtein_distance(name, self._names[position],
+                                            max_distance)
+            if distance < best_distance:
+                best_city, best_distance = self._cities[position], distance
+        return None if best_city is None else self._get_city(best_city)
+
+    @lru_cache(maxsize=10000)
+    def resolve(self, city_name: str) -> Optional[City]:
+        """Метод поиска города по названию или псевдониму.
+
+        Опечатки здесь не исправляются: настоящий город, которого нет
+        в справочнике, часто отличается от города справочника одной-двумя
+        буквами (Красногорск - Красноярск), и его нужно искать в API
+        под своим названием. find_similar используется только для
+        подсказки, когда API город не нашёл.
+        """
+        return self.find(city_name)
@@ -8,6 +8,11 @@ class WeatherAPIError(BaseException):
     pass
 
 
+class WeatherServiceUnavailableError(WeatherAPIError):
+    """API погоды временно недоступен или превышена квота запросов."""
+    pass
+
+
 class WeatherGetMessageError(BaseException):
     """Ошибка формирования ответа API пользователю."""
     pass
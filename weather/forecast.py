@@ -0,0 +1,149 @@
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+# Описание погоды по группе кода OpenWeatherMap и её значимость:
+# для дня выбирается самое значимое явление.
+CONDITIONS = {
+    2: (6, 'гроза'),
+    6: (5, 'снег'),
+    5: (4, 'дождь'),
+    3: (3, 'морось'),
+    7: (2, 'туман'),
+    8: (1, 'облачно'),
+}
+CLEAR_CODE = 800
+
+
+def get_condition(code: int) -> str:
+    """Функция, возвращающая описание погоды по её коду."""
+    if code == CLEAR_CODE:
+        return 'ясно'
+    return CONDITIONS.get(code // 100, (0, 'без осадков'))[1]
+
+
+def get_condition_rank(code: int) -> int:
+    if code == CLEAR_CODE:
+        return 0
+    return CONDITIONS.get(code // 100, (0, ''))[0]
+
+
+class Forecast:
+    """Прогноз погоды на несколько дней с шагом в 3 часа.
+
+    Точки прогноза хранятся не списком объектов, а колонками array:
+    время, температура, вероятность и количество осадков, код погоды.
+    Прогноз на 5 дней (40 точек) занимает около 1,5 КБ.
+    """
+
+    __slots__ = ('name', 'city_id', 'timezone', 'timestamps',
+                 'temperatures', 'precipitation_probability',
+                 'precipitation', 'codes')
+
+    def __init__(self, name: str, city_id: Optional[int] = None,
+                 timezone: int = 0) -> None:
+        self.name = name
+        self.city_id = city_id
+        # Смещение местного времени от UTC в секундах.
+        self.timezone = timezone
+        self.timestamps = array('q')
+        self.temperatures = array('f')
+        self.precipitation_probability = array('f')
+        self.precipitation = array('f')
+        self.codes = array('H')
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+
+class DaySummary(NamedTuple):
+    """Сводка прогноза за один день."""
+    day: date
+    min_temperature: float
+    max_temperature: float
+    mean_temperature: float
+    # Максимальная за день вероятность осадков, от 0 до 1.
+    rain_probability: float
+    # Сумма осадков за день в миллиметрах.
+    precipitation: float
+    code: int
+
+
+class ForecastSummary(NamedTuple):
+    """Сводка прогноза по дням и за весь период."""
+    days: List[DaySummary]
+    min_temperature: float
+    max_temperature: float
+    rainy_days: int
+
+
+def parse_forecast(json: Dict) -> Forecast:
+    """Функция распаковки ответа API прогноза в объект Forecast.
+
+    Ответ запрашивается с units=metric, температура уже в градусах Цельсия.
+    """
+    city = json['city']
+    forecast = Forecast(city['name'], city.get('id'),
+                        city.get('timezone', 0))
+    for point in json['list']:
+        forecast.timestamps.append(point['dt'])
+        forecast.temperatures.append(point['main']['temp'])
+        forecast.precipitation_probability.append(point.get('pop', 0.0))
+        forecast.precipitation.append(
+            point.get('rain', {}).get('3h', 0.0)
+            + point.get('snow', {}).get('3h', 0.0)
+        )
+        forecast.codes.append(point['weather'][0]['id'])
+    return forecast
+
+
+def summarize_forecast(forecast: Forecast,
+                       rain_threshold: float = 0.5) -> ForecastSummary:
+    """Функция подсчёта сводки прогноза за один проход по точкам.
+
+    Для каждого местного дня считаются минимум, максимум и среднее
+    температуры, максимальная вероятность осадков, их сумма и самое
+    значимое явление погоды. День считается дождливым, если вероятность
+    осадков достигает rain_threshold.
+    """
+    days: List[DaySummary] = []
+    epoch = date(1970, 1, 1)
+    current_day = None
+    for timestamp, temperature, probability, amount, code in zip(
+            forecast.timestamps, forecast.temperatures,
+            forecast.precipitation_probability, forecast.precipitation,
+            forecast.codes):
+        day = (timestamp + forecast.timezone) // 86400
+        if day != current_day:
+            if current_day is not None:
+                days.append(DaySummary(
+                    epoch + timedelta(days=current_day), low, high,
+                    total / count, max_probability, precipitation, day_code
+                ))
+            current_day = day
+            low = high = total = temperature
+            count = 1
+            max_probability = probability
+            precipitation = amount
+            day_code = code
+            continue
+        low = min(low, temperature)
+        high = max(high, temperature)
+        total += temperature
+        count += 1
+        max_probability = max(max_probability, probability)
+        precipitation += amount
+        if get_condition_rank(code) > get_condition_rank(day_code):
+            day_code = code
+    if current_day is not None:
+        days.append(DaySummary(
+            epoch + timedelta(days=current_day), low, high, total / count,
+            max_probability, precipitation, day_code
+        ))
+
+    return ForecastSummary(
+        days,
+        min((day.min_temperature for day in days), default=0.0),
+        max((day.max_temperature for day in days), default=0.0),
+        sum(day.rain_probability >= rain_threshold for day in days),
+    )
@@ -0,0 +1,111 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+# Точка индекса: широта, долгота, ключ кэша и время добавления.
+GeoPoint = Tuple[float, float, str, float]
+# Ячейка сетки: номера по широте и долготе.
+Cell = Tuple[int, int]
+
+
+def haversine_distance(latitude: float, longitude: float,
+                       other_latitude: float, other_longitude: float) -> float:
+    """Функция расстояния между точками на поверхности Земли в километрах."""
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    a = (math.sin((other_latitude - latitude) / 2) ** 2
+         + math.cos(latitude) * math.cos(other_latitude)
+         * math.sin((other_longitude - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GeoIndex:
+    """Пространственный индекс недавних наблюдений погоды.
+
+    Точки раскладываются по ячейкам сетки размером radius_km, поэтому
+    поиск ближайшего наблюдения просматривает только соседние ячейки.
+    Точки старше max_age секунд не возвращаются и удаляются из индекса,
+    а сверх max_points вытесняются самые старые. Счётчик snapped
+    показывает, сколько запросов обслужено соседними наблюдениями.
+    """
+
+    def __init__(self, radius_km: float, max_age: float,
+                 max_points: int = 100000) -> None:
+        self.radius_km = radius_km
+        self.max_age = max_age
+        self.max_points = max_points
+        self.cell_size = radius_km / KM_PER_DEGREE
+        self._cells: Dict[Cell, List[GeoPoint]] = {}
+        # Все точки в порядке добавления: (ячейка, ключ) - время.
+        self._added: 'OrderedDict[Tuple[Cell, str], float]' = OrderedDict()
+        self.snapped = 0
+
+    def __len__(self) -> int:
+        return len(self._added)
+
+    def _get_cell(self, latitude: float, longitude: float) -> Cell:
+        return (math.floor(latitude / self.cell_size),
+                math.floor(longitude / self.cell_size))
+
+    def _remove(self, cell: Cell, key: str) -> None:
+        points = [point for point in self._cells[cell] if point[2] != key]
+        if points:
+            self._cells[cell] = points
+        else:
+            del self._cells[cell]
+
+    def add(self, latitude: float, longitude: float, key: str) -> None:
+        """Метод добавления наблюдения с ключом кэша в индекс."""
+        cell = self._get_cell(latitude, longitude)
+        now = time.monotonic()
+        points = []
+        for point in self._cells.get(cell, ()):
+            if point[2] == key or now - point[3] >= self.max_age:
+                del self._added[cell, point[2]]
+            else:
+                points.append(point)
+        points.append((latitude, longitude, key, now))
+        self._cells[cell] = points
+        self._added[cell, key] = now
+        # Самые старые точки - первые в порядке добавления, поэтому
+        # вытеснение не просматривает остальные.
+        while len(self._added) > self.max_points:
+            (old_cell, old_key), _ = self._added.popitem(last=False)
+            self._remove(old_cell, old_key)
+
+    def purge(self) -> None:
+        """Метод удаления устаревших точек из индекса."""
+        now = time.monotonic()
+        while self._added:
+            (cell, key), added_at = next(iter(self._added.items()))
+            if now - added_at < self.max_age:
+                break
+            del self._added[cell, key]
+            self._remove(cell, key)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[str]:
+        """Метод поиска ключа ближайшего свежего наблюдения в радиусе."""
+        cell_latitude, cell_longitude = self._get_cell(latitude, longitude)
+        # Ячейка по долготе ближе к полюсам короче в километрах.
+        longitude_span = math.ceil(
+            1 / max(math.cos(math.radians(latitude)), 0.01)
+        )
+        now = time.monotonic()
+        best_key, best_distance = None, self.radius_km
+        for delta_latitude in (-1, 0, 1):
+            for delta_longitude in range(-longitude_span, longitude_span + 1):
+                cell = (cell_latitude + delta_latitude,
+                        cell_longitude + delta_longitude)
+                for point in self._cells.get(cell, ()):
+                    if now - point[3] >= self.max_age:
+                        continue
+                    distance = haversine_distance(latitude, longitude,
+                                                  point[0], point[1])
+                    if distance <= best_distance:
+                        best_key, best_distance = point[2], distance
+        return best_key
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from typing import Dict, Hashable, Optional
+
+from logger import logger
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+
+    Пополняется со скоростью rate токенов в секунду и хранит не больше
+    capacity токенов, что позволяет короткие всплески запросов.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.shed = 0
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self) -> bool:
+        """Метод, забирающий токен без ожидания, если он есть."""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def acquire(self, max_wait: float) -> bool:
+        """Метод, ожидающий токен не дольше max_wait секунд.
+
+        Возвращает False, если токен не появится за это время; такой
+        запрос считается сброшенным.
+        """
+        self._refill()
+        # Токен резервируется сразу, поэтому ожидающие запросы
+        # выстраиваются в очередь, а не соревнуются за один токен.
+        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        if wait > max_wait:
+            self.shed += 1
+            return False
+        self._tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+class KeyedRateLimiter:
+    """Ограничитель частоты запросов по ключу, например по пользователю,
+    по алгоритму GCRA.
+
+    Работает как token bucket со скоростью rate и ёмкостью burst
+    у каждого ключа, но хранит для ключа одно число - теоретическое
+    время следующего запроса. Запись ключа, не обновлявшаяся period
+    секунд, равна заполненному ведру и больше не нужна, поэтому записи
+    хранятся в двух поколениях, которые сменяются раз в period секунд:
+    старое поколение отбрасывается целиком, без обхода записей. Память
+    занимают только ключи, активные за последние два period.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.interval = 1 / rate
+        self.period = burst * self.interval
+        self.limited = 0
+        # Допуск на погрешность сложения дробных интервалов.
+        self._limit = self.period + 1e-9
+        self._current: Dict[Hashable, float] = {}
+        self._previous: Dict[Hashable, float] = {}
+        self._rotated_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def _rotate(self, now: float) -> None:
+        # Записи текущего поколения обновлялись не раньше его начала,
+        # а предыдущего - не позже: через period они уже истекли.
+        if now - self._rotated_at < 2 * self.period:
+            self._previous = self._current
+        else:
+            self._previous = {}
+        self._current = {}
+        self._rotated_at = now
+
+    def allow(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Метод, разрешающий или отклоняющий запрос с ключом key."""
+        if now is None:
+            now = time.monotonic()
+        if now - self._rotated_at >= self.period:
+            self._rotate(now)
+        current = self._current
+        arrival = current.get(key)
+        if arrival is None:
+            arrival = self._previous.pop(key, now)
+        if arrival < now:
+            arrival = now
+        if arrival + self.interval - now > self._limit:
+            current[key] = arrival
+            self.limited += 1
+            return False
+        current[key] = arrival + self.interval
+        return True
+
+
+class ConcurrencyLimiter:
+    """Ограничитель количества одновременно выполняемых запросов.
+
+    Запрос ждёт освобождения места не дольше max_wait секунд, иначе
+    считается сброшенным.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, max_wait: float) -> bool:
+        """Метод, занимающий место; False, если оно не освободилось."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return True
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), max_wait)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        return True
+
+    def release(self) -> None:
+        """Метод освобождения места, занятого acquire."""
+        self._semaphore.release()
+
+
+class CircuitBreaker:
+    """Автоматический выключатель запросов к неисправному API.
+
+    После failure_threshold ошибок подряд переходит в состояние open и
+    сразу отклоняет запросы. Через recovery_timeout секунд переходит в
+    half_open и пропускает один пробный запрос: успех возвращает
+    состояние closed, ошибка - снова open.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.shed = 0
+        self.transitions: Dict[str, int] = {}
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning('Выключатель API погоды: %s -> %s', self.state, state)
+        transition = f'{self.state}->{state}'
+        self.transitions[transition] = self.transitions.get(transition, 0) + 1
+        self.state = state
+
+    def allow(self) -> bool:
+        """Метод, разрешающий или отклоняющий очередной запрос."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                self.shed += 1
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.shed += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        """Метод учёта успешного запроса."""
+        self._failures = 0
+        self._probe_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """Метод учёта неудачного запроса."""
+        self._failures += 1
+        self._probe_in_flight = False
+        if (self.state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """Метод освобождения разрешения allow без учёта исхода, когда
+        запрос так и не был отправлен.
+        """
+        self._probe_in_flight = False
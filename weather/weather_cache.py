@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from logger import logger
+from weather.cache_backends import CacheBackend
+from weather.exceptions import WeatherAPIError
+
+
+class WeatherCache:
+    """Класс TTL-кэша ответов API погоды с LRU-вытеснением.
+
+    Одновременные запросы одного и того же ключа объединяются в один
+    запрос к API: первый запрос выполняет загрузку, остальные ждут
+    его результат. Если задано постоянное хранилище (backend), то оно
+    используется как второй уровень кэша, общий для всех процессов
+    бота и переживающий перезапуск.
+
+    Устаревшие записи хранятся ещё stale_ttl секунд: если API не ответил
+    за stale_timeout секунд или вернул ошибку, возвращается устаревшее
+    значение, а свежее догружается в фоне.
+    """
+
+    def __init__(self, ttl: float, max_size: int,
+                 backend: Optional[CacheBackend] = None,
+                 serializer: Optional[Callable[[Any], bytes]] = None,
+                 deserializer: Optional[Callable[[bytes], Any]] = None,
+                 stale_ttl: float = 0.0,
+                 stale_timeout: float = 1.0) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.stale_timeout = stale_timeout
+        self.backend = backend
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Метод, возвращающий актуальное значение из кэша или None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        now = time.monotonic()
+        if expires_at <= now:
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Метод, возвращающий значение с истёкшим сроком, но ещё
+        не вышедшее из окна stale_ttl.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at + self.stale_ttl <= time.monotonic():
+            return None
+        return value
+
+    def remaining_ttl(self, key: str) -> Optional[float]:
+        """Метод, возвращающий оставшееся время жизни записи в секундах."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[0] - time.monotonic()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Метод, сохраняющий значение в кэш с вытеснением самых старых."""
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(
+            self, key: str,
+            fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Метод, возвращающий значение из кэша или загружающий его.
+
+        Параметры:
+            key (str): Ключ кэша.
+
+            fetch (Callable): Функция без аргументов, возвращающая корутину
+            загрузки значения из API.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if key in self._pending:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        task = self.refresh(key, fetch, use_backend=True)
+
+        stale_value = self.get_stale(key)
+        # shield не даёт отмене одного запроса прервать загрузку для всех.
+        if stale_value is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task),
+                                          self.stale_timeout)
+        except (Exception, WeatherAPIError):
+            self.stale_hits += 1
+            return stale_value
+
+    def refresh(self, key: str, fetch: Callable[[], Awaitable[Any]],
+                use_backend: bool = False) -> asyncio.Task:
+        """Метод запуска фоновой загрузки значения.
+
+        Если загрузка этого ключа уже идёт, возвращает её задачу.
+        """
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, fetch, use_backend))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._on_load_done(key, task))
+        return task
+
+    def _on_load_done(self, key: str, task: asyncio.Task) -> None:
+        self._pending.pop(key, None)
+        # Помечаем ошибку фоновой загрузки как обработанную.
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[Any]],
+                    use_backend: bool) -> Any:
+        """Метод загрузки значения из хранилища или из API."""
+        if use_backend and self.backend is not None:
+            try:
+                entry = await self.backend.get(key)
+            except Exception as error:
+                logger.error('Ошибка чтения из хранилища кэша погоды: %s',
+                             error)
+                entry = None
+            if entry is not None:
+                data, expires_at = entry
+                # Запись живёт столько, сколько ей осталось в хранилище,
+                # иначе её возраст мог бы дойти до двух ttl.
+                ttl = min(expires_at - time.time(), self.ttl)
+                if ttl > 0:
+                    self.backend_hits += 1
+                    value = self.deserializer(data)
+                    self.set(key, value, ttl)
+                    return value
+
+        value = await fetch()
+        if value is not None:
+            self.set(key, value)
+            await self._store(key, value)
+        return value
+
+    async def _store(self, key: str, value: Any) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(key, self.serializer(value), self.ttl)
+        except Exception as error:
+            logger.error('Ошибка записи в хранилище кэша погоды: %s', error)
+
+    async def warm(self) -> int:
+        """Метод прогрева кэша из постоянного хранилища.
+
+        Возвращает количество загруженных записей.
+        """
+        if self.backend is None:
+            return 0
+        items = await self.backend.items(self.max_size)
+        now = time.time()
+        # Сначала загружаем записи, истекающие раньше, чтобы самые свежие
+        # оказались в конце очереди вытеснения.
+        for key, data, expires_at in sorted(items, key=lambda item: item[2]):
+            if expires_at > now:
+                self.set(key, self.deserializer(data), expires_at - now)
+        return len(self._entries)
+
+    async def close(self) -> None:
+        """Метод, завершающий работу с постоянным хранилищем."""
+        if self.backend is not None:
+            await self.backend.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Метод, возвращающий счётчики попаданий и промахов кэша."""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'backend_hits': self.backend_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'stale_hits': self.stale_hits,
+        }
@@ -1,3 +1,6 @@
+from bisect import bisect_right
+
+from weather.forecast import ForecastSummary
 from weather.weather_service import WeatherInformation
 
 temperatures_list = [
@@ -13,22 +16,35 @@ temperatures_list = [
     (50, '☀️☀️☀️ Адски жарко, держитесь в тени и рядом с кондиционером.'),
     (2000, '🌝 Друже, что вы забыли на Солнце?.')
 ]
+# Границы температур для двоичного поиска подсказки.
+temperature_thresholds = [temperature for temperature, _ in temperatures_list]
 
 
-async def get_temperature_hint(temperature: float) -> str:
-    for example_temperature, hint in temperatures_list:
-        if temperature < example_temperature:
-            return hint
+def get_temperature_hint(temperature: float) -> str:
+    index = bisect_right(temperature_thresholds, temperature)
+    if index < len(temperatures_list):
+        return temperatures_list[index][1]
     return 'Друже, тут я могу только посочувствовать.'
 
 
-async def get_rain_hint(weather_status: str) -> str:
+def get_rain_hint(weather_status: str) -> str:
     if 'дожд' in weather_status:
         return '☔️ Возьмите с собой зонт.'
     return ''
 
 
-async def get_hint(weather: WeatherInformation) -> str:
-    advice = (f'{await get_temperature_hint(weather.temperature)}\n'
-              f'{await get_rain_hint(weather.status)}')
+def get_hint(weather: WeatherInformation) -> str:
+    advice = (f'{get_temperature_hint(weather.temperature)}\n'
+              f'{get_rain_hint(weather.status)}')
     return advice
+
+
+def get_forecast_hint(summary: ForecastSummary) -> str:
+    """Функция совета по сводке прогноза за весь период."""
+    advice = [get_temperature_hint(summary.min_temperature)]
+    if summary.max_temperature - summary.min_temperature >= 15:
+        advice.append('🌡 Температура сильно меняется, одевайтесь слоями.')
+    if summary.rainy_days:
+        advice.append(f'☔️ Дождливых дней: {summary.rainy_days}, '
+                      f'держите зонт под рукой.')
+    return '\n'.join(advice)
@@ -0,0 +1,357 @@
+import asyncio
+import itertools
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone, tzinfo
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+DAY_SECONDS = 86400
+# Значение колонки, означающее, что поле наблюдения не задано.
+MISSING_BYTE = 0xFF
+MISSING_SHORT = 0xFFFF
+# Заголовок блока: количество наблюдений и длина словаря описаний.
+BLOCK_HEADER = struct.Struct('<IH')
+
+
+class Observation(NamedTuple):
+    """Наблюдение погоды в истории города."""
+    # Время наблюдения, Unix time.
+    timestamp: int
+    # Температура в градусах Цельсия с точностью до 0.1.
+    temperature: float
+    status: str
+    humidity: Optional[int] = None
+    # Скорость ветра в м/с с точностью до 0.1.
+    wind_speed: Optional[float] = None
+    pressure: Optional[int] = None
+
+
+# Наблюдение, ожидающее записи: город, UTC-день и само наблюдение.
+PendingObservation = Tuple[int, int, Observation]
+
+
+class DayStatistics(NamedTuple):
+    """Температура за один день истории."""
+    day: date
+    min_temperature: float
+    max_temperature: float
+    mean_temperature: float
+
+
+class HistorySummary(NamedTuple):
+    """Изменение погоды в городе за период истории."""
+    current: Observation
+    # Наблюдение примерно суткой раньше текущего или None.
+    yesterday: Optional[Observation]
+    days: List[DayStatistics]
+    min_temperature: float
+    max_temperature: float
+    mean_temperature: float
+    # Наклон линейного тренда температуры, градусов в сутки.
+    trend_per_day: float
+
+
+def _column_bytes(column: array) -> bytes:
+    # Колонки хранятся в порядке байтов little-endian на любой машине.
+    if sys.byteorder != 'little':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(typecode: str, data: memoryview, offset: int,
+                 count: int) -> Tuple[array, int]:
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    column.frombytes(data[offset:end])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column, end
+
+
+def encode_block(observations: List[Observation]) -> bytes:
+    """Функция колоночной упаковки наблюдений одного дня города.
+
+    Наблюдения сортируются по времени, время хранится разностями
+    с предыдущим, температура и ветер - целыми десятыми долями,
+    описания погоды - номерами в словаре блока. Колонки однотипных
+    чисел подряд хорошо сжимаются zlib.
+    """
+    observations = sorted(observations)
+    statuses = list(dict.fromkeys(item.status for item in observations))
+    status_codes = {status: code for code, status in enumerate(statuses)}
+    previous = 0
+    deltas = array('q')
+    for item in observations:
+        deltas.append(item.timestamp - previous)
+        previous = item.timestamp
+    columns = (
+        deltas,
+        array('h', [round(item.temperature * 10) for item in observations]),
+        array('H', [status_codes[item.status] for item in observations]),
+        array('B', [MISSING_BYTE if item.humidity is None else item.humidity
+                    for item in observations]),
+        array('H', [MISSING_SHORT if item.wind_speed is None
+                    else round(item.wind_speed * 10)
+                    for item in observations]),
+        array('H', [MISSING_SHORT if item.pressure is None
+                    else item.pressure for item in observations]),
+    )
+    names = '\n'.join(statuses).encode()
+    return zlib.compress(
+        BLOCK_HEADER.pack(len(observations), len(names)) + names
+        + b''.join(_column_bytes(column) for column in columns)
+    )
+
+
+def decode_block(block: bytes) -> List[Observation]:
+    """Функция распаковки блока, упакованного encode_block."""
+    data = memoryview(zlib.decompress(block))
+    count, names_size = BLOCK_HEADER.unpack_from(data)
+    offset = BLOCK_HEADER.size + names_size
+    statuses = bytes(data[BLOCK_HEADER.size:offset]).decode().split('\n')
+    deltas, offset = _read_column('q', data, offset, count)
+    temperatures, offset = _read_column('h', data, offset, count)
+    status_codes, offset = _read_column('H', data, offset, count)
+    humidity, offset = _read_column('B', data, offset, count)
+    wind_speeds, offset = _read_column('H', data, offset, count)
+    pressures, offset = _read_column('H', data, offset, count)
+    return [
+        Observation(timestamp, temperature / 10, statuses[status_code],
+                    None if humidity_value == MISSING_BYTE
+                    else humidity_value,
+                    None if wind_speed == MISSING_SHORT else wind_speed / 10,
+                    None if pressure == MISSING_SHORT else pressure)
+        for timestamp, temperature, status_code, humidity_value, wind_speed,
+        pressure in zip(itertools.accumulate(deltas), temperatures,
+                        status_codes, humidity, wind_speeds, pressures)
+    ]
+
+
+class WeatherHistory:
+    """История наблюдений погоды по городам в файле SQLite.
+
+    Новые наблюдения дописываются строками в таблицу текущих суток,
+    а при смене UTC-суток строки прошедших дней переносятся в блоки
+    по городу и дню: колонки наблюдений, сжатые zlib (encode_block).
+    Обе таблицы без rowid упорядочены по городу, поэтому история города
+    за период читается двумя диапазонами ключа, не затрагивая другие
+    города, а за прошедшие дни - одним блоком на день.
+
+    Наблюдения накапливаются в памяти и раз в flush_interval секунд
+    или по достижении batch_size записываются одной транзакцией.
+    Все обращения к базе выполняются в отдельном потоке, соединение
+    открывается при первом обращении.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000,
+                 flush_interval: float = 5.0) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[PendingObservation] = []
+        # Время последнего записанного наблюдения города: одно и то же
+        # наблюдение приходит из кэша, фонового обновления и т.д.
+        self._last_timestamps: Dict[int, int] = {}
+        # Самый поздний день, до которого строки уже перенесены в блоки.
+        self._sealed_day: Optional[int] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Один поток гарантирует последовательный доступ к соединению.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection: Optional[sqlite3.Connection] = None
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS weather_recent ('
+                'city_id INTEGER NOT NULL, timestamp INTEGER NOT NULL, '
+                'temperature REAL NOT NULL, status TEXT NOT NULL, '
+                'humidity INTEGER, wind_speed REAL, pressure INTEGER, '
+                'PRIMARY KEY (city_id, timestamp)) WITHOUT ROWID'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS weather_history ('
+                'city_id INTEGER NOT NULL, day INTEGER NOT NULL, '
+                'data BLOB NOT NULL, PRIMARY KEY (city_id, day)) '
+                'WITHOUT ROWID'
+            )
+        return self._connection
+
+    def record(self, city_id: int, observation: Observation) -> None:
+        """Метод постановки наблюдения в очередь записи.
+
+        Не блокирует цикл событий; повтор последнего наблюдения города
+        пропускается.
+        """
+        if self._last_timestamps.get(city_id) == observation.timestamp:
+            return
+        self._last_timestamps[city_id] = observation.timestamp
+        self._pending.append((city_id, observation.timestamp // DAY_SECONDS,
+                              observation))
+        if len(self._pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Метод, записывающий накопленные наблюдения."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await self._run(self._write_batch, batch)
+
+    def _write_batch(self, batch: List[PendingObservation]) -> None:
+        connection = self._connect()
+        newest_day = max(day for _, day, _ in batch)
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT OR REPLACE INTO weather_recent (city_id, timestamp, '
+                'temperature, status, humidity, wind_speed, pressure) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(city_id, observation.timestamp,
+                  round(observation.temperature, 1), observation.status,
+                  observation.humidity, observation.wind_speed,
+                  observation.pressure)
+                 for city_id, _, observation in batch]
+            )
+            if self._sealed_day is None or newest_day > self._sealed_day:
+                self._seal(connection, newest_day * DAY_SECONDS)
+                self._sealed_day = newest_day
+
+    @staticmethod
+    def _seal(connection: sqlite3.Connection, before: int) -> None:
+        """Метод переноса строк раньше before в блоки по городу и дню.
+
+        Опоздавшие наблюдения уже закрытого дня объединяются с его блоком.
+        """
+        partitions: Dict[Tuple[int, int], Dict[int, Observation]] = {}
+        for city_id, *fields in connection.execute(
+                'SELECT city_id, timestamp, temperature, status, humidity, '
+                'wind_speed, pressure FROM weather_recent '
+                'WHERE timestamp < ?', (before,)):
+            observation = Observation(*fields)
+            partitions.setdefault(
+                (city_id, observation.timestamp // DAY_SECONDS), {}
+            )[observation.timestamp] = observation
+        if not partitions:
+            return
+        blocks = []
+        for (city_id, day), observations in partitions.items():
+            row = connection.execute(
+                'SELECT data FROM weather_history '
+                'WHERE city_id = ? AND day = ?', (city_id, day)
+            ).fetchone()
+            if row is not None:
+                for item in decode_block(row[0]):
+                    observations.setdefault(item.timestamp, item)
+            blocks.append((city_id, day,
+                           encode_block(list(observations.values()))))
+        connection.executemany(
+            'INSERT OR REPLACE INTO weather_history (city_id, day, data) '
+            'VALUES (?, ?, ?)', blocks
+        )
+        connection.execute('DELETE FROM weather_recent WHERE timestamp < ?',
+                           (before,))
+
+    async def get_observations(self, city_id: int, since: float,
+                               until: Optional[float] = None
+                               ) -> List[Observation]:
+        """Метод, возвращающий наблюдения города за период по времени.
+
+        Ещё не записанные наблюдения сначала записываются.
+        """
+        await self.flush()
+        if until is None:
+            until = time.time()
+        return await self._run(self._select, city_id, since, until)
+
+    def _select(self, city_id: int, since: float,
+                until: float) -> List[Observation]:
+        connection = self._connect()
+        observations = {}
+        for (data,) in connection.execute(
+                'SELECT data FROM weather_history '
+                'WHERE city_id = ? AND day BETWEEN ? AND ?',
+                (city_id, int(since // DAY_SECONDS),
+                 int(until // DAY_SECONDS))):
+            for item in decode_block(data):
+                if since <= item.timestamp <= until:
+                    observations[item.timestamp] = item
+        for fields in connection.execute(
+                'SELECT timestamp, temperature, status, humidity, '
+                'wind_speed, pressure FROM weather_recent '
+                'WHERE city_id = ? AND timestamp BETWEEN ? AND ?',
+                (city_id, since, until)):
+            observations[fields[0]] = Observation(*fields)
+        return [observations[timestamp] for timestamp in sorted(observations)]
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        if self._connection is not None:
+            await self._run(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+def summarize_history(observations: List[Observation],
+                      zone: tzinfo = timezone.utc) -> Optional[HistorySummary]:
+    """Функция сводки истории города: изменение за сутки, температура
+    по дням и линейный тренд за весь период.
+
+    Наблюдения должны быть упорядочены по времени; дни считаются
+    по часовому поясу zone.
+    """
+    if not observations:
+        return None
+    current = observations[-1]
+    yesterday = None
+    target = current.timestamp - DAY_SECONDS
+    # Ближайшее к «суткам назад» наблюдение, не дальше трёх часов.
+    candidates = [item for item in observations
+                  if abs(item.timestamp - target) <= 3 * 3600]
+    if candidates:
+        yesterday = min(candidates,
+                        key=lambda item: abs(item.timestamp - target))
+
+    by_day: Dict[date, List[float]] = {}
+    for item in observations:
+        day = datetime.fromtimestamp(item.timestamp, zone).date()
+        by_day.setdefault(day, []).append(item.temperature)
+    days = [DayStatistics(day, min(values), max(values),
+                          sum(values) / len(values))
+            for day, values in by_day.items()]
+
+    temperatures = [item.temperature for item in observations]
+    mean_temperature = sum(temperatures) / len(temperatures)
+    # Наклон по методу наименьших квадратов, время в сутках.
+    mean_time = sum(item.timestamp for item in observations) / len(
+        observations)
+    variance = sum((item.timestamp - mean_time) ** 2
+                   for item in observations)
+    trend = 0.0
+    if variance:
+        trend = sum((item.timestamp - mean_time)
+                    * (item.temperature - mean_temperature)
+                    for item in observations) / variance * DAY_SECONDS
+    return HistorySummary(current, yesterday, days, min(temperatures),
+                          max(temperatures), mean_temperature, trend)
@@ -1,15 +1,69 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Callable, Dict
+
+from weather.weather_hints import get_hint
+from weather.weather_service import WeatherInformation
 
 MESSAGES: Dict = {
     'weather_for_location_retrieval_failed':
         'Не удалось узнать погоду в этой локации 😞,',
     'weather_in_city_message':
         'Погода в городе {}:\n{}\nТемпература: {}°C.',
+    'city_not_found_suggestion':
+        'К сожалению, город {} не найден. Возможно, вы имели в виду {}? '
+        'Выйдите в меню и попробуйте снова.',
+    'saved_city_line':
+        '🏙️ {}: {}, {}°C',
+    'saved_city_failed_line':
+        '🏙️ {}: не удалось узнать погоду 😞',
+    'forecast_title':
+        'Прогноз погоды в городе {} на 5 дней:',
+    'forecast_day_line':
+        '📅 {}: {}…{}°C, {}, вероятность осадков {}%',
+    'trend_title':
+        '📈 Погода в городе {} за {} дн.:',
+    'trend_current_line':
+        'Сейчас: {}, {}°C.',
+    'trend_yesterday_line':
+        'Со вчерашнего дня: {:+.1f}°C ({}°C сутки назад).',
+    'trend_no_yesterday_line':
+        'Наблюдений суточной давности пока нет.',
+    'trend_day_line':
+        '📅 {}: {}…{}°C, в среднем {}°C',
+    'trend_summary_line':
+        'За период: от {}°C до {}°C, в среднем {}°C, '
+        'тренд {:+.1f}°C в сутки.',
+    'subscription_message':
+        '🌅 Доброе утро! Погода в городе {}:\n{}\nТемпература: {}°C.',
 }
 
 
-async def get_message(message_key: str) -> str:
+# Шаблоны, заранее связанные с методом format.
+TEMPLATES: Dict[str, Callable[..., str]] = {
+    message_key: message.format for message_key, message in MESSAGES.items()
+}
+
+
+def get_message(message_key: str) -> str:
     """Функция, формирующая ответное сообщение пользователю
     с данными о погоде.
     """
     return MESSAGES[message_key]
+
+
+def render_message(message_key: str, *args) -> str:
+    """Функция подстановки значений в шаблон сообщения."""
+    return TEMPLATES[message_key](*args)
+
+
+@lru_cache(maxsize=4096)
+def render_weather_reply(message_key: str, city: str,
+                         weather: WeatherInformation) -> str:
+    """Функция, формирующая ответ с погодой и советом.
+
+    Погода неизменяема и хэшируема, поэтому одинаковый ответ для многих
+    пользователей, спросивших об одном наблюдении, строится один раз.
+    """
+    return (render_message(message_key, city, weather.status,
+                           weather.temperature)
+            + '\n\n' + get_hint(weather))
@@ -0,0 +1,103 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from logger import logger
+from weather.resilience import TokenBucket
+from weather.weather_cache import WeatherCache
+
+Fetch = Callable[[], Awaitable[Any]]
+
+
+class PrefetchScheduler:
+    """Планировщик фонового обновления популярных запросов погоды.
+
+    Считает частоту запросов по ключам кэша и раз в interval секунд
+    заранее обновляет top_k самых популярных записей, срок жизни которых
+    истекает менее чем через refresh_ahead секунд. Количество запросов
+    к API ограничено rate_per_minute в минуту.
+    """
+
+    def __init__(self, cache: WeatherCache, top_k: int = 100,
+                 interval: float = 30.0, refresh_ahead: float = 60.0,
+                 rate_per_minute: float = 30.0,
+                 decay: float = 0.5) -> None:
+        self.cache = cache
+        self.top_k = top_k
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.rate_per_minute = rate_per_minute
+        self.decay = decay
+        self.refreshed = 0
+        self._counts: Dict[str, float] = {}
+        self._fetchers: Dict[str, Fetch] = {}
+        self._budget = TokenBucket(rate=rate_per_minute / 60,
+                                   capacity=rate_per_minute)
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, key: str, fetch: Fetch) -> None:
+        """Метод учёта запроса погоды по ключу кэша.
+
+        Параметры:
+            key (str): Ключ кэша.
+
+            fetch (Callable): Функция без аргументов, возвращающая корутину
+            загрузки значения из API.
+        """
+        self._counts[key] = self._counts.get(key, 0.0) + 1.0
+        self._fetchers[key] = fetch
+
+    def start(self) -> None:
+        """Метод запуска фонового обновления."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Метод остановки фонового обновления."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _decay_counts(self) -> None:
+        """Метод затухания счётчиков, чтобы учитывались недавние запросы.
+
+        Заодно удаляет ключи, которые давно не запрашивались, поэтому
+        память не растёт с числом разных запросов.
+        """
+        for key in list(self._counts):
+            count = self._counts[key] * self.decay
+            if count < 0.1:
+                del self._counts[key]
+                del self._fetchers[key]
+            else:
+                self._counts[key] = count
+
+    def refresh_hot_keys(self) -> int:
+        """Метод запуска обновления популярных записей, которые скоро
+        истекут. Возвращает количество запущенных обновлений.
+        """
+        hot_keys = sorted(self._counts, key=self._counts.get,
+                          reverse=True)[:self.top_k]
+        started = 0
+        for key in hot_keys:
+            remaining_ttl = self.cache.remaining_ttl(key)
+            if remaining_ttl is not None and remaining_ttl > self.refresh_ahead:
+                continue
+            if not self._budget.try_acquire():
+                break
+            self.cache.refresh(key, self._fetchers[key])
+            started += 1
+        self.refreshed += started
+        return started
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                started = self.refresh_hot_keys()
+                if started:
+                    logger.debug('Запущено фоновое обновление погоды '
+                                 'для %s популярных запросов', started)
+                self._decay_counts()
+            except Exception as error:
+                logger.error('Ошибка фонового обновления погоды: %s', error)
@@ -1,40 +1,217 @@
+import asyncio
+import json
 import os
+import random
+import sys
+import time
 import urllib
-from typing import Dict
+from functools import partial
+from typing import Dict, Iterable, List, NamedTuple, Optional
 
 import aiohttp
 from aiohttp.client_exceptions import ClientConnectorError
 from aiogram.types import Location
-from dotenv import load_dotenv
 
 from logger import logger
+from metrics import WEATHER_API_LATENCY, registry
+from settings import settings
 from weather.exceptions import (GetWeatherFromJSONError, WeatherCustomError,
-                                WeatherAPIError)
+                                WeatherAPIError,
+                                WeatherServiceUnavailableError)
+from weather.cache_backends import (CacheBackend, MemoryCacheBackend,
+                                    RedisCacheBackend, SQLiteCacheBackend)
+from weather.city_index import (CityIndex, is_plausible_city_name,
+                                normalize_city_name)
+from weather.forecast import Forecast, parse_forecast
+from weather.geo_index import GeoIndex
+from weather.weather_cache import WeatherCache
+from weather.weather_history import Observation, WeatherHistory
+from weather.resilience import (CircuitBreaker, ConcurrencyLimiter,
+                                TokenBucket)
+from weather.weather_prefetch import PrefetchScheduler
 
-load_dotenv()
+try:
+    # Необязательный быстрый парсер JSON; без него используется json.
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
-WEATHER_API_KEY: str = os.getenv('WEATHER_API_KEY')
+# Статусы ответа API, при которых запрос стоит повторить.
+TRANSIENT_STATUSES = frozenset((429, 500, 502, 503, 504))
 WEATHER_FOR_LOC_FAILED_MESSAGE: str = (f'К сожалению такого города не найдено!'
                                        f' Выйдите в меню и попробуйте снова.')
-ZERO_KELVIN: float = 273.15
+WEATHER_UNAVAILABLE_MESSAGE: str = ('Сервис погоды сейчас недоступен 😞 '
+                                    'Попробуйте немного позже.')
 
 
-class WeatherInformation:
-    """Класс для хранения данных о погоде."""
+class WeatherInformation(NamedTuple):
+    """Неизменяемые данные о погоде.
 
-    def __init__(self, name: str, temperature: float, status: str) -> None:
-        self.name = name
-        self.temperature = temperature
-        self.status = status
+    Записи хранятся в кэше тысячами, поэтому это кортеж без __dict__.
+    """
+    name: str
+    # Температура в градусах Цельсия.
+    temperature: float
+    status: str
+    city_id: Optional[int] = None
+    # Влажность в процентах.
+    humidity: Optional[int] = None
+    # Скорость ветра в м/с.
+    wind_speed: Optional[float] = None
+    # Давление в гПа.
+    pressure: Optional[int] = None
+    # Время наблюдения, Unix time.
+    timestamp: Optional[int] = None
 
     def __str__(self) -> str:
         return self.name
 
 
+def serialize_weather(weather: WeatherInformation) -> bytes:
+    """Функция компактной сериализации WeatherInformation для хранилища."""
+    return json.dumps(
+        list(weather), ensure_ascii=False, separators=(',', ':')
+    ).encode()
+
+
+def deserialize_weather(data: bytes) -> WeatherInformation:
+    """Функция восстановления WeatherInformation из хранилища.
+
+    Записи старого формата без дополнительных полей тоже читаются.
+    """
+    fields = json_loads(data)
+    fields[2] = sys.intern(fields[2])
+    return WeatherInformation(*fields)
+
+
+def create_cache_backend() -> Optional[CacheBackend]:
+    """Функция создания постоянного хранилища кэша по настройкам."""
+    if settings.weather_cache_backend == 'memory':
+        return MemoryCacheBackend(max_size=settings.weather_cache_size)
+    if settings.weather_cache_backend == 'sqlite':
+        return SQLiteCacheBackend(settings.weather_cache_sqlite_path)
+    if settings.weather_cache_backend == 'redis':
+        return RedisCacheBackend(settings.weather_cache_redis_url,
+                                 timeout=settings.weather_cache_redis_timeout)
+    return None
+
+
+weather_cache = WeatherCache(ttl=settings.weather_cache_ttl,
+                             max_size=settings.weather_cache_size,
+                             backend=create_cache_backend(),
+                             serializer=serialize_weather,
+                             deserializer=deserialize_weather,
+                             stale_ttl=settings.weather_cache_stale_ttl,
+                             stale_timeout=settings.weather_stale_timeout)
+forecast_cache = WeatherCache(ttl=settings.forecast_cache_ttl,
+                              max_size=settings.forecast_cache_size,
+                              stale_ttl=settings.weather_cache_stale_ttl,
+                              stale_timeout=settings.weather_stale_timeout)
+rate_limiter = TokenBucket(rate=settings.weather_rate_per_second,
+                           capacity=settings.weather_rate_burst)
+concurrency_limiter = ConcurrencyLimiter(settings.weather_concurrency)
+circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.circuit_failure_threshold,
+    recovery_timeout=settings.circuit_recovery_timeout
+)
+prefetch_scheduler = PrefetchScheduler(weather_cache,
+                                       top_k=settings.prefetch_top_k,
+                                       interval=settings.prefetch_interval,
+                                       refresh_ahead=settings.prefetch_ahead,
+                                       rate_per_minute=(
+                                           settings.prefetch_rate_per_minute
+                                       ))
+
+weather_history = (WeatherHistory(settings.weather_history_path)
+                   if settings.weather_history_path else None)
+
+city_index = CityIndex(settings.city_index_path)
+geo_index = GeoIndex(radius_km=settings.geo_snap_radius_km,
+                     max_age=settings.weather_cache_ttl)
+
+# Идентификаторы городов API погоды по ключу кэша города.
+_city_ids: Optional[Dict[str, int]] = None
+
+# Общая сессия с пулом соединений, живущая всё время работы бота.
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Функция, возвращающая общую сессию для запросов к API погоды.
+
+    Сессия создаётся при первом обращении и переиспользует
+    TCP/TLS соединения между запросами.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.weather_pool_limit,
+            limit_per_host=settings.weather_pool_limit_per_host,
+            ttl_dns_cache=settings.weather_dns_cache_ttl,
+            keepalive_timeout=settings.weather_keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=settings.weather_request_timeout,
+            connect=settings.weather_connect_timeout
+        )
+        _session = aiohttp.ClientSession(connector=connector,
+                                         timeout=timeout)
+    return _session
+
+
+async def warm_cache() -> None:
+    """Функция прогрева кэша погоды из постоянного хранилища."""
+    if not settings.weather_cache_warm:
+        return
+    try:
+        loaded = await weather_cache.warm()
+        logger.debug('Кэш погоды прогрет, загружено записей: %s', loaded)
+    except Exception as error:
+        logger.error('Не удалось прогреть кэш погоды: %s', error)
+
+
+def start_prefetch() -> None:
+    """Функция запуска фонового обновления популярных запросов."""
+    prefetch_scheduler.start()
+
+
+async def stop_prefetch() -> None:
+    """Функция остановки фонового обновления популярных запросов."""
+    await prefetch_scheduler.stop()
+
+
+async def close_session() -> None:
+    """Функция закрытия общей сессии API погоды и хранилища кэша
+    при остановке бота.
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    await weather_cache.close()
+    if weather_history is not None:
+        await weather_history.close()
+
+
 async def get_weather_for_city(city_name) -> WeatherInformation:
-    """Функция для получения готового ответа от API погоды по городу."""
+    """Функция для получения готового ответа от API погоды по городу.
+
+    Заведомо неверные названия отклоняются без запроса к API,
+    в этом случае возвращается None.
+    """
+    if not is_known_or_plausible_city(city_name):
+        logger.debug('Название города отклонено без запроса к API: %r',
+                     city_name)
+        return None
+
+    cache_key = get_city_cache_key(city_name)
+    fetch = partial(make_weather_service_query, get_city_url(city_name))
+    prefetch_scheduler.record(cache_key, fetch)
     try:
-        response = await make_weather_service_query(get_city_url(city_name))
+        response = await weather_cache.get_or_fetch(cache_key, fetch)
+        city = city_index.resolve(city_name)
+        if response is not None and city is not None:
+            geo_index.add(city.latitude, city.longitude, cache_key)
         return response
 
     except KeyError as json_error:
@@ -56,10 +233,59 @@ async def get_weather_for_city(city_name) -> WeatherInformation:
         raise WeatherCustomError(msg_error)
 
 
+async def get_forecast_for_city(city_name) -> Optional[Forecast]:
+    """Функция получения прогноза погоды на 5 дней по городу.
+
+    Заведомо неверные названия отклоняются без запроса к API,
+    в этом случае возвращается None.
+    """
+    if not is_known_or_plausible_city(city_name):
+        return None
+
+    cache_key = 'forecast:' + get_city_cache_key(city_name)
+    fetch = partial(make_forecast_query, get_forecast_url(city_name))
+    try:
+        return await forecast_cache.get_or_fetch(cache_key, fetch)
+
+    except KeyError as json_error:
+        msg_error = (f'Ошибка ключей при распаковке JSON прогноза '
+                     f'для города: {json_error}')
+        logger.error(msg_error)
+        raise GetWeatherFromJSONError(msg_error)
+
+    except ClientConnectorError as connection_error:
+        msg_error = (f'Ошибка подключения к API погоды при запросе '
+                     f'прогноза по городу: {connection_error}')
+        logger.error(msg_error)
+        raise WeatherAPIError(msg_error)
+
+    except Exception as error:
+        msg_error = (f'Непредвиденная ошибка при запросе '
+                     f'прогноза по городу: {error}')
+        logger.error(msg_error)
+        raise WeatherCustomError(msg_error)
+
+
 async def get_weather_for_location(location) -> WeatherInformation:
-    """Функция для получения готового ответа от API погоды по геолокации."""
+    """Функция для получения готового ответа от API погоды по геолокации.
+
+    Если в радиусе GEO_SNAP_RADIUS_KM есть свежее наблюдение, то
+    возвращается оно без запроса к API.
+    """
+    nearest_key = geo_index.nearest(location.latitude, location.longitude)
+    if nearest_key is not None:
+        response = weather_cache.get(nearest_key)
+        if response is not None:
+            geo_index.snapped += 1
+            return response
+
+    cache_key = get_location_cache_key(location)
+    fetch = partial(make_weather_service_query, get_location_url(location))
+    prefetch_scheduler.record(cache_key, fetch)
     try:
-        response = await make_weather_service_query(get_location_url(location))
+        response = await weather_cache.get_or_fetch(cache_key, fetch)
+        if response is not None:
+            geo_index.add(location.latitude, location.longitude, cache_key)
         return response
 
     except KeyError as json_error:
@@ -81,55 +307,422 @@ async def get_weather_for_location(location) -> WeatherInformation:
         raise WeatherCustomError(msg_error)
 
 
+async def get_weather_for_cities(
+        city_names: Iterable[str]) -> Dict[str, Optional[WeatherInformation]]:
+    """Функция получения погоды сразу для нескольких городов.
+
+    Города, для которых известен идентификатор, запрашиваются групповыми
+    запросами по WEATHER_GROUP_SIZE штук, остальные - по одному, после
+    чего их идентификаторы сохраняются для следующих запросов.
+    Возвращает словарь с погодой по каждому переданному названию или
+    None, если погоду узнать не удалось.
+    """
+    city_ids = load_city_ids()
+    results: Dict[str, Optional[WeatherInformation]] = {}
+    names_by_id: Dict[int, List[str]] = {}
+    unknown_names: List[str] = []
+
+    for city_name in city_names:
+        if not is_known_or_plausible_city(city_name):
+            continue
+        weather = weather_cache.get(get_city_cache_key(city_name))
+        city_id = get_city_id(city_name)
+        if weather is not None:
+            results[city_name] = weather
+        elif city_id is not None:
+            names_by_id.setdefault(city_id, []).append(city_name)
+        else:
+            unknown_names.append(city_name)
+
+    semaphore = asyncio.Semaphore(settings.weather_group_concurrency)
+
+    async def fetch_group(group_ids: List[int]) -> None:
+        async with semaphore:
+            try:
+                json_data = await fetch_json(get_group_url(group_ids))
+                group = [get_weather_from_response(item)
+                         for item in (json_data or {}).get('list', [])]
+            except (Exception, GetWeatherFromJSONError, WeatherAPIError,
+                    WeatherCustomError) as error:
+                # Ошибка одной группы не должна ронять весь запрос.
+                logger.error('Ошибка группового запроса погоды '
+                             'для городов %s: %s', group_ids, error)
+                group = []
+        for weather in group:
+            record_observation(weather)
+            for city_name in names_by_id.get(weather.city_id, []):
+                results[city_name] = weather
+                weather_cache.set(get_city_cache_key(city_name), weather)
+
+    async def fetch_single(city_name: str) -> None:
+        async with semaphore:
+            try:
+                weather = await get_weather_for_city(city_name)
+            except (GetWeatherFromJSONError, WeatherAPIError,
+                    WeatherCustomError):
+                weather = None
+        results[city_name] = weather
+        if weather is not None and weather.city_id is not None:
+            city_ids[get_city_cache_key(city_name)] = weather.city_id
+
+    group_ids = list(names_by_id)
+    await asyncio.gather(
+        *(fetch_group(group_ids[index:index + settings.weather_group_size])
+          for index in range(0, len(group_ids), settings.weather_group_size)),
+        *(fetch_single(city_name) for city_name in unknown_names)
+    )
+    if unknown_names:
+        await save_city_ids()
+
+    return {city_name: results.get(city_name) for city_name in city_names}
+
+
+def load_city_ids() -> Dict[str, int]:
+    """Функция загрузки сохранённых идентификаторов городов."""
+    global _city_ids
+    if _city_ids is None:
+        try:
+            with open(settings.city_ids_path,
+                      encoding='UTF-8') as city_ids_file:
+                _city_ids = json.load(city_ids_file)
+        except (OSError, ValueError):
+            _city_ids = {}
+    return _city_ids
+
+
+async def save_city_ids() -> None:
+    """Функция сохранения идентификаторов городов в файл."""
+    data = json.dumps(load_city_ids(), ensure_ascii=False)
+
+    def write() -> None:
+        temporary_path = settings.city_ids_path + '.tmp'
+        with open(temporary_path, 'w', encoding='UTF-8') as city_ids_file:
+            city_ids_file.write(data)
+        os.replace(temporary_path, settings.city_ids_path)
+
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, write)
+    except OSError as error:
+        logger.error('Не удалось сохранить идентификаторы городов: %s',
+                     error)
+
+
+def is_known_or_plausible_city(city_name: str) -> bool:
+    """Функция проверки названия города перед запросом к API."""
+    if not is_plausible_city_name(city_name):
+        return False
+    return (not settings.city_index_strict
+            or city_index.resolve(city_name) is not None)
+
+
+def get_city_display_name(city_name: str) -> str:
+    """Функция, возвращающая название города для ответа пользователю.
+
+    Для городов из справочника возвращается их основное название.
+    """
+    city = city_index.resolve(city_name)
+    if city is not None:
+        return city.name
+    return ' '.join(city_name.split()).capitalize()
+
+
+def get_city_suggestions(query: str, limit: int = 5) -> List[str]:
+    """Функция подбора названий городов по началу названия.
+
+    Сначала ищутся города справочника, иначе возвращается сам запрос,
+    если он похож на название города.
+    """
+    if not query.strip():
+        return []
+    cities = city_index.find_by_prefix(query, limit)
+    if cities:
+        return [city.name for city in cities]
+    if is_known_or_plausible_city(query):
+        return [get_city_display_name(query)]
+    return []
+
+
+def get_city_suggestion(city_name: str) -> Optional[str]:
+    """Функция подбора похожего города справочника с учётом опечаток.
+
+    Вызывается только после того, как API не нашёл город, и предлагается
+    пользователю как подсказка, а не подставляется вместо его запроса.
+    """
+    city = city_index.find_similar(city_name)
+    if city is None or city.name == city_name:
+        return None
+    return city.name
+
+
+def get_city_id(city_name: str) -> Optional[int]:
+    """Функция, возвращающая идентификатор города API погоды."""
+    city = city_index.resolve(city_name)
+    if city is not None:
+        return city.city_id
+    return load_city_ids().get(get_city_cache_key(city_name))
+
+
+def get_city_cache_key(city_name: str) -> str:
+    """Функция, возвращающая ключ кэша по городу.
+
+    Для городов из справочника ключом служит идентификатор, поэтому
+    разные написания одного города попадают в одну запись кэша.
+    """
+    city = city_index.resolve(city_name)
+    if city is not None:
+        return f'id:{city.city_id}'
+    return 'city:' + normalize_city_name(city_name)
+
+
+def get_location_cache_key(location: Location) -> str:
+    """Функция, возвращающая ключ кэша по ячейке сетки координат."""
+    latitude = round(location.latitude, settings.location_cache_precision)
+    longitude = round(location.longitude, settings.location_cache_precision)
+    return f'loc:{latitude}:{longitude}'
+
+
 def get_city_url(city_name: str) -> str:
     """Функция для возврата готового URL с городом для запроса к API."""
+    city = city_index.resolve(city_name)
+    if city is not None:
+        return (
+            f'{settings.weather_api_url}/data'
+            f'/2.5/weather?id={city.city_id}'
+            f'&appid={settings.weather_api_key}&lang=ru&units=metric'
+        )
     # Кодируем название города для корректного построения url запроса.
     city_name_for_url = urllib.parse.quote(city_name)
     return (
-        f'https://api.openweathermap.org/data'
+        f'{settings.weather_api_url}/data'
         f'/2.5/weather?q={city_name_for_url}'
-        f'&appid={WEATHER_API_KEY}&lang=ru'
+        f'&appid={settings.weather_api_key}&lang=ru&units=metric'
+    )
+
+
+def get_forecast_url(city_name: str) -> str:
+    """Функция для возврата готового URL прогноза на 5 дней по городу."""
+    city = city_index.resolve(city_name)
+    if city is not None:
+        query = f'id={city.city_id}'
+    else:
+        query = f'q={urllib.parse.quote(city_name)}'
+    return (
+        f'{settings.weather_api_url}/data'
+        f'/2.5/forecast?{query}'
+        f'&appid={settings.weather_api_key}&lang=ru&units=metric'
     )
 
 
 def get_location_url(location: Location) -> str:
     """Функция для возврата готового URL с геолокацией для запроса к API."""
     return (
-        f'https://api.openweathermap.org/data'
+        f'{settings.weather_api_url}/data'
         f'/2.5/weather?lat={location.latitude}'
-        f'&lon={location.longitude}&appid={WEATHER_API_KEY}&lang=ru'
+        f'&lon={location.longitude}&appid={settings.weather_api_key}'
+        f'&lang=ru&units=metric'
     )
 
 
-async def get_weather_from_response(json: Dict) -> WeatherInformation:
-    """Функция распаковки ответа JSON в объект класса WeatherInformation"""
-    response = WeatherInformation(json['name'], json['main']['temp'],
-                                  json['weather'][0]['description'])
+def get_group_url(city_ids: List[int]) -> str:
+    """Функция для возврата готового URL группового запроса к API."""
+    return (
+        f'{settings.weather_api_url}/data'
+        f'/2.5/group?id={",".join(map(str, city_ids))}'
+        f'&appid={settings.weather_api_key}&lang=ru&units=metric'
+    )
+
+
+def get_weather_from_response(json: Dict) -> WeatherInformation:
+    """Функция распаковки ответа JSON в объект класса WeatherInformation.
+
+    Ответ запрашивается с units=metric, температура уже в градусах Цельсия.
+    """
+    main = json['main']
+    # Описаний погоды немного, а записей в кэше тысячи: одна строка
+    # на все записи с одинаковым описанием.
+    return WeatherInformation(json['name'], round(main['temp'], 1),
+                              sys.intern(json['weather'][0]['description']),
+                              json.get('id'), main.get('humidity'),
+                              json.get('wind', {}).get('speed'),
+                              main.get('pressure'), json.get('dt'))
+
+
+def get_upstream_stats() -> Dict[str, object]:
+    """Функция, возвращающая состояние защиты запросов к API погоды."""
+    return {
+        'circuit_state': circuit_breaker.state,
+        'circuit_transitions': dict(circuit_breaker.transitions),
+        'circuit_shed': circuit_breaker.shed,
+        'rate_limit_shed': rate_limiter.shed,
+        'concurrency_shed': concurrency_limiter.shed,
+    }
+
 
-    await convert_temperature(response)
-    return response
+def collect_weather_metrics():
+    """Функция выгрузки счётчиков кэша и защиты API погоды в метрики."""
+    cache_stats = weather_cache.stats()
+    yield ('bot_weather_cache_size', 'gauge',
+           'Количество записей в кэше погоды',
+           [('bot_weather_cache_size', {}, cache_stats.pop('size'))])
+    yield ('bot_weather_cache_requests_total', 'counter',
+           'Обращения к кэшу погоды по результату',
+           [('bot_weather_cache_requests_total', {'result': result}, value)
+            for result, value in cache_stats.items()])
+    yield ('bot_weather_geo_snapped_total', 'counter',
+           'Запросы по координатам, привязанные к соседней записи кэша',
+           [('bot_weather_geo_snapped_total', {}, geo_index.snapped)])
+    yield ('bot_weather_shed_total', 'counter',
+           'Запросы к API погоды, отклонённые защитой',
+           [('bot_weather_shed_total', {'reason': 'circuit'},
+             circuit_breaker.shed),
+            ('bot_weather_shed_total', {'reason': 'rate_limit'},
+             rate_limiter.shed),
+            ('bot_weather_shed_total', {'reason': 'concurrency'},
+             concurrency_limiter.shed)])
+    yield ('bot_weather_circuit_state', 'gauge',
+           'Текущее состояние выключателя API погоды',
+           [('bot_weather_circuit_state', {'state': state},
+             int(circuit_breaker.state == state))
+            for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN,
+                          CircuitBreaker.HALF_OPEN)])
+
+
+registry.register_collector(collect_weather_metrics)
+
+
+def get_retry_delay(attempt: int) -> float:
+    """Функция экспоненциальной задержки повтора со случайным разбросом."""
+    return random.uniform(0, min(
+        settings.weather_retry_max_delay,
+        settings.weather_retry_base_delay * 2 ** attempt
+    ))
+
+
+async def fetch_json(url: str) -> Optional[Dict]:
+    """Функция асинхронного запроса к API погоды, возвращающая JSON.
+
+    Одновременно выполняется не больше WEATHER_CONCURRENCY запросов,
+    остальные ждут места не дольше WEATHER_RATE_MAX_WAIT секунд.
+    Запросы проходят через ограничитель частоты и выключатель. Временные
+    ошибки (тайм-ауты, обрывы связи, статусы 429 и 5xx, испорченный
+    JSON) повторяются с растущей задержкой. Если API недоступен, выбрасывается
+    WeatherAPIError. Для прочих статусов (например, 404) возвращается None.
+    """
+    if not await concurrency_limiter.acquire(settings.weather_rate_max_wait):
+        raise WeatherServiceUnavailableError(
+            'Слишком много одновременных запросов к API погоды'
+        )
+    try:
+        return await _fetch_json(url)
+    finally:
+        concurrency_limiter.release()
+
+
+async def _fetch_json(url: str) -> Optional[Dict]:
+    session = await get_session()
+    timeout = aiohttp.ClientTimeout(total=settings.weather_attempt_timeout)
+    last_error = None
+    for attempt in range(settings.weather_retries + 1):
+        if attempt:
+            await asyncio.sleep(get_retry_delay(attempt))
+        if not circuit_breaker.allow():
+            raise WeatherServiceUnavailableError(
+                'API погоды недоступен, выключатель разомкнут'
+            )
+        # Каждый разрешённый выключателем запрос заканчивается учётом
+        # исхода или release, иначе пробный запрос в half_open
+        # не освободится и выключатель будет отклонять все запросы.
+        recorded = False
+        try:
+            if not await rate_limiter.acquire(settings.weather_rate_max_wait):
+                raise WeatherServiceUnavailableError(
+                    'Превышена квота запросов к API погоды'
+                )
+
+            started = time.perf_counter()
+            result = 'error'
+            try:
+                async with session.get(url, timeout=timeout) as response:
+                    if response.status not in TRANSIENT_STATUSES:
+                        json_data = (json_loads(await response.read())
+                                     if response.status == 200 else None)
+                        result = ('ok' if response.status == 200
+                                  else 'not_found')
+                        circuit_breaker.record_success()
+                        recorded = True
+                        return json_data
+                    result = 'transient'
+                    last_error = f'статус ответа {response.status}'
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ValueError) as error:
+                last_error = repr(error)
+            finally:
+                WEATHER_API_LATENCY.observe(time.perf_counter() - started,
+                                            result)
+
+            circuit_breaker.record_failure()
+            recorded = True
+        finally:
+            if not recorded:
+                circuit_breaker.release()
+
+        logger.warning('Попытка %s запроса к API погоды не удалась: %s',
+                       attempt + 1, last_error)
+
+    raise WeatherAPIError(f'API погоды не ответил после '
+                          f'{settings.weather_retries + 1} попыток: '
+                          f'{last_error}')
 
 
 async def make_weather_service_query(url: str) -> WeatherInformation:
     """Функция асинхронного запроса к API погоды."""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                json_data = await response.json()
-                return await get_weather_from_response(json_data)
+    json_data = await fetch_json(url)
+    if json_data is not None:
+        weather = get_weather_from_response(json_data)
+        record_observation(weather)
+        return weather
+
 
+def record_observation(weather: WeatherInformation) -> None:
+    """Функция сохранения полученной от API погоды в историю города."""
+    if weather_history is None or weather.city_id is None:
+        return
+    weather_history.record(weather.city_id, Observation(
+        weather.timestamp or int(time.time()), weather.temperature,
+        weather.status, weather.humidity, weather.wind_speed,
+        weather.pressure
+    ))
 
-async def convert_temperature(weather_obj: WeatherInformation) -> None:
-    """Функция асинхронного вызова конвертирования
-    температуры в градусы Цельсия.
+
+async def get_history_for_city(
+        city_name: str) -> Optional[List[Observation]]:
+    """Функция получения истории наблюдений погоды в городе
+    за WEATHER_HISTORY_DAYS дней, включая текущую погоду.
+
+    Возвращает None, если город не найден. Ошибка чтения хранилища
+    истории (например, повреждённый блок) поднимается как
+    WeatherCustomError.
     """
-    weather_obj.temperature = await convert_kelvin_to_celsius(
-        weather_obj.temperature
-    )
+    weather = await get_weather_for_city(city_name)
+    if weather is None:
+        return None
+    if weather_history is None or weather.city_id is None:
+        return []
+    try:
+        return await weather_history.get_observations(
+            weather.city_id,
+            time.time() - settings.weather_history_days * 86400
+        )
+
+    except Exception as error:
+        msg_error = (f'Ошибка чтения истории погоды для города '
+                     f'{weather.city_id}: {error}')
+        logger.error(msg_error)
+        raise WeatherCustomError(msg_error)
 
 
-async def convert_kelvin_to_celsius(kelvin: float) -> float:
-    """Функция, конвертирующая температуру из ответа API в градусы Цельсия."""
-    celsius_long_float = kelvin - ZERO_KELVIN
-    celsius = round(celsius_long_float, 1)
-    return celsius
+async def make_forecast_query(url: str) -> Optional[Forecast]:
+    """Функция асинхронного запроса прогноза к API погоды."""
+    json_data = await fetch_json(url)
+    if json_data is not None:
+        return parse_forecast(json_data)